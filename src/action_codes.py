@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from typing import Dict, Mapping
+
+import numpy as np
+from numpy.typing import NDArray
+
+import utilities
+
+# An action is the set of driving controls held during a step, packed in the bits of a small integer.
+# Input handlers translate keys to actions at the edge; the car, the replays and the policies only see actions.
+NONE = 0
+THROTTLE = 1  # W
+BRAKE = 2  # S
+LEFT = 4  # A
+RIGHT = 8  # D
+ACTION_COUNT = 16  # Every combination of the four bits
+
+# Key driving each control bit, in the order of the CONTROLS columns
+CONTROL_KEYS = (utilities.KEY_W, utilities.KEY_S, utilities.KEY_A, utilities.KEY_D)
+BITS = (THROTTLE, BRAKE, LEFT, RIGHT)
+
+# (ACTION_COUNT, 4) table of throttle, brake, left, right held by every action, for the vectorized simulation
+CONTROLS: NDArray[np.bool_] = np.array([[bool(code & bit) for bit in BITS] for code in range(ACTION_COUNT)])
+
+
+def from_keys(keys: Mapping[int, bool]) -> int:
+    """
+    Translate pressed keys to an action.
+
+    :param keys: any mapping from pyglet key codes to pressed state, such as a KeyStateHandler
+    :return: action code
+    """
+    return (
+        (THROTTLE if keys[utilities.KEY_W] else 0)
+        | (BRAKE if keys[utilities.KEY_S] else 0)
+        | (LEFT if keys[utilities.KEY_A] else 0)
+        | (RIGHT if keys[utilities.KEY_D] else 0)
+    )
+
+
+def from_saved_keys(keys: Mapping[str, bool]) -> int:
+    """
+    Translate the "keys" dictionary of replays saved before actions existed (key codes as JSON strings).
+
+    :param keys: saved key dictionary
+    :return: action code
+    """
+    return from_keys({key: bool(keys.get(str(key), False)) for key in CONTROL_KEYS})
+
+
+def to_keys(action: int) -> Dict[int, bool]:
+    """
+    :param action: action code
+    :return: pressed state of W, S, A and D
+    """
+    return {key: bool(action & bit) for key, bit in zip(CONTROL_KEYS, BITS, strict=True)}
+
+
+def encode(controls: NDArray[np.bool_]) -> NDArray[np.uint8]:
+    """
+    :param controls: (..., 4) throttle, brake, left, right held
+    :return: (...) action codes
+    """
+    return np.asarray(np.asarray(controls, dtype=np.uint8) @ np.array(BITS, dtype=np.uint8), dtype=np.uint8)
+
+
+def decode(actions: NDArray[np.integer] | int) -> NDArray[np.bool_]:
+    """
+    :param actions: action codes
+    :return: (..., 4) throttle, brake, left, right held
+    """
+    return np.asarray(CONTROLS[actions])
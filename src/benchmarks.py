@@ -0,0 +1,385 @@
+from __future__ import annotations
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Mapping, Sequence, Tuple
+
+import numpy as np
+
+import action_codes
+import car_stats
+import centerline
+import graphics_constants
+import paths
+import spline
+import utilities
+from make_replay import Replay
+
+if TYPE_CHECKING:
+    from car_class import Car
+
+REPEAT = 5  # Timed runs of every benchmark, the best one is reported
+MIN_RUN_TIME = 0.2  # A timed run calls the benchmark as many times as needed to last at least this long
+REPLAY_FRAME_COUNTS = (1_000, 10_000, 50_000)
+SPLINE_POINT_COUNTS = (10, 100, 1_000)
+BATCH_CARS = 256
+CONTACT_CAR_COUNTS = (100, 1_000, 10_000)
+CONTACT_SPACING = 200.0  # Cars are scattered over a square of side CONTACT_SPACING * sqrt(cars): constant density
+REGRESSION_THRESHOLD = 0.10  # compare() flags benchmarks slower than the baseline by more than this fraction
+LAP_LOOKAHEAD = 200.0  # Distance along the centerline the lap driver steers towards
+LAP_MAX_SPEED = 500.0  # The lap driver lifts off above this speed
+LAP_MAX_STEPS = 10_000
+
+Setup = Callable[[], Callable[[], object]]  # prepares a benchmark and returns the function to time
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    Timing of one benchmark. Times are per call, in seconds.
+    """
+
+    name: str
+    best: float
+    mean: float
+    stdev: float
+    calls: int  # calls per timed run
+    runs: int
+    per_second: float  # calls per second at the best time, laps per second for the lap benchmark
+
+
+def _car_module() -> Any:
+    """
+    car_class imports pyglet.window, which needs a display unless pyglet runs headless.
+    """
+    import pyglet
+
+    pyglet.options["headless"] = True
+    import car_class
+
+    return car_class
+
+
+def _track_car(track_path: str) -> Car:
+    x, y, heading = utilities.read_position(track_path)
+    return _car_module().Car(  # type: ignore[no-any-return]
+        x,
+        y,
+        heading,
+        utilities.load_track_segments(track_path),
+        utilities.load_gates_segments(track_path),
+        True,
+        Replay(track_path),
+    )
+
+
+_lap_actions_cache: Dict[str, List[int]] = {}
+
+
+def lap_actions(track_path: str) -> List[int]:
+    """
+    Actions of a full lap driven by following the centerline: steer towards the point LAP_LOOKAHEAD ahead and
+    accelerate up to LAP_MAX_SPEED. Replaying them with car_stats.physics_dt drives the same lap again.
+
+    :param track_path: Path to the track folder
+    :return: action code of every physics step
+    """
+    if track_path in _lap_actions_cache:
+        return _lap_actions_cache[track_path]
+    car = _track_car(track_path)
+    index = centerline.track_index(track_path)
+    actions: List[int] = []
+    while car.alive and not car.completed and len(actions) < LAP_MAX_STEPS:
+        progress, _ = index.project(np.array([car.x, car.y]))
+        target_x, target_y = centerline.sample_ring(index.starts, progress + LAP_LOOKAHEAD)
+        forward = utilities.vec_from_angle(car.car_heading)
+        side = forward[0] * (target_y - car.y) - forward[1] * (target_x - car.x)
+        action = (
+            (action_codes.THROTTLE if utilities.norm(car.velocity) < LAP_MAX_SPEED else 0)
+            | (action_codes.LEFT if side > 0 else 0)
+            | (action_codes.RIGHT if side < 0 else 0)
+        )
+        actions.append(action)
+        car.update(action, car_stats.physics_dt)
+    if not car.completed:
+        raise RuntimeError(f"The lap driver does not finish a lap of {track_path}")
+    _lap_actions_cache[track_path] = actions
+    return actions
+
+
+def _segment_intersection() -> Callable[[], object]:
+    a = utilities.Segment(np.array([0.0, 0.0]), np.array([10.0, 10.0]))
+    b = utilities.Segment(np.array([0.0, 10.0]), np.array([10.0, 0.0]))
+    return lambda: utilities.segment_intersection(a, b)
+
+
+def _driving_car(track_path: str) -> Car:
+    """
+    A car part way through the lap, so that its rays and edges see a typical set of borders.
+    """
+    car = _track_car(track_path)
+    for action in lap_actions(track_path)[:100]:
+        car.update(action, car_stats.physics_dt)
+    return car
+
+
+def _car_update(track_path: str) -> Callable[[], object]:
+    car = _track_car(track_path)
+    actions = lap_actions(track_path)
+    steps: Iterator[int] = iter(())
+
+    def step() -> None:
+        nonlocal steps
+        action = next(steps, None)
+        if action is None:
+            car.restart()
+            steps = iter(actions)
+            action = next(steps)
+        car.update(action, car_stats.physics_dt)
+
+    return step
+
+
+def _lap(track_path: str) -> Callable[[], object]:
+    car = _track_car(track_path)
+    actions = lap_actions(track_path)
+
+    def lap() -> None:
+        car.restart()
+        for action in actions:
+            car.update(action, car_stats.physics_dt)
+
+    return lap
+
+
+def _car_batch_step(track_path: str) -> Callable[[], object]:
+    import simulation
+
+    cars = simulation.CarBatch.from_track(BATCH_CARS, track_path)
+    cars.calculate_distances(np.arange(BATCH_CARS))
+    rng = np.random.default_rng(0)
+    controls = rng.random((4, BATCH_CARS)) < 0.5
+    controls[0] = True
+
+    def step() -> None:
+        cars.step(controls[0], controls[1], controls[2], controls[3], car_stats.physics_dt)
+        if not cars.alive.all():
+            dead = np.flatnonzero(~cars.alive)
+            cars.reset(dead)
+            cars.calculate_distances(dead)
+
+    return step
+
+
+def _contacts(cars: int) -> Callable[[], object]:
+    import race
+
+    width, height = (float(v) for v in utilities.read_png_size(graphics_constants.car_image_path))
+    rng = np.random.default_rng(0)
+    side = CONTACT_SPACING * np.sqrt(cars)
+    corners = utilities.rectangle_vertices(
+        rng.uniform(0, side, cars), rng.uniform(0, side, cars), rng.uniform(0, 360, cars), width, height
+    )
+    spatial_hash = race.SpatialHash(float(np.hypot(width, height)))
+    return lambda: race.contacts(corners, spatial_hash)
+
+
+def _spline(points: int) -> Callable[[], object]:
+    rng = np.random.default_rng(0)
+    controls = rng.uniform(0, 1000, (points, 2)).tolist()
+    return lambda: spline.catmull_rom_spline(controls, 10)
+
+
+def _replay(track_path: str, frames: int) -> Replay:
+    replay = Replay(track_path)
+    for i in range(frames):
+        replay.add(Replay.Frame(i, i * car_stats.physics_dt, 100.0 + i % 500, 200.0, float(i % 360), True, False, 0))
+    return replay
+
+
+def _replay_save(track_path: str, frames: int, folder: str) -> Callable[[], object]:
+    replay = _replay(track_path, frames)
+    # Replay files are named relative to the replay folder
+    filename = os.path.relpath(os.path.join(folder, f"save_{frames}.json"), paths.REPLAYS_PATH)
+    return lambda: replay.save_to_file(filename)
+
+
+def _replay_load(track_path: str, frames: int, folder: str) -> Callable[[], object]:
+    filename = os.path.relpath(os.path.join(folder, f"load_{frames}.json"), paths.REPLAYS_PATH)
+    _replay(track_path, frames).save_to_file(filename)
+    return lambda: Replay().load_from_file(filename)
+
+
+def benchmark_setups(track_path: str, folder: str) -> Dict[str, Setup]:
+    """
+    Every benchmark of the suite, by name.
+
+    :param track_path: Path to the track folder the car benchmarks drive on
+    :param folder: scratch folder for the replay files
+    :return: setup of every benchmark
+    """
+    setups: Dict[str, Setup] = {
+        "utilities.segment_intersection": _segment_intersection,
+        "Car.calculate_distances": lambda: _driving_car(track_path).calculate_distances,
+        "Car.cross_border": lambda: _driving_car(track_path).cross_border,
+        "Car.update": lambda: _car_update(track_path),
+        "CarBatch.step": lambda: _car_batch_step(track_path),
+        "lap": lambda: _lap(track_path),
+    }
+    for cars in CONTACT_CAR_COUNTS:
+        setups[f"race.contacts[{cars}]"] = lambda cars=cars: _contacts(cars)  # type: ignore[misc]
+    for points in SPLINE_POINT_COUNTS:
+        setups[f"catmull_rom_spline[{points}]"] = lambda points=points: _spline(points)  # type: ignore[misc]
+    for frames in REPLAY_FRAME_COUNTS:
+        setups[f"Replay.save_to_file[{frames}]"] = lambda frames=frames: _replay_save(
+            track_path, frames, folder
+        )  # type: ignore[misc]
+        setups[f"Replay.load_from_file[{frames}]"] = lambda frames=frames: _replay_load(
+            track_path, frames, folder
+        )  # type: ignore[misc]
+    return setups
+
+
+def measure(name: str, function: Callable[[], object], repeat: int = REPEAT) -> BenchmarkResult:
+    """
+    Time a function: the number of calls per run is doubled until a run lasts MIN_RUN_TIME, then repeat
+    runs are timed.
+
+    :param name: benchmark name
+    :param function: function to time
+    :param repeat: timed runs
+    :return: BenchmarkResult
+    """
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        if time.perf_counter() - start >= MIN_RUN_TIME:
+            break
+        calls *= 2
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        times.append((time.perf_counter() - start) / calls)
+    stdev = statistics.stdev(times) if len(times) > 1 else 0.0
+    return BenchmarkResult(name, min(times), statistics.mean(times), stdev, calls, repeat, 1 / min(times))
+
+
+def environment() -> Dict[str, Any]:
+    """
+    :return: description of the machine and the code the benchmarks ran on
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=paths.SOURCE_PATH, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_benchmarks(
+    track_path: str = paths.DEFAULT_TRACK_PATH, names: Sequence[str] = (), repeat: int = REPEAT
+) -> Dict[str, Any]:
+    """
+    Run the benchmark suite.
+
+    :param track_path: Path to the track folder the car benchmarks drive on
+    :param names: run only the benchmarks whose name contains one of these, all of them when empty
+    :param repeat: timed runs of every benchmark
+    :return: {"environment": ..., "results": [...]}, as saved by save_results
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for name, setup in benchmark_setups(track_path, folder).items():
+            if names and not any(n in name for n in names):
+                continue
+            result = measure(name, setup(), repeat)
+            print(f"{name:<36} {format_time(result.best):>10}  ({result.calls} calls x {result.runs} runs)")
+            results.append(asdict(result))
+    return {"environment": environment(), "track_path": track_path, "results": results}
+
+
+def format_time(seconds: float) -> str:
+    """
+    :param seconds: duration
+    :return: duration with a readable unit
+    """
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3f} {unit}"
+    return f"{seconds / 1e-9:.1f} ns"
+
+
+def save_results(results: Mapping[str, Any], filename: str) -> None:
+    """
+    :param results: output of run_benchmarks
+    :param filename: JSON file to write, folders are created
+    :return: None
+    """
+    folder = os.path.dirname(filename)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(filename: str) -> Dict[str, Any]:
+    """
+    :param filename: JSON file written by save_results
+    :return: results
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        results: Dict[str, Any] = json.load(f)
+    return results
+
+
+def compare(
+    results: Mapping[str, Any], baseline: Mapping[str, Any], threshold: float = REGRESSION_THRESHOLD
+) -> List[Tuple[str, float, float, float, bool]]:
+    """
+    Compare the best times of the benchmarks found in both results.
+
+    :param results: current results
+    :param baseline: results to compare with
+    :param threshold: slowdown, as a fraction, above which a benchmark counts as a regression
+    :return: (name, baseline time, current time, speedup, regression) per benchmark
+    """
+    before = {r["name"]: r["best"] for r in baseline["results"]}
+    rows = []
+    for result in results["results"]:
+        if result["name"] in before:
+            old, new = before[result["name"]], result["best"]
+            rows.append((result["name"], old, new, old / new, new > old * (1 + threshold)))
+    return rows
+
+
+def print_comparison(rows: Sequence[Tuple[str, float, float, float, bool]]) -> None:
+    """
+    :param rows: output of compare
+    :return: None
+    """
+    print(f"{'benchmark':<36} {'baseline':>10} {'current':>10} {'speedup':>8}")
+    for name, old, new, speedup, regression in rows:
+        flag = "  REGRESSION" if regression else ""
+        print(f"{name:<36} {format_time(old):>10} {format_time(new):>10} {speedup:>7.2f}x{flag}")
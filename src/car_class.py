@@ -1,13 +1,15 @@
-from typing import List, Mapping
+from typing import List
 
 import numpy as np
 import pyglet
-from pyglet.window import key
 
+import action_codes
 import car_stats
 import graphics_constants
 import utilities
-from src.make_replay import Replay
+from car_state import CarState
+from make_replay import Replay
+from profiler import FrameProfiler
 
 Vector2 = np.ndarray
 
@@ -31,13 +33,14 @@ class Car:
         self.start_heading: float = heading
         self.replay: Replay = replay
 
-        self.car_image = pyglet.image.load(graphics_constants.car_image_path)
-        self.car_image.anchor_x = int(self.car_image.width / 2)
-        self.car_image.anchor_y = int(self.car_image.height / 2)
-        self.car_sprite = pyglet.sprite.Sprite(self.car_image, x=self.x, y=self.y)
+        # Pose at the previous update, used to interpolate rendering between simulation steps
+        self.previous_x: float = x
+        self.previous_y: float = y
+        self.previous_heading: float = heading
 
-        self.width: float = self.car_sprite.width
-        self.height: float = self.car_sprite.height
+        # The sprite is only created when the car is drawn, so that cars can be simulated without an OpenGL context
+        self._car_sprite: pyglet.sprite.Sprite | None = None
+        self.width, self.height = (float(v) for v in utilities.read_png_size(graphics_constants.car_image_path))
 
         self.velocity: Vector2 = np.zeros(2, dtype=float)
         self.acceleration: Vector2 = np.zeros(2, dtype=float)
@@ -46,6 +49,7 @@ class Car:
         self.alive: bool = True
 
         self.borders: List[utilities.Segment] = borders
+        self.borders_array: utilities.SegmentArray = utilities.segments_to_array(borders)
         self.gates: List[utilities.Segment] = gates.copy()
         if self.gates:
             self.gates.append(self.gates[0])
@@ -67,33 +71,49 @@ class Car:
         self.front_right_dist = utilities.Segment(pos.copy(), pos.copy())
         self.distances: np.ndarray = np.zeros(5, dtype=float)
 
-    def physics_process(self, keys: Mapping[int, bool] | None, dt: float) -> None:
+        # Set to time the phases of update
+        self.profiler: FrameProfiler | None = None
+
+    @property
+    def car_sprite(self) -> pyglet.sprite.Sprite:
+        """
+        :return: sprite of the car, loaded on first use
+        """
+        if self._car_sprite is None:
+            car_image = pyglet.image.load(graphics_constants.car_image_path)
+            car_image.anchor_x = int(car_image.width / 2)
+            car_image.anchor_y = int(car_image.height / 2)
+            self._car_sprite = pyglet.sprite.Sprite(car_image, x=self.x, y=self.y)
+            self._car_sprite.rotation = -self.car_heading
+        return self._car_sprite
+
+    def physics_process(self, action: int | None, dt: float) -> None:
         self.acceleration[:] = 0.0
-        self.get_input(keys)
+        self.get_input(action)
         self.apply_friction()
         self.velocity += self.acceleration * dt
         self.calculate_steering(dt)
 
-    def get_input(self, keys: Mapping[int, bool] | None) -> None:
+    def get_input(self, action: int | None) -> None:
         """
-        Change car status based on keys pressed
-        :param keys: Dictionary of used keys
+        Change car status based on the held controls
+        :param action: action code (see action_codes)
         :return: None
         """
-        if keys is None:
+        if action is None:
             return None
         turn = 0
-        if keys[key.A]:
+        if action & action_codes.LEFT:
             turn += 1
-        if keys[key.D]:
+        if action & action_codes.RIGHT:
             turn -= 1
 
         self.steering_direction = turn * car_stats.steering_angle
         self.acceleration[:] = 0.0
 
-        if keys[key.W]:
+        if action & action_codes.THROTTLE:
             self.acceleration += utilities.vec_from_angle(self.car_heading) * car_stats.engine_power
-        if keys[key.S]:
+        if action & action_codes.BRAKE:
             self.acceleration += utilities.vec_from_angle(self.car_heading) * car_stats.braking
 
     def calculate_steering(self, dt: float) -> None:
@@ -141,8 +161,6 @@ class Car:
             elif self.going_reverse < 0:
                 self.velocity = -new_heading * min(speed_norm, car_stats.max_speed_reverse)
 
-        self.car_sprite.rotation = -self.car_heading
-
     def apply_friction(self) -> None:
         """
         Apply friction to car movement
@@ -159,39 +177,55 @@ class Car:
         drag_force = -self.velocity * speed_norm * car_stats.drag
         self.acceleration += friction_force + drag_force
 
-    def show(self) -> None:
+    def show(self, alpha: float = 1.0) -> None:
         """
-        Renders car sprite
+        Renders car sprite, interpolated between the previous and the current update
 
+        :param alpha: fraction of the simulation step elapsed since the last update (1 = current pose)
         :return: None
         """
         if not self.alive:
             return
-        self.car_sprite.update(x=float(self.x), y=float(self.y))
+        x = self.previous_x + (self.x - self.previous_x) * alpha
+        y = self.previous_y + (self.y - self.previous_y) * alpha
+        turn = (self.car_heading - self.previous_heading + 180) % 360 - 180
+        heading = self.previous_heading + turn * alpha
+        self.car_sprite.update(x=float(x), y=float(y), rotation=-float(heading))
         self.car_sprite.draw()
 
-    def update(self, keys: Mapping[int, bool] | None, dt: float) -> list[float | None]:
+    def update(self, action: int | None, dt: float) -> list[float | None]:
         """
-        Update the car status depending on the pressed keys
+        Update the car status depending on the held controls
 
-        :param keys: Dictionary of pressed keys
+        :param action: action code (see action_codes), None for cars following their replay
         :param dt: Delta time from previous frame
         :return: current speed and time elapsed
         """
+        self.previous_x, self.previous_y, self.previous_heading = self.x, self.y, self.car_heading
         self.current_time += dt
         if self.driven:
             if not self.alive or self.completed:
                 return [0.0, self.last_timer]
 
-            self.physics_process(keys, dt)
+            profiler = self.profiler
+            start = profiler.now() if profiler is not None else 0.0
+            self.physics_process(action, dt)
+            if profiler is not None:
+                start = profiler.lap("physics", start)
 
-            if self.cross_next_gate():
+            crossed = self.cross_next_gate()
+            if profiler is not None:
+                start = profiler.lap("gate_check", start)
+            if crossed:
                 self.next_gate += 1
                 if self.next_gate == len(self.gates):
                     self.completed = True
                     return [0.0, round(self.current_time, 2)]
 
-            if self.cross_border():
+            crashed = self.cross_border()
+            if profiler is not None:
+                start = profiler.lap("border_check", start)
+            if crashed:
                 self.alive = False
                 return [0.0, round(self.current_time, 2)]
 
@@ -200,6 +234,8 @@ class Car:
             if self.going_reverse < 0:
                 speed *= -1
             self.calculate_distances()
+            if profiler is not None:
+                profiler.lap("sensors", start)
             return [speed, round(self.current_time, 2)]
         else:
             if not self.alive or self.completed:
@@ -215,7 +251,6 @@ class Car:
             self.car_heading = frame.heading
             self.alive = frame.alive
             self.completed = frame.completed
-            self.car_sprite.rotation = -self.car_heading
             return [None, round(frame.dt, 2)]
 
     def car_vertices(self) -> list[Vector2]:
@@ -253,13 +288,11 @@ class Car:
         :return: True if the car crossed any border
         """
 
-        edges = self.get_edges()
-        for edge in edges:
-            for border in self.borders:
-                intersects, _ = utilities.segment_intersection(edge, border)
-                if intersects:
-                    return True
-        return False
+        if len(self.borders_array) == 0:
+            return False
+        edges = utilities.segments_to_array(self.get_edges())
+        hits, _ = utilities.segment_intersections(edges, self.borders_array)
+        return bool(hits.any())
 
     def cross_next_gate(self) -> bool:
         """
@@ -286,6 +319,7 @@ class Car:
         self.x = self.start_x
         self.y = self.start_y
         self.car_heading = self.start_heading
+        self.previous_x, self.previous_y, self.previous_heading = self.x, self.y, self.car_heading
         self.velocity[:] = 0.0
         self.acceleration[:] = 0.0
         self.steering_direction = 0.0
@@ -302,8 +336,57 @@ class Car:
             seg.p1 = pos.copy()
             seg.p2 = pos.copy()
 
-        self.car_sprite.update(x=self.x, y=self.y)
-        self.car_sprite.rotation = -self.car_heading
+        if self._car_sprite is not None:
+            self._car_sprite.update(x=self.x, y=self.y)
+            self._car_sprite.rotation = -self.car_heading
+
+    def snapshot(self) -> CarState:
+        """
+        :return: current simulation state of the driven car
+        """
+        sensors = [self.front_dist, self.left_dist, self.right_dist, self.front_left_dist, self.front_right_dist]
+        return CarState(
+            float(self.x),
+            float(self.y),
+            float(self.car_heading),
+            self.velocity.copy(),
+            float(self.steering_direction),
+            float(self.going_reverse),
+            self.next_gate,
+            self.current_time,
+            self.last_timer,
+            self.alive,
+            self.completed,
+            self.distances.copy(),
+            np.array([seg.p2 for seg in sensors], dtype=float),
+        )
+
+    def restore(self, state: CarState) -> None:
+        """
+        Put the car back in a state taken by snapshot (of this car or of another car on the same track),
+        without interpolating the rendering from the current pose.
+
+        :param state: state to restore
+        :return: None
+        """
+        self.x, self.y, self.car_heading = state.x, state.y, state.heading
+        self.previous_x, self.previous_y, self.previous_heading = self.x, self.y, self.car_heading
+        self.velocity[:] = state.velocity
+        self.acceleration[:] = 0.0
+        self.steering_direction = state.steering_direction
+        self.going_reverse = state.going_reverse
+        self.next_gate = state.next_gate
+        self.current_time = state.current_time
+        self.last_timer = state.last_timer
+        self.alive = state.alive
+        self.completed = state.completed
+        self.distances[:] = state.distances
+
+        pos = np.array([self.x, self.y], dtype=float)
+        sensors = [self.front_dist, self.left_dist, self.right_dist, self.front_left_dist, self.front_right_dist]
+        for seg, point in zip(sensors, state.sensor_points, strict=True):
+            seg.p1 = pos.copy()
+            seg.p2 = point.copy()
 
     def calculate_distances(self) -> None:
         """
@@ -315,24 +398,30 @@ class Car:
         directions = [0, 90, -90, 45, -45]
         segments_attr = ["front_dist", "left_dist", "right_dist", "front_left_dist", "front_right_dist"]
 
-        for i, angle_offset in enumerate(directions):
-            angle_deg = self.car_heading + angle_offset
-            segment = utilities.Segment(
-                np.array([self.x, self.y], dtype=float),
-                np.array(
-                    [self.x + 10000 * utilities.cos_deg(angle_deg), self.y + 10000 * utilities.sin_deg(angle_deg)],
-                    dtype=float,
-                ),
-            )
-            closest_point = np.array([10000.0, 10000.0], dtype=float)
-
-            for border in self.borders:
-                intersects, ipt = utilities.segment_intersection(border, segment)
-                if intersects and ipt is not None:
-                    if utilities.norm(ipt - np.array([self.x, self.y], dtype=float)) < utilities.norm(
-                        closest_point - np.array([self.x, self.y], dtype=float)
-                    ):
-                        closest_point = ipt
+        position = np.array([self.x, self.y], dtype=float)
+        rays = np.array(
+            [
+                [
+                    self.x,
+                    self.y,
+                    self.x + 10000 * utilities.cos_deg(self.car_heading + angle_offset),
+                    self.y + 10000 * utilities.sin_deg(self.car_heading + angle_offset),
+                ]
+                for angle_offset in directions
+            ],
+            dtype=float,
+        )
+        # All rays against all borders at once; the closest hit of each ray wins
+        hits, points = utilities.segment_intersections(rays, self.borders_array)
+        hit_distances = np.where(hits, np.linalg.norm(points - position, axis=-1), np.inf)
+        no_hit_point = np.array([10000.0, 10000.0], dtype=float)
+
+        for i in range(len(directions)):
+            closest_point = no_hit_point
+            if hits.shape[1] > 0:
+                nearest = int(np.argmin(hit_distances[i]))
+                if hit_distances[i, nearest] < utilities.norm(no_hit_point - position):
+                    closest_point = points[i, nearest]
 
             getattr(self, segments_attr[i]).p2 = closest_point
-            self.distances[i] = utilities.norm(closest_point - np.array([self.x, self.y], dtype=float))
+            self.distances[i] = utilities.norm(closest_point - position)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+
+FloatArray = NDArray[np.float64]
+BoolArray = NDArray[np.bool_]
+IntArray = NDArray[np.int64]
+
+# Everything a driven car carries from one step to the next, in the attribute names of CarBatch
+STATE_FIELDS = (
+    "x",
+    "y",
+    "heading",
+    "velocity",
+    "steering_direction",
+    "going_reverse",
+    "next_gate",
+    "current_time",
+    "last_timer",
+    "alive",
+    "completed",
+    "distances",
+    "sensor_points",
+)
+
+
+@dataclass(frozen=True)
+class CarState:
+    """
+    Simulation state of one driven car, taken with Car.snapshot and put back with Car.restore or
+    CarBatch.restore. Restoring a state and stepping with the same inputs gives the same trajectory as the
+    car it was taken from, so planners can branch from any point of a lap.
+    """
+
+    x: float
+    y: float
+    heading: float
+    velocity: FloatArray  # (2,)
+    steering_direction: float
+    going_reverse: float
+    next_gate: int
+    current_time: float
+    last_timer: float
+    alive: bool
+    completed: bool
+    distances: FloatArray  # (5,) sensor distances, in the order of Car.distances
+    sensor_points: FloatArray  # (5, 2) sensor hit points
+
+
+@dataclass
+class BatchState:
+    """
+    Simulation state of several cars as arrays with one row per car, taken with CarBatch.snapshot.
+    """
+
+    x: FloatArray
+    y: FloatArray
+    heading: FloatArray
+    velocity: FloatArray  # (N, 2)
+    steering_direction: FloatArray
+    going_reverse: FloatArray
+    next_gate: IntArray
+    current_time: FloatArray
+    last_timer: FloatArray
+    alive: BoolArray
+    completed: BoolArray
+    distances: FloatArray  # (N, 5)
+    sensor_points: FloatArray  # (N, 5, 2)
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def car(self, index: int) -> CarState:
+        """
+        :param index: row of the car
+        :return: state of one car
+        """
+        return CarState(
+            float(self.x[index]),
+            float(self.y[index]),
+            float(self.heading[index]),
+            self.velocity[index].copy(),
+            float(self.steering_direction[index]),
+            float(self.going_reverse[index]),
+            int(self.next_gate[index]),
+            float(self.current_time[index]),
+            float(self.last_timer[index]),
+            bool(self.alive[index]),
+            bool(self.completed[index]),
+            self.distances[index].copy(),
+            self.sensor_points[index].copy(),
+        )
+
+    @classmethod
+    def stack(cls, states: Sequence[CarState]) -> BatchState:
+        """
+        :param states: states of single cars
+        :return: BatchState with one row per state, in order
+        """
+        return cls(*(np.array([getattr(state, name) for state in states]) for name in STATE_FIELDS))
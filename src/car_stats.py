@@ -16,3 +16,22 @@ slip_speed2 = 350  # Above this speed tou start drifting much more
 traction_fast = 0.1  # Traction when going fast
 traction_mid = 0.2  # Traction when going medium speed
 traction_slow = 0.4  # Traction when going slow
+
+# Handling parameters that CarBatch lets every car override
+PARAMETERS = (
+    "wheel_base",
+    "steering_angle",
+    "engine_power",
+    "friction",
+    "drag",
+    "braking",
+    "max_speed_reverse",
+    "slip_speed1",
+    "slip_speed2",
+    "traction_fast",
+    "traction_mid",
+    "traction_slow",
+)
+
+physics_dt = 1 / 60  # Fixed simulation step of the game
+max_physics_steps = 5  # Max simulation steps per rendered frame, to avoid spiraling after a stall
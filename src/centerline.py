@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+import paths
+import utilities
+
+FloatArray = NDArray[np.float64]
+
+CENTERLINE_SPACING = 5.0  # Distance between centerline samples
+GATE_START_OFFSET = 100.0  # Distance from the start pose to the first gate (the finish line), along the centerline
+CHUNK = 256  # Rows tested against all border segments at once, bounds the size of the intersection tables
+INDEX_CELL = 16.0  # Side of the CenterlineIndex lookup cells
+INDEX_MARGIN = 128.0  # The lookup grid covers the centerline bounding box grown by this much
+
+
+def ring_lengths(points: FloatArray) -> FloatArray:
+    """
+    :param points: (n, 2) closed ring, the closing segment is implicit
+    :return: (n + 1,) cumulative arc length at every point, the last value being the length of the ring
+    """
+    closed = np.vstack([points, points[:1]])
+    return np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(closed, axis=0), axis=1))])
+
+
+def sample_ring(points: FloatArray, distances: FloatArray) -> FloatArray:
+    """
+    Points at the given arc lengths along a closed ring.
+
+    :param points: (n, 2) closed ring
+    :param distances: arc lengths from the first point, wrapped around the ring length
+    :return: (..., 2) points
+    """
+    lengths = ring_lengths(points)
+    closed = np.vstack([points, points[:1]])
+    s = np.mod(distances, lengths[-1])
+    return np.stack([np.interp(s, lengths, closed[:, 0]), np.interp(s, lengths, closed[:, 1])], axis=-1)
+
+
+def resample_ring(points: FloatArray, count: int) -> FloatArray:
+    """
+    :param points: (n, 2) closed ring
+    :param count: number of samples
+    :return: (count, 2) samples at uniform arc length, starting at the first point
+    """
+    return sample_ring(points, np.arange(count) * (ring_lengths(points)[-1] / count))
+
+
+def compute_centerline(outer: FloatArray, inner: FloatArray, spacing: float = CENTERLINE_SPACING) -> FloatArray:
+    """
+    Centerline between the two borders: every sample of the outer border is paired with the closest
+    point of the inner border and their midpoint is taken. The midpoints are smoothed and resampled
+    at uniform arc length.
+
+    :param outer: (n, 2) outer ring
+    :param inner: (m, 2) inner ring
+    :param spacing: distance between centerline samples
+    :return: (k, 2) closed centerline, ordered as the outer ring
+    """
+    count = max(int(ring_lengths(outer)[-1] / spacing), 8)
+    samples = resample_ring(outer, count)
+    midpoints = (samples + closest_on_ring(samples, inner)) / 2
+
+    # circular moving average, removes the kinks where the closest inner point jumps
+    window = 5
+    padded = np.vstack([midpoints[-(window // 2) :], midpoints, midpoints[: window // 2]])
+    kernel = np.ones(window) / window
+    smoothed = np.stack([np.convolve(padded[:, i], kernel, mode="valid") for i in range(2)], axis=1)
+    return resample_ring(smoothed, max(int(ring_lengths(smoothed)[-1] / spacing), 8))
+
+
+def _turning(center: FloatArray) -> FloatArray:
+    """
+    :param center: (k, 2) closed ring
+    :return: (k,) absolute turning angle at every point
+    """
+    forward = np.roll(center, -1, axis=0) - center
+    backward = center - np.roll(center, 1, axis=0)
+    angles = np.arctan2(forward[:, 1], forward[:, 0]) - np.arctan2(backward[:, 1], backward[:, 0])
+    return np.asarray(np.abs((angles + np.pi) % (2 * np.pi) - np.pi))
+
+
+def turn_radii(center: FloatArray) -> FloatArray:
+    """
+    :param center: (k, 2) closed ring
+    :return: (k,) radius of the turn at every point, infinite on straights
+    """
+    lengths = np.linalg.norm(np.roll(center, -1, axis=0) - center, axis=1)
+    with np.errstate(divide="ignore"):
+        return np.asarray(lengths / _turning(center))
+
+
+def orient_centerline(center: FloatArray, start: tuple[float, float, float]) -> FloatArray:
+    """
+    :param center: (k, 2) closed centerline
+    :param start: (x, y, heading) start pose, heading in degrees
+    :return: the centerline in driving order (the direction the start pose faces), starting at the sample
+             closest to the start position
+    """
+    x, y, heading = start
+    position = np.array([x, y], dtype=float)
+    _, distances = utilities.project_on_segments(position, center, np.roll(center, -1, axis=0))
+    nearest = int(np.argmin(distances))
+    tangent = center[(nearest + 1) % len(center)] - center[nearest]
+    if tangent @ np.array([np.cos(np.radians(heading)), np.sin(np.radians(heading))]) < 0:
+        center = center[::-1]
+        nearest = len(center) - 1 - nearest
+    return np.roll(center, -nearest, axis=0)
+
+
+def place_gates(
+    center: FloatArray,
+    outer: FloatArray,
+    inner: FloatArray,
+    start: tuple[float, float, float],
+    count: int,
+    curvature_weight: float = 0.0,
+    start_offset: float = GATE_START_OFFSET,
+) -> utilities.SegmentArray:
+    """
+    Place gates across the track along the centerline. Every gate joins the closest outer and inner border
+    points of its centerline station. The first gate is start_offset ahead of the start pose in the driving
+    direction (it is also the finish line), the others follow in driving order.
+
+    :param center: (k, 2) closed centerline
+    :param outer: (n, 2) outer ring
+    :param inner: (m, 2) inner ring
+    :param start: (x, y, heading) start pose, heading in degrees
+    :param count: number of gates
+    :param curvature_weight: 0 for uniform arc length spacing; larger values put gates closer together in
+                             corners (spacing density 1 + weight * curvature / mean curvature)
+    :param start_offset: distance from the start pose to the first gate along the centerline
+    :return: (count, 4) gates, x1 y1 x2 y2, from the outer border to the inner border
+    """
+    center = orient_centerline(center, start)
+    lengths = ring_lengths(center)
+    density = np.ones(len(center))
+    if curvature_weight > 0:
+        turning = _turning(center)
+        density += curvature_weight * turning / max(float(turning.mean()), 1e-12)
+    # weighted arc length of every centerline segment; gates are uniform in the weighted length
+    weighted = np.concatenate([[0.0], np.cumsum(np.diff(lengths) * density)])
+    offset = np.interp(start_offset, lengths, weighted)
+    targets = offset + np.arange(count) * (weighted[-1] / count)
+    stations = np.interp(np.mod(targets, weighted[-1]), weighted, lengths)
+
+    points = sample_ring(center, stations)
+    return np.hstack([closest_on_ring(points, outer), closest_on_ring(points, inner)])
+
+
+def closest_on_ring(points: FloatArray, ring: FloatArray) -> FloatArray:
+    """
+    Closest point of a closed ring to every given point.
+
+    :param points: (k, 2) points
+    :param ring: (n, 2) closed ring
+    :return: (k, 2) points on the ring
+    """
+    starts = np.roll(ring, 1, axis=0)
+    result = np.empty_like(points)
+    for first in range(0, len(points), CHUNK):
+        chunk = points[first : first + CHUNK]
+        t, distances = utilities.project_on_segments(chunk[:, None, :], starts[None, :, :], ring[None, :, :])
+        nearest = np.argmin(distances, axis=1)
+        rows = np.arange(len(chunk))
+        result[first : first + CHUNK] = starts[nearest] + (ring[nearest] - starts[nearest]) * t[rows, nearest][:, None]
+    return result
+
+
+class CenterlineIndex:
+    """
+    Centerline in driving order with its cumulative arc length, and a lookup grid to project positions on it.
+
+    Every grid cell stores the centerline segments that can be the closest one to a point of the cell:
+    those within d + cell diagonal of the cell center, d being the distance from the cell center to the
+    centerline. A query only tests the segments of its cell, so its cost does not depend on the track
+    length. Positions outside the grid use the closest cell and may get a farther segment.
+    """
+
+    def __init__(self, center: FloatArray, cell: float = INDEX_CELL, margin: float = INDEX_MARGIN) -> None:
+        """
+        :param center: (k, 2) closed centerline in driving order, progress 0 at its first point
+        :param cell: side of the grid cells
+        :param margin: the grid covers the centerline bounding box grown by this much
+        """
+        self.starts: FloatArray = np.asarray(center, dtype=float)
+        self.ends: FloatArray = np.roll(self.starts, -1, axis=0)
+        self.lengths: FloatArray = ring_lengths(self.starts)
+        self.length: float = float(self.lengths[-1])
+        self.cell: float = cell
+        self.origin: FloatArray = self.starts.min(axis=0) - margin
+        columns, rows = (int(v) for v in np.ceil((self.starts.max(axis=0) + margin - self.origin) / cell))
+        self.shape: Tuple[int, int] = (columns, rows)
+
+        grid_x, grid_y = np.meshgrid(np.arange(columns), np.arange(rows))
+        centers = self.origin + (np.stack([grid_x.ravel(), grid_y.ravel()], axis=1) + 0.5) * cell
+        candidates: List[NDArray[np.int64]] = []
+        for first in range(0, len(centers), CHUNK):
+            _, distances = utilities.project_on_segments(
+                centers[first : first + CHUNK, None, :], self.starts[None, :, :], self.ends[None, :, :]
+            )
+            reach = distances.min(axis=1, keepdims=True) + cell * np.sqrt(2)
+            candidates.extend(np.flatnonzero(row) for row in distances <= reach)
+        # rows are padded with their first candidate, a repeated segment does not change the closest one;
+        # cells far from the track have the most candidates, queries only read as many columns as they need
+        self.counts: NDArray[np.int32] = np.array([len(c) for c in candidates], dtype=np.int32)
+        self.candidates: NDArray[np.int32] = np.array(
+            [np.pad(c, (0, int(self.counts.max()) - len(c)), mode="edge") for c in candidates], dtype=np.int32
+        )
+
+    @classmethod
+    def from_track(cls, track_path: str) -> CenterlineIndex:
+        """
+        Index the centerline of a track folder, progress 0 being at the start position.
+
+        :param track_path: Path to the track folder
+        :return: CenterlineIndex
+        """
+        outer = utilities.load_border_points(track_path, "outer")
+        inner = utilities.load_border_points(track_path, "inner")
+        x, y, heading = utilities.read_position(track_path)
+        return cls(orient_centerline(compute_centerline(outer, inner), (float(x), float(y), float(heading))))
+
+    def project(self, points: FloatArray) -> Tuple[FloatArray, FloatArray]:
+        """
+        Project positions on the centerline.
+
+        :param points: (..., 2) positions
+        :return: (progress, lateral): distance along the centerline from the start in [0, length), and signed
+                 distance to it, positive on the left of the driving direction
+        """
+        points = np.asarray(points, dtype=float)
+        flat = points.reshape(-1, 2)
+        cells = np.clip(((flat - self.origin) // self.cell).astype(np.int64), 0, np.array(self.shape) - 1)
+        cells = cells[:, 1] * self.shape[0] + cells[:, 0]
+        segments = self.candidates[cells, : int(self.counts[cells].max(initial=1))]
+        t, distances = utilities.project_on_segments(flat[:, None, :], self.starts[segments], self.ends[segments])
+        rows = np.arange(len(flat))
+        best = np.argmin(distances, axis=1)
+        segment = segments[rows, best]
+
+        direction = self.ends[segment] - self.starts[segment]
+        offset = flat - self.starts[segment]
+        side = np.sign(direction[:, 0] * offset[:, 1] - direction[:, 1] * offset[:, 0])
+        progress = np.mod(self.lengths[segment] + t[rows, best] * np.diff(self.lengths)[segment], self.length)
+        lateral = side * distances[rows, best]
+        return progress.reshape(points.shape[:-1]), lateral.reshape(points.shape[:-1])
+
+    def progress_delta(self, before: FloatArray, after: FloatArray) -> FloatArray:
+        """
+        Distance driven along the centerline between two progress values, across the finish line too.
+
+        :param before: progress values
+        :param after: progress values, a short time later
+        :return: after - before, wrapped to [-length / 2, length / 2)
+        """
+        half = self.length / 2
+        return np.asarray(np.mod(np.asarray(after) - before + half, self.length) - half)
+
+
+_index_cache: Dict[str, CenterlineIndex] = {}
+
+
+def track_index(track_path: str) -> CenterlineIndex:
+    """
+    CenterlineIndex of a track folder, built once per process.
+
+    :param track_path: Path to the track folder
+    :return: CenterlineIndex
+    """
+    if track_path not in _index_cache:
+        _index_cache[track_path] = CenterlineIndex.from_track(track_path)
+    return _index_cache[track_path]
+
+
+def generate_gates(track_path: str, count: int, curvature_weight: float = 0.0) -> utilities.SegmentArray:
+    """
+    Compute gates for a track folder from its borders and start pose.
+
+    :param track_path: Path to the track folder
+    :param count: number of gates
+    :param curvature_weight: see place_gates
+    :return: (count, 4) gates
+    """
+    outer = utilities.load_border_points(track_path, "outer")
+    inner = utilities.load_border_points(track_path, "inner")
+    x, y, heading = utilities.read_position(track_path)
+    center = compute_centerline(outer, inner)
+    return place_gates(center, outer, inner, (float(x), float(y), float(heading)), count, curvature_weight)
+
+
+def save_gates(track_path: str, gates: utilities.SegmentArray) -> None:
+    """
+    Write gates.txt in the "x1 y1 x2 y2" format, one gate per line.
+
+    :param track_path: Path to the track folder
+    :param gates: (count, 4) gates
+    :return: None
+    """
+    with open(f"{paths.resolve(track_path)}gates.txt", "w") as f:
+        for x1, y1, x2, y2 in np.round(gates, 1).tolist():
+            f.write(f"{x1} {y1} {x2} {y2}\n")
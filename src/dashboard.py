@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import multiprocessing
+from typing import List, Optional
+
+import pyglet
+
+import graphics_constants
+import trainer
+import utilities
+from pose_ring import PoseRing
+
+
+class TrainingDashboard:
+    def __init__(self, window_width: int, window_height: int, config: trainer.TrainerConfig):
+        """
+        Window showing the cars of a training run that executes in a separate process
+
+        :param window_width: width of the window
+        :param window_height: height of the window
+        :param config: settings of the training run
+        """
+        self.window_width: int = window_width
+        self.window_height: int = window_height
+        self.config: trainer.TrainerConfig = config
+        self.track_path: str = config.track_path
+
+        self.track_batch: Optional[pyglet.graphics.Batch] = None
+        self.gates_batch: Optional[pyglet.graphics.Batch] = None
+        self.finish_line_batch: Optional[pyglet.graphics.Batch] = None
+        self.cars_batch: Optional[pyglet.graphics.Batch] = None
+        self.track_lines: List[pyglet.shapes.Line] | None = None
+        self.gates_lines: List[pyglet.shapes.Line] | None = None
+        self.finish_line_line: pyglet.shapes.Line | None = None
+        self.sprites: List[pyglet.sprite.Sprite] = []
+        self.stats_label: Optional[pyglet.text.Label] = None
+
+    def run(self) -> None:
+        """
+        Start the trainer process and show its cars until the window is closed or training ends.
+
+        :return: None
+        """
+        ring = PoseRing(min(self.config.publish_cars, self.config.environments))
+        context = multiprocessing.get_context("spawn")
+        stop = context.Event()
+        process = context.Process(target=trainer.run_trainer, args=(self.config, ring.name, stop), daemon=True)
+        process.start()
+
+        window = pyglet.window.Window(self.window_width, self.window_height)  # type: ignore
+
+        self.track_batch = pyglet.graphics.Batch()
+        self.gates_batch = pyglet.graphics.Batch()
+        self.finish_line_batch = pyglet.graphics.Batch()
+        self.cars_batch = pyglet.graphics.Batch()
+
+        self.track_lines = utilities.load_track_lines(self.track_path, self.track_batch)
+        self.gates_lines = utilities.load_gates_lines(self.track_path, self.gates_batch)
+        self.finish_line_line = utilities.load_finish_line_line(self.track_path, self.finish_line_batch)
+
+        self.stats_label = pyglet.text.Label(
+            "Waiting for the trainer...",
+            font_name=graphics_constants.replay_viewer_font_name,
+            color=graphics_constants.white_color,
+            font_size=graphics_constants.replay_viewer_font_size,
+            x=graphics_constants.dashboard_label_x,
+            y=graphics_constants.replay_viewer_label_y,
+        )
+
+        car_image = pyglet.image.load(graphics_constants.car_image_path)
+        car_image.anchor_x = int(car_image.width / 2)
+        car_image.anchor_y = int(car_image.height / 2)
+        self.sprites = [pyglet.sprite.Sprite(car_image, batch=self.cars_batch) for _ in range(ring.cars)]
+        for sprite in self.sprites:
+            sprite.opacity = graphics_constants.ghost_opacity
+            sprite.visible = False
+
+        @window.event
+        def on_draw() -> None:
+            """
+            Renders the dashboard
+            :return: None
+            """
+            window.clear()
+            if self.track_batch:
+                self.track_batch.draw()
+            if self.gates_batch:
+                self.gates_batch.draw()
+            if self.finish_line_batch:
+                self.finish_line_batch.draw()
+            if self.cars_batch:
+                self.cars_batch.draw()
+            if self.stats_label:
+                self.stats_label.draw()
+
+        @window.event
+        def on_close() -> None:
+            """
+            Stops the trainer together with the window
+            :return: None
+            """
+            stop.set()
+
+        def update(dt: float) -> None:
+            """
+            Moves the sprites to the latest published poses
+            :param dt: delta time
+            :return: None
+            """
+            located = ring.latest()
+            if located is None:
+                return
+            slot, sequence = located
+            poses = ring.poses[slot]
+            xs, ys, headings, alive = (poses[:, i].tolist() for i in range(4))
+            if not ring.still_valid(slot, sequence):
+                return
+            for sprite, x, y, heading, visible in zip(self.sprites, xs, ys, headings, alive, strict=True):
+                sprite.visible = bool(visible)
+                if visible:
+                    sprite.update(x=x, y=y, rotation=-heading)
+            if self.stats_label:
+                steps, episodes, laps, best_lap = ring.stats.tolist()
+                best = f"{best_lap:.2f}s" if laps else "-"
+                self.stats_label.text = (
+                    f"Steps: {int(steps)}  Episodes: {int(episodes)}  Laps: {int(laps)}  Best lap: {best}"
+                )
+            if not process.is_alive():
+                pyglet.clock.unschedule(update)
+
+        pyglet.clock.schedule(update)
+        try:
+            pyglet.app.run(graphics_constants.game_render_interval)
+        finally:
+            stop.set()
+            process.join()
+            ring.close()
@@ -7,9 +7,14 @@ from pyglet import shapes
 from pyglet.window import key, mouse
 
 import graphics_constants
+import paths
+import track_compiler
+import track_validator
 from car_class import Car
+from make_replay import Replay
+from spline import IncrementalSpline
 
-OUTPUT_PATH = "../tracks/drawer/"
+OUTPUT_PATH = paths.resolve(paths.DEFAULT_TRACK_PATH)
 
 
 class DrawingState(Enum):
@@ -42,58 +47,6 @@ def save_points(points: list[list[float]], filename: str) -> None:
             f.write(f"{x} {y}\n")
 
 
-def catmull_rom_spline(
-    points: list[list[float]],
-    resolution: int = 10,
-    width: int | None = None,
-    height: int | None = None,
-) -> list[list[float]]:
-    """
-    Generate a Catmull-Rom spline that interpolates between the given points,
-    optionally clamping points to the [0,width] x [0,height] rectangle.
-
-    :param points: List of (x, y) float list representing control points.
-    :param resolution: Number of interpolated points generated between each pair of input points.
-    :param width: Optional max X value.
-    :param height: Optional max Y value.
-    :return: List of [x, y] points representing the smoothed spline.
-    """
-    if len(points) < 2 or resolution == 0:
-        return points.copy()
-
-    points = list(np.array(points))
-    smooth_points = np.vstack([points[0], points, points[-1]])
-    result = []
-
-    for i in range(1, len(smooth_points) - 2):
-        p0, p1, p2, p3 = (
-            smooth_points[i - 1],
-            smooth_points[i],
-            smooth_points[i + 1],
-            smooth_points[i + 2],
-        )
-        for t in np.linspace(0, 1, resolution + 1, endpoint=False):
-            t2 = t * t
-            t3 = t2 * t
-            f = 0.5 * (
-                (2 * p1) + (-p0 + p2) * t + (2 * p0 - 5 * p1 + 4 * p2 - p3) * t2 + (-p0 + 3 * p1 - 3 * p2 + p3) * t3
-            )
-            if width is not None:
-                f[0] = max(0, min(width, int(f[0])))
-            if height is not None:
-                f[1] = max(0, min(height, int(f[1])))
-            result.append(f.tolist())
-
-    last_point = points[-1]
-    if width is not None:
-        last_point[0] = max(0, min(width, last_point[0]))
-    if height is not None:
-        last_point[1] = max(0, min(height, last_point[1]))
-    result.append(last_point)
-
-    return result
-
-
 def draw_lines(
     batch: pyglet.graphics.Batch,
     lines_container: list,
@@ -130,6 +83,45 @@ def draw_lines(
             lines_container.append(shapes.Line(x1, y1, x2, y2, color=color, batch=batch))
 
 
+def update_lines(
+    batch: pyglet.graphics.Batch,
+    lines_container: list,
+    points: np.ndarray,
+    start: int,
+    stop: int,
+    color: tuple[int, int, int, int],
+) -> None:
+    """
+    Move the polyline through the given points in place: only the lines touching points[start:stop]
+    are updated, and lines are created or deleted at the end when the number of points changed.
+
+    :param batch: The pyglet batch used to group drawing operations.
+    :param lines_container: A list that stores the Line objects of the polyline.
+    :param points: (n, 2) array of points through which the polyline is drawn.
+    :param start: First point that changed.
+    :param stop: One past the last point that changed.
+    :param color: RGB or RGBA color tuple used to draw new lines.
+    :return: None
+    """
+    count = max(len(points) - 1, 0)
+    while len(lines_container) > count:
+        lines_container.pop().delete()
+    kept = len(lines_container)
+    first = min(max(start - 1, 0), kept)
+    coordinates = points[first : count + 1].tolist()
+    for i in range(first, min(stop, kept)):
+        x1, y1 = coordinates[i - first]
+        x2, y2 = coordinates[i - first + 1]
+        line = lines_container[i]
+        line.position = (x1, y1)
+        line.x2 = x2
+        line.y2 = y2
+    for i in range(kept, count):
+        x1, y1 = coordinates[i - first]
+        x2, y2 = coordinates[i - first + 1]
+        lines_container.append(shapes.Line(x1, y1, x2, y2, color=color, batch=batch))
+
+
 def draw_track() -> None:
     window = pyglet.window.Window(graphics_constants.resolution_width, graphics_constants.resolution_height)  # type: ignore
 
@@ -155,6 +147,12 @@ def draw_track() -> None:
     points: dict[str, list[list[float]]] = {"outer": [], "inner": [], "gates": []}
     original_lines: dict[str, list[shapes.Line]] = {"outer": [], "inner": []}
     smooth_lines: dict[str, list[shapes.Line]] = {"outer": [], "inner": []}
+    splines: dict[str, IncrementalSpline] = {
+        mode: IncrementalSpline(
+            smoothing_resolution, graphics_constants.resolution_width, graphics_constants.resolution_height
+        )
+        for mode in ("outer", "inner")
+    }
     gates_lines: list[shapes.Line] = []
 
     string_spacing = " " * 7
@@ -270,14 +268,14 @@ def draw_track() -> None:
         pts = points[mode]
         pts.append([x, y])
         if step != DrawingState.GATES_PLACEMENT:
-            if len(pts) > 1:
-                draw_lines(
-                    original_segments_batch,
-                    original_lines[mode],
-                    mode,
-                    pts,
-                    graphics_constants.white_color,
-                )
+            update_lines(
+                original_segments_batch,
+                original_lines[mode],
+                np.array(pts, dtype=float),
+                len(pts) - 1,
+                len(pts),
+                graphics_constants.white_color,
+            )
             update_smooth()
         else:
             draw_lines(gates_batch, gates_lines, mode, pts, graphics_constants.yellow_color)
@@ -298,14 +296,14 @@ def draw_track() -> None:
             return
         pts[-1] = [x, y]
         if step != DrawingState.GATES_PLACEMENT:
-            if len(pts) > 1:
-                draw_lines(
-                    original_segments_batch,
-                    original_lines[mode],
-                    mode,
-                    pts,
-                    graphics_constants.white_color,
-                )
+            update_lines(
+                original_segments_batch,
+                original_lines[mode],
+                np.array(pts, dtype=float),
+                len(pts) - 1,
+                len(pts),
+                graphics_constants.white_color,
+            )
             update_smooth()
         else:
             draw_lines(gates_batch, gates_lines, mode, pts, graphics_constants.yellow_color)
@@ -363,42 +361,32 @@ def draw_track() -> None:
 
     def update_smooth() -> None:
         """
-        Recompute and redraw the Catmull-Rom smoothed curves for inner and outer points.
+        Update the Catmull-Rom smoothed curves for inner and outer points. Only the spans next to
+        edited points are evaluated again, and only the lines of those spans are moved.
         Also updates the UI label showing smoothing resolution and total point count.
 
         :return: None
         """
-        smooth_outer_points = catmull_rom_spline(
-            points["outer"],
-            smoothing_resolution,
-            graphics_constants.resolution_width,
-            graphics_constants.resolution_height,
-        )
-        smooth_inner_points = catmull_rom_spline(
-            points["inner"],
-            smoothing_resolution,
-            graphics_constants.resolution_width,
-            graphics_constants.resolution_height,
-        )
+        for mode, spline in splines.items():
+            if spline.resolution != smoothing_resolution:
+                spline.set_resolution(smoothing_resolution)
+                start, stop = 0, len(spline.samples)
+            else:
+                start, stop = spline.update(points[mode])
+            update_lines(
+                smooth_segments_batch,
+                smooth_lines[mode],
+                spline.samples,
+                start,
+                stop,
+                graphics_constants.green_color,
+            )
 
-        draw_lines(
-            smooth_segments_batch,
-            smooth_lines["outer"],
-            "outer",
-            smooth_outer_points,
-            graphics_constants.green_color,
-        )
-        draw_lines(
-            smooth_segments_batch,
-            smooth_lines["inner"],
-            "inner",
-            smooth_inner_points,
-            graphics_constants.green_color,
+        smoothing_label.text = (
+            f"Smoothing resolution: {smoothing_resolution}. "
+            f"Points: {sum(len(spline.samples) for spline in splines.values())}"
         )
 
-        smoothing_label.text = f"Smoothing resolution: {smoothing_resolution}. Points: {len(smooth_outer_points) +
-                                                                                        + len(smooth_inner_points)}"
-
     def draw_grid(
         batch: pyglet.graphics.Batch,
         width: int,
@@ -434,20 +422,27 @@ def draw_track() -> None:
 
     def save_borders() -> None:
         """
-        Save the smoothed points to disk.
+        Save the smoothed points to disk, simplified so that straights do not keep every spline sample.
+        The label reports the segment counts and the geometric error of the simplification.
 
         :return: None
         """
+        reports = []
+        saved = {}
         for mode in ["inner", "outer"]:
-            save_points(
-                catmull_rom_spline(
-                    points[mode],
-                    smoothing_resolution,
-                    graphics_constants.resolution_width,
-                    graphics_constants.resolution_height,
-                ),
-                f"{OUTPUT_PATH}{mode}.txt",
+            simplified, error = track_compiler.simplify_ring(splines[mode].samples, track_compiler.DEFAULT_TOLERANCE)
+            save_points(simplified.tolist(), f"{OUTPUT_PATH}{mode}.txt")
+            saved[mode] = simplified
+            reports.append(
+                track_compiler.SimplificationReport(
+                    mode, track_compiler.ring_segments(splines[mode].samples), len(simplified), error
+                )
             )
+        problems = track_validator.validate(saved["outer"], saved["inner"])
+        for problem in problems:
+            print(problem)
+        status = f"{len(problems)} problem(s), see the console" if problems else "Borders are valid"
+        smoothing_label.text = "Saved. " + "    ".join(str(report) for report in reports) + f"    {status}"
 
     def save_gates() -> None:
         """
@@ -469,11 +464,12 @@ def draw_track() -> None:
         """
         points[mode].append(points[mode][0])
         update_smooth()
-        draw_lines(
+        update_lines(
             original_segments_batch,
             original_lines[mode],
-            mode,
-            points[mode],
+            np.array(points[mode], dtype=float),
+            len(points[mode]) - 1,
+            len(points[mode]),
             graphics_constants.white_color,
         )
 
@@ -606,7 +602,7 @@ def draw_track() -> None:
                     borders=[],
                     gates=[],
                     driven=False,
-                    replay=None,
+                    replay=Replay(),
                 )
             elif drawing_step == DrawingState.CAR_PLACEMENT:
                 if car_instance is not None:
@@ -617,6 +613,8 @@ def draw_track() -> None:
                 if len(points["gates"]) % 2 == 1:
                     return
                 save_gates()
+                for problem in track_validator.validate_track(OUTPUT_PATH):
+                    print(problem)
                 pyglet.app.exit()
         elif symbol == key.A:
             if drawing_step == DrawingState.CAR_PLACEMENT and car_instance is not None:
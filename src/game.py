@@ -4,24 +4,31 @@ import pyglet
 from pyglet import shapes
 from pyglet.window import key
 
+import action_codes
 import car_class
+import car_stats
 import graphics_constants
 import make_replay
+import policy
+import race
 import utilities
+from profiler import FrameProfiler
 
 
 class Game:
-    def __init__(self, window_width: int, window_height: int, track: str):
+    def __init__(self, window_width: int, window_height: int, track: str, profiler: FrameProfiler | None = None):
         """
         Initialize a new Game session.
 
         :param window_width: Width of the game window
         :param window_height: Height of the game window
         :param track: Path to the track folder
+        :param profiler: optional profiler timing the phases of every frame
         """
         self.window_width: int = window_width
         self.window_height: int = window_height
         self.track_path: str = track
+        self.profiler: FrameProfiler | None = profiler
 
         pos: Tuple[float, float, float] = utilities.read_position(track)
         self.start_x, self.start_y, self.heading = pos
@@ -52,10 +59,14 @@ class Game:
         self.started = False
         self.finished: bool = False
 
-    def new_game(self) -> make_replay.Replay:
+        # Real time not yet consumed by fixed simulation steps
+        self.accumulator: float = 0.0
+
+    def new_game(self, driver: policy.Policy | None = None) -> make_replay.Replay:
         """
         Start a new game session and return the replay object.
 
+        :param driver: policy driving the car from its sensors, None to drive with the keyboard
         :return: Replay containing all frames of this session
         """
         game_window = pyglet.window.Window(self.window_width, self.window_height, resizable=True)  # type: ignore
@@ -82,6 +93,8 @@ class Game:
             driven=True,
             replay=replay,
         )
+        profiler = self.profiler
+        car.profiler = profiler
 
         # Key handler
         keys = key.KeyStateHandler()
@@ -106,21 +119,26 @@ class Game:
             y=graphics_constants.game_timer_label_y,
         )
 
-        # Distance lines
-        self.update_distance_lines(car)
+        # Distance lines, created once and moved every frame
+        car.calculate_distances()
+        self.create_distance_lines(car)
 
         self.game_timer = 0.0
         self.finished = False
         self.started = False
+        self.accumulator = 0.0
 
         @game_window.event
         def on_draw() -> None:
             """
-            Render all graphics on screen.
+            Render all graphics on screen, interpolating the car between the last two simulation steps.
 
             :return: None
             """
+            start = profiler.now() if profiler is not None else 0.0
             game_window.clear()
+            alpha = min(self.accumulator / car_stats.physics_dt, 1.0) if not self.finished else 1.0
+            self.update_distance_lines(car, alpha)
             if self.track_batch:
                 self.track_batch.draw()
             if self.gates_batch:
@@ -129,33 +147,47 @@ class Game:
                 self.finish_line_batch.draw()
             if self.distances_batch:
                 self.distances_batch.draw()
-            car.show()
+            car.show(alpha)
             speed_label.draw()
             timer_label.draw()
+            if profiler is not None:
+                profiler.lap("render", start)
+                profiler.draw()
+                profiler.end_frame()
 
-        def update(dt: float) -> None:
+        def step(dt: float) -> None:
             """
-            Update game logic for each frame.
+            Advance the simulation by one fixed step.
 
+            :param dt: simulation step
             :return: None
             """
-            if self.finished:
-                return
-
-            pressed_keys = utilities.get_dict_keys(keys)  # type: ignore[arg-type]
-
-            if self.started is False and not any(pressed_keys.values()):
+            if driver is not None:
+                car_speed = utilities.norm(car.velocity)
+                features = policy.observation(car.distances, -car_speed if car.going_reverse < 0 else car_speed)
+                action = policy.ACTIONS[driver.act(features)]
+            else:
+                action = action_codes.from_keys(keys)  # type: ignore[arg-type]
+
+            # The keyboard run starts on the first key press; a policy drives from the first step, even when
+            # its first action is NONE (it would otherwise wait forever on an unchanging observation)
+            if self.started is False and driver is None and action == action_codes.NONE:
                 return
 
             self.started = True
 
-            speed, timer = car.update(keys, dt)  # type: ignore[arg-type]
+            speed, timer = car.update(action, dt)
             self.game_timer += dt
 
-            speed_label.text = f"Speed: {int(speed) if speed is not None else 0}"
-            timer_label.text = f"Time: {timer:.3f}s" if timer is not None else "0.0s"
-
-            self.update_distance_lines(car)
+            start = profiler.now() if profiler is not None else 0.0
+            speed_text = f"Speed: {int(speed) if speed is not None else 0}"
+            timer_text = f"Time: {timer:.3f}s" if timer is not None else "0.0s"
+            if speed_label.text != speed_text:
+                speed_label.text = speed_text
+            if timer_label.text != timer_text:
+                timer_label.text = timer_text
+            if profiler is not None:
+                start = profiler.lap("labels", start)
 
             # Add frame to replay
             replay.add(
@@ -167,20 +199,43 @@ class Game:
                     heading=car.car_heading,
                     alive=car.alive,
                     completed=car.completed,
-                    pressed_keys=pressed_keys,
+                    action=action,
                 )
             )
+            if profiler is not None:
+                profiler.lap("replay_append", start)
 
             if not car.alive or car.completed:
                 self.finished = True
 
-        pyglet.clock.schedule_interval(update, 1 / 60)
-        pyglet.app.run()
+        def update(dt: float) -> None:
+            """
+            Run as many fixed simulation steps as the real time elapsed since the last call requires.
+
+            :param dt: real time elapsed since the last call
+            :return: None
+            """
+            if self.finished:
+                return
+            start = profiler.now() if profiler is not None else 0.0
+            self.accumulator = min(self.accumulator + dt, car_stats.physics_dt * car_stats.max_physics_steps)
+            while self.accumulator >= car_stats.physics_dt and not self.finished:
+                step(car_stats.physics_dt)
+                self.accumulator -= car_stats.physics_dt
+            if profiler is not None:
+                profiler.lap("update", start)
+
+        if profiler is not None:
+            profiler.create_overlay()
+        pyglet.clock.schedule(update)
+        pyglet.app.run(graphics_constants.game_render_interval)
+        if profiler is not None:
+            profiler.write_log()
         return replay
 
-    def update_distance_lines(self, car: car_class.Car) -> None:
+    def create_distance_lines(self, car: car_class.Car) -> None:
         """
-        Update or create distance lines for visualization.
+        Create the distance lines for visualization; they are then only moved by update_distance_lines.
 
         :param car: Car object to compute distances from
         """
@@ -194,3 +249,199 @@ class Game:
         self.front_right_distance_line = shapes.Line(
             car.x, car.y, car.front_right_dist.x2, car.front_right_dist.y2, batch=batch
         )
+
+    def update_distance_lines(self, car: car_class.Car, alpha: float = 1.0) -> None:
+        """
+        Move the distance lines in place to the (interpolated) car position and the last sensor hits.
+
+        :param car: Car object to compute distances from
+        :param alpha: fraction of the simulation step elapsed since the last update
+        """
+        x = car.previous_x + (car.x - car.previous_x) * alpha
+        y = car.previous_y + (car.y - car.previous_y) * alpha
+        for line, segment in (
+            (self.front_distance_line, car.front_dist),
+            (self.left_distance_line, car.left_dist),
+            (self.right_distance_line, car.right_dist),
+            (self.front_left_distance_line, car.front_left_dist),
+            (self.front_right_distance_line, car.front_right_dist),
+        ):
+            if line is None:
+                continue
+            line.position = (x, y)
+            line.x2 = segment.x2
+            line.y2 = segment.y2
+
+
+class RaceGame:
+    def __init__(self, window_width: int, window_height: int, race_session: race.Race):
+        """
+        Window of a race: the human car driven with the keyboard, the AI cars (tinted) and the replay ghosts
+        (transparent). Crashed and finished cars leave the track.
+
+        :param window_width: Width of the game window
+        :param window_height: Height of the game window
+        :param race_session: race to show, reset before it starts
+        """
+        self.window_width: int = window_width
+        self.window_height: int = window_height
+        self.race: race.Race = race_session
+
+        self.track_batch: Optional[pyglet.graphics.Batch] = None
+        self.gates_batch: Optional[pyglet.graphics.Batch] = None
+        self.finish_line_batch: Optional[pyglet.graphics.Batch] = None
+        self.cars_batch: Optional[pyglet.graphics.Batch] = None
+        self.track_lines: Optional[List[shapes.Line]] = None
+        self.gates_lines: Optional[List[shapes.Line]] = None
+        self.finish_line_line: Optional[shapes.Line] = None
+        self.car_sprites: List[pyglet.sprite.Sprite] = []
+        self.ghost_sprites: List[pyglet.sprite.Sprite] = []
+
+        self.started: bool = False
+        # Real time not yet consumed by fixed simulation steps
+        self.accumulator: float = 0.0
+
+    def run(self) -> make_replay.Replay:
+        """
+        Run the race until the window is closed. It starts when the human car first moves, at once when
+        there is no human car.
+
+        :return: Replay of the human car, empty without one
+        """
+        race_session = self.race
+        cars = race_session.cars
+        race_session.reset()
+        game_window = pyglet.window.Window(self.window_width, self.window_height, resizable=True)  # type: ignore
+
+        self.track_batch = pyglet.graphics.Batch()
+        self.gates_batch = pyglet.graphics.Batch()
+        self.finish_line_batch = pyglet.graphics.Batch()
+        self.cars_batch = pyglet.graphics.Batch()
+        self.track_lines = utilities.load_track_lines(race_session.track_path, self.track_batch)
+        self.gates_lines = utilities.load_gates_lines(race_session.track_path, self.gates_batch)
+        self.finish_line_line = utilities.load_finish_line_line(race_session.track_path, self.finish_line_batch)
+
+        # One texture shared by every car, all sprites in the same batch
+        car_image = pyglet.image.load(graphics_constants.car_image_path)
+        car_image.anchor_x = int(car_image.width / 2)
+        car_image.anchor_y = int(car_image.height / 2)
+        self.car_sprites = [pyglet.sprite.Sprite(car_image, batch=self.cars_batch) for _ in range(cars.count)]
+        for sprite in self.car_sprites[race_session.humans :]:
+            sprite.color = graphics_constants.race_opponent_color
+        ghosts = race_session.ghosts
+        self.ghost_sprites = [
+            pyglet.sprite.Sprite(car_image, batch=self.cars_batch) for _ in range(len(ghosts) if ghosts else 0)
+        ]
+        for sprite in self.ghost_sprites:
+            sprite.opacity = graphics_constants.ghost_opacity
+
+        keys = key.KeyStateHandler()
+        game_window.push_handlers(keys)
+
+        timer_label = pyglet.text.Label(
+            "Time: 0.0s",
+            color=graphics_constants.white_color,
+            font_name=graphics_constants.game_timer_label_font_name,
+            font_size=graphics_constants.game_timer_label_font_size,
+            x=graphics_constants.game_timer_label_x,
+            y=graphics_constants.game_timer_label_y,
+        )
+        cars_label = pyglet.text.Label(
+            "",
+            color=graphics_constants.white_color,
+            font_name=graphics_constants.game_timer_label_font_name,
+            font_size=graphics_constants.game_timer_label_font_size,
+            x=graphics_constants.race_label_x,
+            y=graphics_constants.race_label_y,
+        )
+
+        replay = make_replay.Replay(race_session.track_path)
+        self.started = False
+        self.accumulator = 0.0
+
+        def move_sprites() -> None:
+            """
+            Put the sprites on the current poses, hiding the cars that left the track.
+
+            :return: None
+            """
+            running = race_session.running.tolist()
+            poses = zip(cars.x.tolist(), cars.y.tolist(), (-cars.heading).tolist(), running, strict=True)
+            for sprite, (x, y, rotation, visible) in zip(self.car_sprites, poses, strict=True):
+                if sprite.visible != visible:
+                    sprite.visible = visible
+                if visible:
+                    sprite.update(x=x, y=y, rotation=rotation)
+            if race_session.ghosts is not None:
+                x, y, heading, alive, _ = race_session.ghosts.poses(race_session.time)
+                poses = zip(x.tolist(), y.tolist(), (-heading).tolist(), alive.tolist(), strict=True)
+                for sprite, (x, y, rotation, visible) in zip(self.ghost_sprites, poses, strict=True):
+                    if sprite.visible != visible:
+                        sprite.visible = visible
+                    if visible:
+                        sprite.update(x=x, y=y, rotation=rotation)
+            finished = int(cars.completed.sum())
+            crashed = int((~cars.alive).sum())
+            cars_label.text = f"Running: {sum(running)}  Finished: {finished}  Crashed: {crashed}"
+
+        @game_window.event
+        def on_draw() -> None:
+            """
+            Render all graphics on screen.
+
+            :return: None
+            """
+            game_window.clear()
+            for batch in (self.track_batch, self.gates_batch, self.finish_line_batch, self.cars_batch):
+                if batch:
+                    batch.draw()
+            timer_label.draw()
+            cars_label.draw()
+
+        def step() -> None:
+            """
+            Advance the race by one fixed step.
+
+            :return: None
+            """
+            action = action_codes.from_keys(keys) if race_session.humans else action_codes.NONE  # type: ignore[arg-type]
+            if not self.started and race_session.humans and action == action_codes.NONE:
+                return
+            self.started = True
+
+            recording = race_session.humans and race_session.running[0]
+            race_session.step(race_session.actions(action))
+            if recording:
+                replay.add(
+                    make_replay.Replay.Frame(
+                        frame_number=len(replay.log),
+                        delta_time=race_session.time,
+                        x=float(cars.x[0]),
+                        y=float(cars.y[0]),
+                        heading=float(cars.heading[0]),
+                        alive=bool(cars.alive[0]),
+                        completed=bool(cars.completed[0]),
+                        action=action,
+                    )
+                )
+            timer_label.text = f"Time: {race_session.time:.3f}s"
+
+        def update(dt: float) -> None:
+            """
+            Run as many fixed simulation steps as the real time elapsed since the last call requires.
+
+            :param dt: real time elapsed since the last call
+            :return: None
+            """
+            if race_session.finished:
+                return
+            self.accumulator = min(self.accumulator + dt, race_session.config.dt * car_stats.max_physics_steps)
+            while self.accumulator >= race_session.config.dt and not race_session.finished:
+                step()
+                self.accumulator -= race_session.config.dt
+            move_sprites()
+
+        move_sprites()
+        pyglet.clock.schedule(update)
+        pyglet.app.run(graphics_constants.game_render_interval)
+        return replay
@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+import action_codes
+import car_stats
+import paths
+import utilities
+
+FloatArray = NDArray[np.float64]
+BoolArray = NDArray[np.bool_]
+
+RANDOM_SCRIPTS = 4
+SCRIPT_STEPS = 600
+GENERATED_TRACK_SEED = 7  # track_generator seed of the second reference track, the lap driver finishes it
+TRACE_FIELDS = ("x", "y", "heading", "velocity", "distances", "alive", "completed", "next_gate")
+
+
+@dataclass
+class Tolerances:
+    """
+    Largest differences accepted between a trace and its reference. Events (alive, completed, next_gate)
+    must match exactly.
+    """
+
+    position: float = 1e-6  # pixels
+    heading: float = 1e-6  # degrees
+    velocity: float = 1e-6  # pixels per second
+    distances: float = 1e-4  # pixels, a ray grazing a border corner amplifies tiny pose differences
+
+
+@dataclass
+class GoldenTrack:
+    """
+    A track in the form the engines are built from, stored with the traces so that checks do not depend on
+    the track files.
+    """
+
+    name: str
+    start: Tuple[float, float, float]
+    borders: utilities.SegmentArray
+    gates: utilities.SegmentArray
+
+    @classmethod
+    def from_folder(cls, name: str, track_path: str) -> GoldenTrack:
+        """
+        :param name: name of the track in the trace files
+        :param track_path: Path to the track folder
+        :return: GoldenTrack
+        """
+        x, y, heading = utilities.read_position(track_path)
+        return cls(
+            name,
+            (float(x), float(y), float(heading)),
+            utilities.segments_to_array(utilities.load_track_segments(track_path)),
+            utilities.segments_to_array(utilities.load_gates_segments(track_path)),
+        )
+
+
+@dataclass
+class Trace:
+    """
+    State of a car after every step of a script.
+    """
+
+    x: FloatArray
+    y: FloatArray
+    heading: FloatArray
+    velocity: FloatArray  # (steps, 2)
+    distances: FloatArray  # (steps, 5)
+    alive: BoolArray
+    completed: BoolArray
+    next_gate: NDArray[np.int64]
+
+    def __len__(self) -> int:
+        return len(self.x)
+
+
+@dataclass
+class Golden:
+    """
+    A recorded reference: a scripted input sequence on a track and the trace of the reference engine.
+    """
+
+    track: GoldenTrack
+    script: str
+    dt: float
+    inputs: BoolArray  # (steps, 4) W, S, A, D held down
+    trace: Trace
+
+    @property
+    def name(self) -> str:
+        return f"{self.track.name}_{self.script}"
+
+    def save(self, filename: str) -> None:
+        """
+        :param filename: .npz file to write
+        :return: None
+        """
+        np.savez_compressed(
+            filename,
+            track_name=np.array(self.track.name),
+            start=np.array(self.track.start),
+            borders=self.track.borders,
+            gates=self.track.gates,
+            script=np.array(self.script),
+            dt=np.array(self.dt),
+            inputs=self.inputs,
+            **{f"trace_{name}": getattr(self.trace, name) for name in TRACE_FIELDS},
+        )
+
+    @classmethod
+    def load(cls, filename: str) -> Golden:
+        """
+        :param filename: .npz file written by save
+        :return: Golden
+        """
+        with np.load(filename) as data:
+            x, y, heading = (float(v) for v in data["start"])
+            track = GoldenTrack(str(data["track_name"]), (x, y, heading), data["borders"], data["gates"])
+            trace = Trace(*(data[f"trace_{name}"] for name in TRACE_FIELDS))
+            return cls(track, str(data["script"]), float(data["dt"]), data["inputs"], trace)
+
+
+Engine = Callable[[GoldenTrack, Sequence[BoolArray], float], List[Trace]]
+
+
+def _segments(array: utilities.SegmentArray) -> List[utilities.Segment]:
+    return [utilities.Segment(row[0:2].copy(), row[2:4].copy()) for row in np.asarray(array, dtype=float)]
+
+
+def run_car(track: GoldenTrack, scripts: Sequence[BoolArray], dt: float) -> List[Trace]:
+    """
+    Reference engine: one Car per script, driven through Car.update.
+
+    :param track: track to drive on
+    :param scripts: (steps, 4) inputs of every script
+    :param dt: simulation step
+    :return: one trace per script
+    """
+    import pyglet
+
+    pyglet.options["headless"] = True
+    from car_class import Car
+    from make_replay import Replay
+
+    borders, gates = _segments(track.borders), _segments(track.gates)
+    traces = []
+    for inputs in scripts:
+        car = Car(*track.start, borders, gates, True, Replay())
+        rows: List[Tuple[Any, ...]] = []
+        for held in inputs:
+            car.update(int(action_codes.encode(held)), dt)
+            rows.append(
+                (
+                    car.x,
+                    car.y,
+                    car.car_heading,
+                    car.velocity.copy(),
+                    car.distances.copy(),
+                    car.alive,
+                    car.completed,
+                    car.next_gate,
+                )
+            )
+        traces.append(_trace(rows))
+    return traces
+
+
+def run_car_batch(track: GoldenTrack, scripts: Sequence[BoolArray], dt: float) -> List[Trace]:
+    """
+    Vectorized engine: every script drives one car of a single CarBatch.
+
+    :param track: track to drive on
+    :param scripts: (steps, 4) inputs of every script
+    :param dt: simulation step
+    :return: one trace per script
+    """
+    import simulation
+
+    cars = simulation.CarBatch(len(scripts), track.start, _segments(track.borders), _segments(track.gates))
+    steps = max(len(inputs) for inputs in scripts)
+    inputs = np.zeros((steps, len(scripts), 4), dtype=bool)
+    for i, script in enumerate(scripts):
+        inputs[: len(script), i] = script
+    rows = []
+    for held in inputs:
+        cars.step(held[:, 0], held[:, 1], held[:, 2], held[:, 3], dt)
+        rows.append(
+            (
+                cars.x.copy(),
+                cars.y.copy(),
+                cars.heading.copy(),
+                cars.velocity.copy(),
+                cars.distances.copy(),
+                cars.alive.copy(),
+                cars.completed.copy(),
+                cars.next_gate.copy(),
+            )
+        )
+    columns = [np.stack(values) for values in zip(*rows, strict=True)]
+    return [
+        Trace(*(column[: len(script), i] for column in columns))  # type: ignore[arg-type]
+        for i, script in enumerate(scripts)
+    ]
+
+
+ENGINES: Dict[str, Engine] = {"car": run_car, "batch": run_car_batch}
+
+
+def _trace(rows: Sequence[Tuple[Any, ...]]) -> Trace:
+    columns = list(zip(*rows, strict=True))
+    dtypes = (float, float, float, float, float, bool, bool, np.int64)
+    return Trace(*(np.array(column, dtype=dtype) for column, dtype in zip(columns, dtypes, strict=True)))
+
+
+def _held(rng: np.random.Generator, steps: int) -> BoolArray:
+    """
+    Random inputs, every combination being held for 5 to 30 steps like a human driver would.
+    """
+    inputs = np.zeros((steps, 4), dtype=bool)
+    step = 0
+    while step < steps:
+        length = int(rng.integers(5, 31))
+        inputs[step : step + length] = rng.random(4) < np.array([0.7, 0.15, 0.3, 0.3])
+        step += length
+    return inputs
+
+
+def scripts(track_path: str) -> Dict[str, BoolArray]:
+    """
+    Scripted input sequences for a track: a full lap, straight lines, reversing, a slalom and random inputs.
+
+    :param track_path: Path to the track folder, the lap is driven on it
+    :return: (steps, 4) inputs by script name
+    """
+    import benchmarks
+
+    lap = action_codes.decode(np.array(benchmarks.lap_actions(track_path)))
+    steps = np.arange(SCRIPT_STEPS)
+    throttle = np.zeros((SCRIPT_STEPS, 4), dtype=bool)
+    throttle[:, 0] = True
+    reverse = np.zeros((SCRIPT_STEPS, 4), dtype=bool)
+    reverse[:, 1] = steps < SCRIPT_STEPS // 2
+    reverse[:, 0] = steps >= SCRIPT_STEPS // 2
+    reverse[:, 2] = (steps // 40) % 3 == 0
+    slalom = throttle.copy()
+    slalom[:, 2] = (steps // 20) % 2 == 0
+    slalom[:, 3] = (steps // 20) % 2 == 1
+    result = {"lap": lap, "throttle": throttle, "reverse": reverse, "slalom": slalom}
+    for seed in range(RANDOM_SCRIPTS):
+        result[f"random{seed}"] = _held(np.random.default_rng(seed), SCRIPT_STEPS)
+    return result
+
+
+def record(output_path: str = paths.GOLDEN_PATH, dt: float = car_stats.physics_dt) -> List[str]:
+    """
+    Record the reference traces of every script on the reference tracks: the sample track and a generated one.
+
+    :param output_path: folder the traces are written to, one .npz file per track and script
+    :param dt: simulation step
+    :return: written files
+    """
+    import track_generator
+
+    os.makedirs(output_path, exist_ok=True)
+    written = []
+    with tempfile.TemporaryDirectory() as folder:
+        generated = f"{folder}/generated/"
+        track_generator.generate_track(GENERATED_TRACK_SEED).write_folder(generated)
+        for name, track_path in (("drawer", paths.DEFAULT_TRACK_PATH), ("generated", generated)):
+            track = GoldenTrack.from_folder(name, track_path)
+            named = scripts(track_path)
+            for script, trace in zip(named, run_car(track, list(named.values()), dt), strict=True):
+                golden = Golden(track, script, dt, named[script], trace)
+                filename = os.path.join(output_path, f"{golden.name}.npz")
+                golden.save(filename)
+                written.append(filename)
+    return written
+
+
+@dataclass
+class TraceReport:
+    """
+    Comparison of a trace with its reference.
+    """
+
+    name: str
+    steps: int
+    max_errors: Dict[str, float] = field(default_factory=dict)
+    divergence: Tuple[str, int, float] | None = None  # first (field, step, error) out of tolerance
+
+    def __str__(self) -> str:
+        errors = ", ".join(f"{name} {error:.2e}" for name, error in self.max_errors.items())
+        if self.divergence is None:
+            return f"{self.name}: OK over {self.steps} steps (max errors: {errors})"
+        name, step, error = self.divergence
+        return f"{self.name}: DIVERGES at step {step} on {name} (error {error:.3e}; max errors: {errors})"
+
+
+def compare(reference: Trace, trace: Trace, tolerances: Tolerances, name: str = "") -> TraceReport:
+    """
+    Compare a trace with its reference, step by step.
+
+    :param reference: trace of the reference engine
+    :param trace: trace of the engine under test
+    :param tolerances: accepted differences
+    :param name: name of the report
+    :return: TraceReport with the largest error of every field and the first step out of tolerance
+    """
+    report = TraceReport(name, len(reference))
+    if len(trace) != len(reference):
+        report.divergence = ("steps", min(len(trace), len(reference)), float(abs(len(trace) - len(reference))))
+        return report
+    errors = {
+        "position": (np.hypot(trace.x - reference.x, trace.y - reference.y), tolerances.position),
+        "heading": (np.abs((trace.heading - reference.heading + 180) % 360 - 180), tolerances.heading),
+        "velocity": (np.linalg.norm(trace.velocity - reference.velocity, axis=1), tolerances.velocity),
+        "distances": (np.abs(trace.distances - reference.distances).max(axis=1), tolerances.distances),
+        "alive": ((trace.alive != reference.alive).astype(float), 0.0),
+        "completed": ((trace.completed != reference.completed).astype(float), 0.0),
+        "next_gate": (np.abs(trace.next_gate - reference.next_gate).astype(float), 0.0),
+    }
+    first = len(reference)
+    for name, (error, tolerance) in errors.items():
+        report.max_errors[name] = float(error.max()) if len(error) else 0.0
+        over = np.flatnonzero(error > tolerance)
+        if len(over) and over[0] < first:
+            first = int(over[0])
+            report.divergence = (name, first, float(error[first]))
+    return report
+
+
+def check(engine: str, golden_path: str = paths.GOLDEN_PATH, tolerances: Tolerances | None = None) -> List[TraceReport]:
+    """
+    Replay every recorded script with an engine and compare its traces with the references.
+
+    :param engine: name in ENGINES
+    :param golden_path: folder of the recorded traces
+    :param tolerances: accepted differences, defaults to Tolerances()
+    :return: one report per recorded trace
+    """
+    tolerances = tolerances or Tolerances()
+    goldens = [Golden.load(os.path.join(golden_path, f)) for f in sorted(os.listdir(golden_path)) if f.endswith(".npz")]
+    reports = []
+    # scripts of the same track and step run together, so that batch engines get all of them at once
+    groups: Dict[Tuple[str, float], List[Golden]] = {}
+    for golden in goldens:
+        groups.setdefault((golden.track.name, golden.dt), []).append(golden)
+    for (_, dt), group in groups.items():
+        traces = ENGINES[engine](group[0].track, [g.inputs for g in group], dt)
+        for golden, trace in zip(group, traces, strict=True):
+            reports.append(compare(golden.trace, trace, tolerances, golden.name))
+    return reports
@@ -4,6 +4,8 @@ Constants for pixels / distances
 
 """
 
+import paths
+
 resolution_width = 2560
 resolution_height = 1440
 
@@ -43,4 +45,20 @@ replay_viewer_font_size = 24
 replay_viewer_label_x = resolution_width - 300
 replay_viewer_label_y = resolution_height - 50
 
-car_image_path = "../images/car.png"
+dashboard_label_x = resolution_width - 1100
+
+car_image_path = f"{paths.IMAGES_PATH}car.png"
+
+ghost_opacity = 128
+race_opponent_color = (255, 150, 150)  # Tint of the AI cars in a race
+
+race_label_x = resolution_width - 900
+race_label_y = resolution_height - 50
+
+game_render_interval = 0.0  # 0 = redraw on every vsync, so high refresh displays get every frame
+
+profiler_label_font_name = "Courier New"
+profiler_label_font_size = 14
+profiler_label_x = 30
+profiler_label_y = resolution_height - 100
+profiler_label_width = 700
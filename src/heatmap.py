@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+import numpy as np
+from numpy.typing import NDArray
+
+import replay_analytics
+import utilities
+
+
+class PositionHeatmap:
+    """
+    2D histogram of car positions over a fixed bounding box. Points are accumulated in place,
+    so any number of replays or live episodes can be added one at a time.
+    """
+
+    def __init__(
+        self,
+        x_min: float,
+        y_min: float,
+        x_max: float,
+        y_max: float,
+        cell_size: float = 10.0,
+        rows: int | None = None,
+        columns: int | None = None,
+    ) -> None:
+        """
+        Create an empty heatmap.
+
+        :param x_min: left edge of the covered area
+        :param y_min: bottom edge of the covered area
+        :param x_max: right edge of the covered area
+        :param y_max: top edge of the covered area
+        :param cell_size: side of a cell in world units
+        :param rows: number of rows, computed from y_max when None
+        :param columns: number of columns, computed from x_max when None
+        :return: None
+        """
+        self.x_min: float = x_min
+        self.y_min: float = y_min
+        self.cell_size: float = cell_size
+        if columns is None:
+            columns = max(1, int(np.ceil((x_max - x_min) / cell_size)))
+        if rows is None:
+            rows = max(1, int(np.ceil((y_max - y_min) / cell_size)))
+        self.columns: int = columns
+        self.rows: int = rows
+        self.counts: NDArray[np.float64] = np.zeros((self.rows, self.columns), dtype=float)
+
+    @classmethod
+    def from_track(cls, track_path: str, cell_size: float = 10.0, margin: float = 20.0) -> PositionHeatmap:
+        """
+        Create an empty heatmap covering the bounding box of a track.
+
+        :param track_path: Path to the track folder
+        :param cell_size: side of a cell in world units
+        :param margin: extra space around the borders
+        :return: PositionHeatmap
+        """
+        borders = utilities.segments_to_array(utilities.load_track_segments(track_path))
+        xs = borders[:, [0, 2]]
+        ys = borders[:, [1, 3]]
+        return cls(
+            float(xs.min()) - margin,
+            float(ys.min()) - margin,
+            float(xs.max()) + margin,
+            float(ys.max()) + margin,
+            cell_size,
+        )
+
+    def add_points(
+        self, x: NDArray[np.float64], y: NDArray[np.float64], weights: NDArray[np.float64] | None = None
+    ) -> None:
+        """
+        Accumulate positions. Points outside the bounding box are ignored.
+
+        :param x: positions x
+        :param y: positions y
+        :param weights: optional weight of every position (defaults to 1)
+        :return: None
+        """
+        columns = np.floor((np.asarray(x) - self.x_min) / self.cell_size).astype(np.int64)
+        rows = np.floor((np.asarray(y) - self.y_min) / self.cell_size).astype(np.int64)
+        inside = (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows)
+        cells = rows[inside] * self.columns + columns[inside]
+        w = None if weights is None else np.asarray(weights, dtype=float)[inside]
+        self.counts += np.bincount(cells, weights=w, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def add_replay(self, arrays: replay_analytics.ReplayArrays, weight_by_time: bool = True) -> None:
+        """
+        Accumulate the frames of a replay while the car is alive. Weighting by time makes cells
+        where the car is slow (or stopped) stand out.
+
+        :param arrays: replay columns
+        :param weight_by_time: weight every frame by the time spent in it instead of counting frames
+        :return: None
+        """
+        alive = arrays.alive
+        weights = None
+        if weight_by_time:
+            weights = np.diff(arrays.time, prepend=arrays.time[:1])[alive]
+        self.add_points(arrays.x[alive], arrays.y[alive], weights)
+
+    def add_crash(self, arrays: replay_analytics.ReplayArrays) -> None:
+        """
+        Accumulate only the crash point of a replay (nothing if the car did not crash).
+
+        :param arrays: replay columns
+        :return: None
+        """
+        crash = replay_analytics.crash_location(arrays)
+        if crash is not None:
+            self.add_points(np.array([crash[0]]), np.array([crash[1]]))
+
+    def add_replay_files(self, filenames: Iterable[str], weight_by_time: bool = True, crashes: bool = False) -> int:
+        """
+        Stream replay files into the heatmap, loading one at a time.
+
+        :param filenames: replay files inside the replay folder
+        :param weight_by_time: see add_replay
+        :param crashes: accumulate crash points only
+        :return: number of replays added
+        """
+        added = 0
+        for filename in filenames:
+            arrays = replay_analytics.load_replay_arrays(filename)
+            if crashes:
+                self.add_crash(arrays)
+            else:
+                self.add_replay(arrays, weight_by_time)
+            added += 1
+        return added
+
+    def merge(self, other: PositionHeatmap) -> None:
+        """
+        Add the counts of a heatmap with the same grid (e.g. computed by another worker).
+
+        :param other: heatmap to add
+        :return: None
+        """
+        if other.counts.shape != self.counts.shape or (other.x_min, other.y_min, other.cell_size) != (
+            self.x_min,
+            self.y_min,
+            self.cell_size,
+        ):
+            raise ValueError("Heatmaps have different grids")
+        self.counts += other.counts
+
+    def save(self, filename: str) -> None:
+        """
+        Save the heatmap as a .npz file.
+
+        :param filename: path of the file
+        :return: None
+        """
+        np.savez_compressed(
+            filename, counts=self.counts, origin=np.array([self.x_min, self.y_min]), cell_size=self.cell_size
+        )
+
+    @classmethod
+    def load(cls, filename: str) -> PositionHeatmap:
+        """
+        Load a heatmap saved with save().
+
+        :param filename: path of the file
+        :return: PositionHeatmap
+        """
+        with np.load(filename) as data:
+            counts = data["counts"]
+            x_min, y_min = (float(v) for v in data["origin"])
+            cell_size = float(data["cell_size"])
+        # The grid comes from the saved counts: recomputing it from the far edges can round up to one
+        # more row or column
+        rows, columns = (int(v) for v in counts.shape)
+        heatmap = cls(
+            x_min, y_min, x_min + columns * cell_size, y_min + rows * cell_size, cell_size, rows=rows, columns=columns
+        )
+        heatmap.counts += counts
+        return heatmap
+
+    def to_rgba(self, log_scale: bool = True) -> NDArray[np.uint8]:
+        """
+        Color the heatmap (black-red-yellow-white ramp), with empty cells fully transparent.
+        Row 0 is the bottom row, as pyglet expects.
+
+        :param log_scale: compress the range with log1p, so sparse cells remain visible
+        :return: (rows, columns, 4) RGBA image
+        """
+        values = np.log1p(self.counts) if log_scale else self.counts.copy()
+        top = values.max()
+        if top > 0:
+            values /= top
+        rgba = np.zeros((self.rows, self.columns, 4), dtype=np.uint8)
+        rgba[..., 0] = np.clip(values * 3.0, 0.0, 1.0) * 255
+        rgba[..., 1] = np.clip(values * 3.0 - 1.0, 0.0, 1.0) * 255
+        rgba[..., 2] = np.clip(values * 3.0 - 2.0, 0.0, 1.0) * 255
+        rgba[..., 3] = np.where(self.counts > 0, 80 + values * 175, 0)
+        return rgba
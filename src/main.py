@@ -1,28 +1,648 @@
-from typing import Literal
+import argparse
+import fnmatch
+import glob
+import os
+from typing import TYPE_CHECKING, List, Sequence
 
-import drawer
-import game
-import graphics_constants
-import make_replay
-import viewer
+import paths
 
+if TYPE_CHECKING:
+    from profiler import FrameProfiler
 
-def main() -> None:
-    mode: Literal["play", "view", "draw"] = "play"
+# Subsystems are imported inside the command that needs them: the headless commands (train, bench,
+# convert) never load pyglet, and worker processes started with spawn, which re-import this module,
+# start without loading the game.
 
-    if mode == "play":
-        game1 = game.Game(
-            graphics_constants.resolution_width, graphics_constants.resolution_height, "../tracks/drawer/"
-        )
-        replay = game1.new_game()
-        replay.save_to_file("current.json")
-    elif mode == "view":
+
+def play(args: argparse.Namespace) -> None:
+    """
+    Drive on a track, with the keyboard or a saved policy, and save the replay.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import game
+    import graphics_constants
+    import policy
+    import replay_catalog
+
+    driver = policy.load_policy(args.policy) if args.policy else None
+    output = args.output or ("ai.json" if driver is not None else "current.json")
+    game1 = game.Game(
+        graphics_constants.resolution_width, graphics_constants.resolution_height, args.track, frame_profiler(args)
+    )
+    replay = game1.new_game(driver)
+    with replay_catalog.ReplayCatalog() as catalog:
+        replay.save_to_file(output, catalog)
+
+
+def view(args: argparse.Namespace) -> None:
+    """
+    Watch a replay, or several replays at once as ghosts.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import graphics_constants
+    import make_replay
+    import replay_analytics
+    import viewer
+    from heatmap import PositionHeatmap
+
+    filenames = replay_files(args.replays)
+    if not filenames:
+        raise SystemExit("No replay to view")
+    heatmap = PositionHeatmap.load(args.heatmap) if args.heatmap else None
+    if len(filenames) == 1 and filenames[0].endswith(".json"):
         replay = make_replay.Replay()
-        replay.load_from_file("test_json.json")
-        viewer1 = viewer.Viewer(graphics_constants.resolution_width, graphics_constants.resolution_height, replay)
+        replay.load_from_file(filenames[0])
+        viewer1 = viewer.Viewer(
+            graphics_constants.resolution_width,
+            graphics_constants.resolution_height,
+            replay,
+            heatmap,
+            frame_profiler(args),
+        )
         viewer1.view()
     else:
-        drawer.draw_track()
+        replays = [replay_analytics.load_replay_arrays(f) for f in filenames]
+        ghost_viewer = viewer.GhostViewer(
+            graphics_constants.resolution_width, graphics_constants.resolution_height, replays
+        )
+        ghost_viewer.view()
+
+
+def draw(args: argparse.Namespace) -> None:
+    """
+    Open the track drawer.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import drawer
+
+    drawer.draw_track()
+
+
+def train(args: argparse.Namespace) -> None:
+    """
+    Train a Q-table policy, optionally with the live dashboard.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import trainer
+
+    config = trainer.TrainerConfig(
+        track_path=args.track,
+        compiled=args.compiled,
+        environments=args.environments,
+        steps=args.steps,
+        action_repeat=args.action_repeat,
+        seed=args.seed,
+    )
+    if args.output:
+        config.policy_path = args.output
+    if args.telemetry:
+        config.telemetry_path = args.telemetry
+        config.telemetry_interval = args.telemetry_interval
+    if args.heatmap:
+        config.heatmap_path = args.heatmap
+    if args.dashboard:
+        import dashboard
+        import graphics_constants
+
+        training_dashboard = dashboard.TrainingDashboard(
+            graphics_constants.resolution_width, graphics_constants.resolution_height, config
+        )
+        training_dashboard.run()
+    else:
+        trainer.run_trainer(config)
+
+
+def bench(args: argparse.Namespace) -> None:
+    """
+    Time the batched simulation with random steering.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import time
+
+    import numpy as np
+
+    import car_stats
+    import simulation
+
+    cars = simulation.CarBatch.from_track(args.cars, args.track, args.compiled)
+    cars.calculate_distances(np.arange(args.cars))
+    rng = np.random.default_rng(0)
+    decisions = max(args.steps // args.repeat, 1)
+    controls = rng.random((decisions, 4, args.cars)) < 0.5
+    controls[:, 0] = True  # keep the cars moving
+    controls[:, 1] = False
+    start = time.perf_counter()
+    for throttle, brake, left, right in controls:
+        cars.step(throttle, brake, left, right, car_stats.physics_dt, args.repeat)
+    elapsed = time.perf_counter() - start
+    steps = decisions * args.repeat
+    print(
+        f"{args.cars} cars x {steps} steps (action repeat {args.repeat}) in {elapsed:.3f}s: "
+        f"{steps / elapsed:.1f} steps/s, {args.cars * steps / elapsed:.0f} car steps/s"
+    )
+
+
+def sweep(args: argparse.Namespace) -> None:
+    """
+    Drive a lap with every combination of car parameter values and rank them by lap time.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import time
+
+    import policy
+    import setup_sweep
+
+    try:
+        grid = setup_sweep.parse_grid(args.parameters)
+    except ValueError as error:
+        raise SystemExit(str(error)) from None
+    driver = policy.load_policy(args.policy) if args.policy else None
+    start = time.perf_counter()
+    results = setup_sweep.sweep(args.track, grid, driver, args.max_speed)
+    elapsed = time.perf_counter() - start
+    for result in results[: args.top]:
+        print(result)
+    completed = sum(result.completed for result in results)
+    print(f"{len(results)} setups in {elapsed:.1f}s, {completed} completed a lap")
+    if args.output:
+        setup_sweep.save_results(results, args.output)
+        print(f"Results saved to {args.output}")
+
+
+def race_cars(args: argparse.Namespace) -> None:
+    """
+    Race against AI cars and replay ghosts, or watch the AI cars race without a window.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import time
+
+    import policy
+    import race
+    import replay_analytics
+
+    driver = policy.load_policy(args.policy) if args.policy else None
+    ghosts = [replay_analytics.load_replay_arrays(f) for f in args.ghosts]
+    config = race.RaceConfig(
+        human=not args.headless, opponents=args.opponents, lanes=args.lanes, solid_ghosts=args.solid_ghosts
+    )
+    try:
+        session = race.Race(args.track, config, driver, ghosts)
+    except ValueError as error:
+        raise SystemExit(str(error)) from None
+
+    if args.headless:
+        start = time.perf_counter()
+        results = session.run()
+        elapsed = time.perf_counter() - start
+        for result in results:
+            print(result)
+        completed = sum(result.completed for result in results)
+        collided = sum(bool(result.collided_with) for result in results)
+        print(f"{len(results)} cars in {elapsed:.1f}s, {completed} finished, {collided} crashed into another car")
+        return
+
+    import game
+    import graphics_constants
+    import replay_catalog
+
+    race_game = game.RaceGame(graphics_constants.resolution_width, graphics_constants.resolution_height, session)
+    replay = race_game.run()
+    if replay.log:
+        with replay_catalog.ReplayCatalog() as catalog:
+            replay.save_to_file(args.output, catalog)
+
+
+def plan(args: argparse.Namespace) -> None:
+    """
+    Drive a reference lap with the lookahead planner and save its replay.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import time
+
+    import planner
+    import replay_catalog
+
+    config = planner.PlannerConfig(method=args.method, horizon=args.horizon, hold=args.hold, seed=args.seed)
+    if args.width is not None:
+        config.beam_width = args.width
+        config.candidates = args.width
+    start = time.perf_counter()
+    lap = planner.plan_lap(args.track, config)
+    elapsed = time.perf_counter() - start
+    status = f"lap in {lap.lap_time:.3f}s" if lap.completed else f"no lap, stopped after {lap.lap_time:.3f}s"
+    print(f"Planner: {status} ({len(lap.actions)} steps, planned in {elapsed:.1f}s)")
+    with replay_catalog.ReplayCatalog() as catalog:
+        lap.replay.save_to_file(args.output, catalog)
+    print(f"Replay saved to {args.output}")
+
+
+def benchmark(args: argparse.Namespace) -> None:
+    """
+    Run the benchmark suite, save the results and compare them with a baseline.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import benchmarks
+
+    results = benchmarks.run_benchmarks(args.track, args.names, args.repeat)
+    benchmarks.save_results(results, args.output)
+    print(f"Results saved to {args.output}")
+    if args.baseline:
+        benchmarks.print_comparison(benchmarks.compare(results, benchmarks.load_results(args.baseline)))
+
+
+def golden(args: argparse.Namespace) -> None:
+    """
+    Record the golden traces of the reference car, or check an engine against them.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import golden_traces
+
+    if args.action == "record":
+        written = golden_traces.record(args.folder)
+        print(f"{len(written)} traces written to {args.folder}")
+        return
+    reports = golden_traces.check(args.engine, args.folder)
+    for report in reports:
+        print(report)
+    diverging = [report for report in reports if report.divergence is not None]
+    if diverging:
+        raise SystemExit(f"{len(diverging)} of {len(reports)} trace(s) diverge")
+    print(f"All {len(reports)} traces match")
+
+
+def convert(args: argparse.Namespace) -> None:
+    """
+    Convert JSON replays to .npz column files next to them.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import replay_analytics
+
+    for filename in replay_files(args.replays, extension=".json"):
+        arrays = replay_analytics.load_replay_arrays(filename)
+        output = f"{os.path.splitext(filename)[0]}.npz"
+        replay_analytics.save_replay_arrays(arrays, output)
+        print(f"{filename} -> {output} ({len(arrays)} frames)")
+
+
+def summarize(args: argparse.Namespace) -> None:
+    """
+    Print the lap, gate and speed summary of replays, optionally saving the full table as CSV.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import replay_analytics
+
+    filenames = replay_files(args.replays)
+    if not filenames:
+        raise SystemExit("No replay to summarize")
+    table = replay_analytics.summarize(filenames, args.workers)
+    for row in table:
+        if row["completed"]:
+            result = f"lap {row['lap_time']:.3f}s"
+        else:
+            result = "crashed" if row["crashed"] else "no lap"
+        print(
+            f"{row['filename']}: {result}, {row['gates_reached']} gates, {row['distance']:.0f} px, "
+            f"max speed {row['max_speed']:.1f}"
+        )
+    if args.output:
+        replay_analytics.save_summary_csv(table, args.output)
+        print(f"Summary of {len(table)} replays saved to {args.output}")
+
+
+def render(args: argparse.Namespace) -> None:
+    """
+    Render replays to PNG files without a window: every frame of every replay, or one contact sheet per replay.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import rasterizer
+
+    filenames = replay_files(args.replays)
+    if not filenames:
+        raise SystemExit("No replay to render")
+    options = {"scale": args.scale} if args.scale else {}
+    if args.contact_sheet:
+        written = rasterizer.export_contact_sheets(filenames, args.output, workers=args.workers, **options)
+        print(f"{len(written)} contact sheets written to {args.output}")
+        return
+    for filename in filenames:
+        folder = os.path.join(args.output, os.path.splitext(filename)[0])
+        frames = rasterizer.export_frames(filename, folder, args.step, workers=args.workers, **options)
+        print(f"{filename}: {len(frames)} frames written to {folder}")
+
+
+def build_heatmap(args: argparse.Namespace) -> None:
+    """
+    Accumulate the positions (or crash points) of replays into a heatmap and save it.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import replay_catalog
+    from heatmap import PositionHeatmap
+
+    if args.best or args.crash_gate is not None:
+        with replay_catalog.ReplayCatalog() as catalog:
+            catalog.sync()
+            if args.best:
+                entries = catalog.best_laps(args.track, args.best)
+            else:
+                entries = catalog.crashes_near_gate(args.track, args.crash_gate)
+        filenames = [entry.filename for entry in entries]
+    else:
+        filenames = replay_files(args.replays)
+    if not filenames:
+        raise SystemExit("No replay to add")
+    position_heatmap = PositionHeatmap.from_track(args.track, args.cell_size)
+    added = position_heatmap.add_replay_files(filenames, crashes=args.crashes)
+    position_heatmap.save(args.output)
+    print(f"{added} replays added to {args.output}")
+
+
+def compile_track(args: argparse.Namespace) -> None:
+    """
+    Simplify the borders of a track and save its compiled form.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import track_compiler
+
+    _, reports, problems = track_compiler.compile_track(args.track, args.tolerance)
+    for report in reports:
+        print(report)
+    report_problems(problems)
+
+
+def validate(args: argparse.Namespace) -> None:
+    """
+    Check a track for crossing borders, gates that miss a border and a bad start pose.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import track_validator
+
+    report_problems(track_validator.validate_track(args.track))
+
+
+def report_problems(problems: Sequence[object]) -> None:
+    """
+    Print track problems, exiting with an error status when there is any.
+
+    :param problems: problems found by track_validator
+    :return: None
+    """
+    for problem in problems:
+        print(problem)
+    if problems:
+        raise SystemExit(f"{len(problems)} problem(s) found")
+    print("Track is valid")
+
+
+def gates(args: argparse.Namespace) -> None:
+    """
+    Replace the gates of a track with gates generated along its centerline.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import centerline
+
+    generated = centerline.generate_gates(args.track, args.count, args.curvature)
+    centerline.save_gates(args.track, generated)
+    print(f"{len(generated)} gates written to {args.track}gates.txt")
+
+
+def generate(args: argparse.Namespace) -> None:
+    """
+    Generate random tracks, one per seed.
+
+    :param args: parsed command line
+    :return: None
+    """
+    import track_generator
+
+    seeds = range(args.seed, args.seed + args.count)
+    written = track_generator.generate_tracks(seeds, args.output, args.workers)
+    print(f"{len(written)} tracks written to {args.output}")
+
+
+def frame_profiler(args: argparse.Namespace) -> "FrameProfiler | None":
+    """
+    :param args: parsed command line, with the --profile and --profile-log options
+    :return: profiler asked for on the command line, None when profiling is off
+    """
+    if not args.profile and not args.profile_log:
+        return None
+    import profiler
+
+    return profiler.FrameProfiler(log_path=args.profile_log, show_overlay=args.profile)
+
+
+def replay_files(names: Sequence[str], extension: str = ".json") -> List[str]:
+    """
+    Expand the replay names given on the command line; names may be glob patterns, matched against the
+    replay files (.json and .npz) of the replay folder, and no name means every replay in the replay folder.
+
+    :param names: replay file names (or patterns) inside the replay folder
+    :param extension: extension of the files taken from the folder
+    :return: replay file names
+    """
+    if not names:
+        return sorted(f for f in os.listdir(paths.REPLAYS_PATH) if f.endswith(extension))
+    filenames: List[str] = []
+    for name in names:
+        if glob.has_magic(name):
+            replays = (f for f in os.listdir(paths.REPLAYS_PATH) if f.endswith((".json", ".npz")))
+            filenames.extend(sorted(fnmatch.filter(replays, name)))
+        else:
+            filenames.append(name)
+    return filenames
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    :param parser: parser of a windowed command
+    :return: None
+    """
+    parser.add_argument("--profile", action="store_true", help="show the time spent in every phase of a frame")
+    parser.add_argument("--profile-log", help="append the frame phase timings to this file every few seconds")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    :return: parser of the command line, one subcommand per tool
+    """
+    parser = argparse.ArgumentParser(prog="main.py", description="Time attack racing game and its tools")
+    commands = parser.add_subparsers(dest="command")
+
+    play_parser = commands.add_parser("play", help="drive the car (default command)")
+    play_parser.add_argument("--track", default=paths.DEFAULT_TRACK_PATH, help="track folder")
+    play_parser.add_argument("--policy", help="let a saved policy (.npz) drive instead of the keyboard")
+    play_parser.add_argument("--output", help="replay file to save, inside the replay folder")
+    add_profile_arguments(play_parser)
+    play_parser.set_defaults(handler=play)
+
+    view_parser = commands.add_parser("view", help="watch one replay, or several replays as ghosts")
+    view_parser.add_argument("replays", nargs="*", help="replay files inside the replay folder (default: all)")
+    view_parser.add_argument("--heatmap", help="heatmap (.npz) drawn under a single replay")
+    add_profile_arguments(view_parser)
+    view_parser.set_defaults(handler=view)
+
+    draw_parser = commands.add_parser("draw", help="draw a new track")
+    draw_parser.set_defaults(handler=draw)
+
+    train_parser = commands.add_parser("train", help="train a driving policy with Q-learning")
+    train_parser.add_argument("--track", default=paths.DEFAULT_TRACK_PATH, help="track folder")
+    train_parser.add_argument("--compiled", action="store_true", help="use the simplified borders saved by compile")
+    train_parser.add_argument("--environments", type=int, default=64, help="cars simulated in parallel")
+    train_parser.add_argument("--steps", type=int, default=200_000, help="batched decision steps")
+    train_parser.add_argument("--action-repeat", type=int, default=1, help="physics steps every action is held for")
+    train_parser.add_argument("--seed", type=int, default=0, help="random seed")
+    train_parser.add_argument("--output", help="policy file to save")
+    train_parser.add_argument("--dashboard", action="store_true", help="watch the cars while training")
+    train_parser.add_argument("--telemetry", help="stream training metrics to this .jsonl or .csv file")
+    train_parser.add_argument("--telemetry-interval", type=float, default=5.0, help="seconds between metric rows")
+    train_parser.add_argument("--heatmap", help="save a heatmap (.npz) of the positions driven during training")
+    train_parser.set_defaults(handler=train)
+
+    bench_parser = commands.add_parser("bench", help="measure the batched simulation throughput")
+    bench_parser.add_argument("--track", default=paths.DEFAULT_TRACK_PATH, help="track folder")
+    bench_parser.add_argument("--compiled", action="store_true", help="use the simplified borders saved by compile")
+    bench_parser.add_argument("--cars", type=int, default=256, help="cars simulated at once")
+    bench_parser.add_argument("--steps", type=int, default=200, help="steps to time")
+    bench_parser.add_argument("--repeat", type=int, default=1, help="physics steps every action is held for")
+    bench_parser.set_defaults(handler=bench)
+
+    sweep_parser = commands.add_parser("sweep", help="compare the lap times of car parameter combinations")
+    sweep_parser.add_argument("parameters", nargs="+", help="values to try, as name=v1,v2,... (see car_stats)")
+    sweep_parser.add_argument("--track", default=paths.DEFAULT_TRACK_PATH, help="track folder")
+    sweep_parser.add_argument("--policy", help="drive with a saved policy instead of the centerline driver")
+    sweep_parser.add_argument("--max-speed", type=float, default=500.0, help="speed limit of the centerline driver")
+    sweep_parser.add_argument("--top", type=int, default=20, help="setups to print")
+    sweep_parser.add_argument("--output", help="CSV file to write every result to")
+    sweep_parser.set_defaults(handler=sweep)
+
+    race_parser = commands.add_parser("race", help="race against AI cars and replay ghosts")
+    race_parser.add_argument("ghosts", nargs="*", help="replay files raced against as ghosts, inside the replay folder")
+    race_parser.add_argument("--track", default=paths.DEFAULT_TRACK_PATH, help="track folder")
+    race_parser.add_argument("--opponents", type=int, default=7, help="AI cars")
+    race_parser.add_argument("--policy", help="drive the AI cars with a saved policy instead of the centerline driver")
+    race_parser.add_argument("--lanes", type=int, default=1, help="cars side by side on the starting grid")
+    race_parser.add_argument("--solid-ghosts", action="store_true", help="crash into the ghosts instead of through")
+    race_parser.add_argument("--headless", action="store_true", help="race the AI cars without a window")
+    race_parser.add_argument("--output", default="race.json", help="replay file of the human car, in the replay folder")
+    race_parser.set_defaults(handler=race_cars)
+
+    plan_parser = commands.add_parser("plan", help="drive a reference lap with the lookahead planner")
+    plan_parser.add_argument("--track", default=paths.DEFAULT_TRACK_PATH, help="track folder")
+    plan_parser.add_argument("--method", choices=("beam", "random"), default="beam", help="search method")
+    plan_parser.add_argument("--width", type=int, help="beam width, or random sequences per decision")
+    plan_parser.add_argument("--horizon", type=int, default=12, help="actions looked ahead")
+    plan_parser.add_argument("--hold", type=int, default=5, help="simulation steps every action is held")
+    plan_parser.add_argument("--seed", type=int, default=0, help="random seed")
+    plan_parser.add_argument("--output", default="planner.json", help="replay file to save")
+    plan_parser.set_defaults(handler=plan)
+
+    benchmark_parser = commands.add_parser("benchmark", help="run the benchmark suite of the simulation hot paths")
+    benchmark_parser.add_argument("names", nargs="*", help="run only the benchmarks whose name contains one of these")
+    benchmark_parser.add_argument("--track", default=paths.DEFAULT_TRACK_PATH, help="track folder")
+    benchmark_parser.add_argument("--repeat", type=int, default=5, help="timed runs of every benchmark")
+    benchmark_parser.add_argument("--output", default=f"{paths.BENCHMARKS_PATH}results.json", help="JSON file to write")
+    benchmark_parser.add_argument("--baseline", help="results JSON file to compare with")
+    benchmark_parser.set_defaults(handler=benchmark)
+
+    golden_parser = commands.add_parser("golden", help="record reference traces or check an engine against them")
+    golden_parser.add_argument("action", choices=("record", "check"))
+    golden_parser.add_argument("--engine", default="batch", help="engine to check: car or batch")
+    golden_parser.add_argument("--folder", default=paths.GOLDEN_PATH, help="folder of the traces")
+    golden_parser.set_defaults(handler=golden)
+
+    convert_parser = commands.add_parser("convert", help="convert JSON replays to column .npz files")
+    convert_parser.add_argument("replays", nargs="*", help="replay files inside the replay folder (default: all)")
+    convert_parser.set_defaults(handler=convert)
+
+    summarize_parser = commands.add_parser("summarize", help="summarize replays: lap times, gates and speeds")
+    summarize_parser.add_argument("replays", nargs="*", help="replay files or patterns inside the replay folder")
+    summarize_parser.add_argument("--output", help="CSV file to save the full table to")
+    summarize_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    summarize_parser.set_defaults(handler=summarize)
+
+    render_parser = commands.add_parser("render", help="render replays to PNG frames or contact sheets")
+    render_parser.add_argument("replays", nargs="*", help="replay files or patterns inside the replay folder")
+    render_parser.add_argument("--output", default=paths.resolve("../renders/"), help="folder the images go to")
+    render_parser.add_argument("--contact-sheet", action="store_true", help="one sheet of thumbnails per replay")
+    render_parser.add_argument("--step", type=int, default=1, help="render every step-th frame")
+    render_parser.add_argument("--scale", type=float, help="image pixels per world unit")
+    render_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    render_parser.set_defaults(handler=render)
+
+    heatmap_parser = commands.add_parser("heatmap", help="build a position heatmap from replays")
+    heatmap_parser.add_argument("replays", nargs="*", help="replay files or patterns inside the replay folder")
+    heatmap_parser.add_argument("--track", default=paths.DEFAULT_TRACK_PATH, help="track folder")
+    heatmap_parser.add_argument("--best", type=int, default=0, help="use the N best laps of the catalog instead")
+    heatmap_parser.add_argument("--crash-gate", type=int, help="use the catalog replays that crashed near this gate")
+    heatmap_parser.add_argument("--crashes", action="store_true", help="add crash points only")
+    heatmap_parser.add_argument("--cell-size", type=float, default=10.0, help="side of a cell in pixels")
+    heatmap_parser.add_argument("--output", default="heatmap.npz", help="heatmap file to write")
+    heatmap_parser.set_defaults(handler=build_heatmap)
+
+    compile_parser = commands.add_parser("compile", help="simplify a track and save its compiled form")
+    compile_parser.add_argument("--track", default=paths.DEFAULT_TRACK_PATH, help="track folder")
+    compile_parser.add_argument("--tolerance", type=float, default=1.0, help="max border error in pixels")
+    compile_parser.set_defaults(handler=compile_track)
+
+    validate_parser = commands.add_parser("validate", help="check a track for geometry problems")
+    validate_parser.add_argument("--track", default=paths.DEFAULT_TRACK_PATH, help="track folder")
+    validate_parser.set_defaults(handler=validate)
+
+    gates_parser = commands.add_parser("gates", help="generate the gates of a track from its borders")
+    gates_parser.add_argument("--track", default=paths.DEFAULT_TRACK_PATH, help="track folder")
+    gates_parser.add_argument("--count", type=int, default=64, help="number of gates")
+    gates_parser.add_argument("--curvature", type=float, default=0.0, help="put more gates in corners")
+    gates_parser.set_defaults(handler=gates)
+
+    generate_parser = commands.add_parser("generate", help="generate random tracks for training")
+    generate_parser.add_argument("--count", type=int, default=100, help="number of tracks")
+    generate_parser.add_argument("--seed", type=int, default=0, help="seed of the first track, the others follow")
+    generate_parser.add_argument("--output", default="../tracks/generated/", help="folder the tracks are written to")
+    generate_parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+    generate_parser.set_defaults(handler=generate)
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args = parser.parse_args(["play"])
+    args.handler(args)
 
 
 if __name__ == "__main__":
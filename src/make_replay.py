@@ -1,7 +1,15 @@
 from __future__ import annotations
 
 import json
-from typing import Dict, List, Mapping
+from typing import TYPE_CHECKING, List
+
+import action_codes
+import paths
+
+if TYPE_CHECKING:
+    from replay_catalog import ReplayCatalog
+
+REPLAYS_PATH = paths.REPLAYS_PATH
 
 
 class Replay:
@@ -19,7 +27,7 @@ class Replay:
             heading: float,
             alive: bool,
             completed: bool,
-            pressed_keys: Mapping[int, bool],
+            action: int,
         ):
             """
             Create new frame
@@ -31,7 +39,7 @@ class Replay:
             :param heading: angle of the car at this frame
             :param alive: boolean stating if the car is still running
             :param completed: boolean stating if the lap is completed
-            :param pressed_keys: dictionary stating the key pressed at this frame
+            :param action: action code of the controls held at this frame (see action_codes)
             """
             self.frame: int = frame_number
             self.dt: float = delta_time
@@ -40,7 +48,7 @@ class Replay:
             self.heading: float = heading
             self.alive: bool = alive
             self.completed: bool = completed
-            self.keys: Dict[int, bool] = dict(pressed_keys)
+            self.action: int = action
 
         def to_dict(self) -> dict:
             """
@@ -55,7 +63,7 @@ class Replay:
                 "heading": self.heading,
                 "alive": self.alive,
                 "completed": self.completed,
-                "keys": self.keys,
+                "action": self.action,
             }
 
         @staticmethod
@@ -73,7 +81,7 @@ class Replay:
                 heading=d["heading"],
                 alive=d["alive"],
                 completed=d["completed"],
-                pressed_keys=d["keys"],
+                action=frame_action(d),
             )
 
     def __init__(self, track_path: str | None = None) -> None:
@@ -102,27 +110,49 @@ class Replay:
         """
         self.log = []
 
-    def save_to_file(self, filename: str) -> None:
+    def save_to_file(self, filename: str, catalog: ReplayCatalog | None = None, folder: str | None = None) -> None:
         """
         Save replay as JSON file
 
         :param filename: name of the replay file
+        :param catalog: optional replay catalog the saved file is indexed in
+        :param folder: folder of the replay file, ending with a slash; by default the catalog's folder,
+                       or REPLAYS_PATH without a catalog
         :return: None
         """
+        if folder is None:
+            folder = catalog.replays_path if catalog is not None else REPLAYS_PATH
+        elif catalog is not None and folder != catalog.replays_path:
+            raise ValueError(f"Replay folder {folder} is not the catalog folder {catalog.replays_path}")
         data = {"track_path": self.track_path, "frames": [frame.to_dict() for frame in self.log]}
-        with open(f"../replays/{filename}", "w", encoding="utf-8") as f:
+        with open(f"{folder}{filename}", "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2)
+        if catalog is not None:
+            catalog.add(filename, self)
 
-    def load_from_file(self, filename: str) -> None:
+    def load_from_file(self, filename: str, folder: str = REPLAYS_PATH) -> None:
         """
         Load replay from JSON file
 
         :param filename: name of the replay file
+        :param folder: folder of the replay file, ending with a slash
         :return: None
         """
         self.reset()
-        with open(f"../replays/{filename}", "r", encoding="utf-8") as f:
+        with open(f"{folder}{filename}", "r", encoding="utf-8") as f:
             data = json.load(f)
             self.track_path = data.get("track_path")
             for frame_dict in data["frames"]:
                 self.add(Replay.Frame.from_dict(frame_dict))
+
+
+def frame_action(d: dict) -> int:
+    """
+    Action code of a saved frame. Replays saved before action codes stored the dictionary of pressed keys.
+
+    :param d: frame dictionary
+    :return: action code
+    """
+    if "action" in d:
+        return int(d["action"])
+    return action_codes.from_saved_keys(d.get("keys", {}))
@@ -0,0 +1,30 @@
+import os
+
+# Folder containing the source files; every data folder of the project is located relative to it
+SOURCE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+def resolve(path: str) -> str:
+    """
+    Resolve a path written relative to src/ (as stored in replays and configs) against the location
+    of the package, so that it does not depend on the working directory. Absolute paths are returned
+    unchanged and a trailing slash is kept, since folder paths are joined by concatenation.
+
+    :param path: path relative to src/ or absolute path
+    :return: absolute path
+    """
+    if os.path.isabs(path):
+        return path
+    resolved = os.path.normpath(os.path.join(SOURCE_PATH, path))
+    return resolved + "/" if path.endswith(("/", os.sep)) else resolved
+
+
+# Track folders are kept relative in replays, so recordings stay valid when the project moves
+DEFAULT_TRACK_PATH = "../tracks/drawer/"
+
+TRACKS_PATH = resolve("../tracks/")
+REPLAYS_PATH = resolve("../replays/")
+POLICIES_PATH = resolve("../policies/")
+IMAGES_PATH = resolve("../images/")
+BENCHMARKS_PATH = resolve("../benchmarks/")
+GOLDEN_PATH = resolve("../golden/")
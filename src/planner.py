@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import List
+
+import numpy as np
+from numpy.typing import NDArray
+
+import car_stats
+import centerline
+import make_replay
+import policy
+import simulation
+from car_state import BatchState
+
+FloatArray = NDArray[np.float64]
+IntArray = NDArray[np.int64]
+
+METHODS = ("beam", "random")
+REPEAT_PROBABILITY = 0.5  # Chance that a random plan keeps the previous action, so plans hold turns
+FINISH_BONUS = 1e6  # Score of a finished lap, minus its time in milliseconds
+
+
+@dataclass
+class PlannerConfig:
+    """
+    Settings of the lookahead planner.
+    """
+
+    method: str = "beam"  # "beam" search over every action, or "random" Monte Carlo action sequences
+    horizon: int = 12  # Actions looked ahead
+    hold: int = 5  # Simulation steps every action is held
+    beam_width: int = 12  # Best partial plans kept at every depth of the beam search
+    candidates: int = 96  # Random action sequences tried per decision
+    crash_penalty: float = 1000.0  # Pixels of progress a crash costs
+    max_time: float = 60.0  # A lap is abandoned after this many seconds
+    dt: float = car_stats.physics_dt
+    seed: int = 0
+
+
+@dataclass
+class PlannedLap:
+    """
+    A lap driven by the planner.
+    """
+
+    actions: List[int] = field(default_factory=list)  # index in policy.ACTIONS of every simulation step
+    replay: make_replay.Replay = field(default_factory=make_replay.Replay)
+    completed: bool = False
+    lap_time: float = 0.0
+
+
+class Planner:
+    def __init__(self, track_path: str, config: PlannerConfig):
+        """
+        Chooses actions by simulating candidate action sequences from the current car state, all at once in
+        a CarBatch, and keeping the sequence that drives the farthest along the centerline.
+
+        :param track_path: Path to the track folder
+        :param config: planner settings
+        """
+        self.config: PlannerConfig = config
+        if config.method not in METHODS:
+            raise ValueError(f"Unknown planning method {config.method!r}, expected one of {METHODS}")
+        self.rng: np.random.Generator = np.random.default_rng(config.seed)
+        self.index: centerline.CenterlineIndex = centerline.track_index(track_path)
+        actions = len(policy.ACTIONS)
+        count = config.beam_width * actions if config.method == "beam" else config.candidates
+        self.rollouts: simulation.CarBatch = simulation.CarBatch.from_track(max(count, actions), track_path)
+        self.rollouts.sensors = False
+        # Best plan of the previous decision, shifted by one action to seed the next one
+        self.plan: IntArray = np.ones(config.horizon, dtype=np.int64)
+
+    def choose(self, state: BatchState) -> int:
+        """
+        :param state: state of the car to drive (a BatchState of one car)
+        :return: index in policy.ACTIONS of the action to hold for the next config.hold steps
+        """
+        if self.config.method == "beam":
+            return self._beam(state)
+        return self._random(state)
+
+    def _advance(self, actions: IntArray, count: int) -> None:
+        """
+        Hold one action per car for config.hold steps.
+        """
+        controls = np.zeros((self.rollouts.count, 4), dtype=bool)
+        controls[:count] = policy.ACTION_CONTROLS[actions]
+        self.rollouts.step(
+            controls[:, 0], controls[:, 1], controls[:, 2], controls[:, 3], self.config.dt, self.config.hold
+        )
+
+    def _progress(self, count: int) -> FloatArray:
+        cars = self.rollouts
+        progress, _ = self.index.project(np.stack([cars.x[:count], cars.y[:count]], axis=1))
+        return progress
+
+    def _scores(self, progress: FloatArray, count: int) -> FloatArray:
+        """
+        Rank rollouts: finished laps first (earliest finish best), then by progress, crashes last.
+        """
+        cars = self.rollouts
+        scores = progress - self.config.crash_penalty * ~cars.alive[:count]
+        finished = cars.completed[:count]
+        return np.asarray(np.where(finished, FINISH_BONUS - 1000 * cars.last_timer[:count], scores))
+
+    def _random(self, state: BatchState) -> int:
+        cfg = self.config
+        count = cfg.candidates
+        plans = np.empty((count, cfg.horizon), dtype=np.int64)
+        plans[:, 0] = self.rng.integers(0, len(policy.ACTIONS), count)
+        for k in range(1, cfg.horizon):
+            repeat = self.rng.random(count) < REPEAT_PROBABILITY
+            plans[:, k] = np.where(repeat, plans[:, k - 1], self.rng.integers(0, len(policy.ACTIONS), count))
+        plans[0, :-1] = self.plan[1:]
+        plans[0, -1] = self.plan[-1]
+
+        self.rollouts.restore(state, np.arange(count))
+        previous = self._progress(count)
+        progress = np.zeros(count)
+        for k in range(cfg.horizon):
+            self._advance(plans[:, k], count)
+            current = self._progress(count)
+            progress += self.index.progress_delta(previous, current)
+            previous = current
+        best = int(np.argmax(self._scores(progress, count)))
+        self.plan = plans[best]
+        return int(plans[best, 0])
+
+    def _beam(self, state: BatchState) -> int:
+        cfg = self.config
+        actions = len(policy.ACTIONS)
+        # every node of the beam is expanded with every action; nodes are identified by their first action
+        self.rollouts.restore(state, np.arange(actions))
+        self.rollouts.alive[actions:] = False  # unused rollouts are not simulated
+        first = np.arange(actions)
+        taken = np.arange(actions)
+        progress = np.zeros(actions)
+        previous = self._progress(actions)
+        for depth in range(cfg.horizon):
+            count = len(taken)
+            self._advance(taken, count)
+            current = self._progress(count)
+            progress = progress + self.index.progress_delta(previous, current)
+            scores = self._scores(progress, count)
+            if depth == cfg.horizon - 1:
+                return int(first[np.argmax(scores)])
+            kept = np.argsort(-scores, kind="stable")[: cfg.beam_width]
+            sources = np.repeat(kept, actions)
+            targets = np.arange(len(sources))
+            self.rollouts.clone(sources, targets)
+            self.rollouts.alive[len(targets) :] = False
+            first, progress, previous = first[sources], progress[sources], current[sources]
+            taken = np.tile(np.arange(actions), len(kept))
+        return int(first[0])
+
+
+def plan_lap(track_path: str, config: PlannerConfig | None = None) -> PlannedLap:
+    """
+    Drive one lap with the planner: it chooses an action, the car holds it for config.hold steps with the
+    full simulation (sensors included), and the planner chooses again from the new state.
+
+    :param track_path: Path to the track folder
+    :param config: planner settings
+    :return: PlannedLap, its replay can be watched and raced against like a recorded one
+    """
+    config = config or PlannerConfig()
+    planner = Planner(track_path, config)
+    car = simulation.CarBatch.from_track(1, track_path)
+    car.calculate_distances(np.arange(1))
+    lap = PlannedLap(replay=make_replay.Replay(track_path))
+    while car.alive[0] and not car.completed[0] and car.current_time[0] < config.max_time:
+        action = planner.choose(car.snapshot())
+        throttle, brake, left, right = (np.array([v]) for v in policy.ACTION_CONTROLS[action])
+        for _ in range(config.hold):
+            car.step(throttle, brake, left, right, config.dt)
+            lap.actions.append(action)
+            lap.replay.add(_frame(car, len(lap.replay.log), policy.ACTIONS[action]))
+            if not car.alive[0] or car.completed[0]:
+                break
+    lap.completed = bool(car.completed[0])
+    lap.lap_time = float(car.current_time[0])
+    return lap
+
+
+def _frame(car: simulation.CarBatch, number: int, action: int) -> make_replay.Replay.Frame:
+    return make_replay.Replay.Frame(
+        frame_number=number,
+        delta_time=float(car.current_time[0]),
+        x=float(car.x[0]),
+        y=float(car.y[0]),
+        heading=float(car.heading[0]),
+        alive=bool(car.alive[0]),
+        completed=bool(car.completed[0]),
+        action=action,
+    )
@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import abc
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+import action_codes
+import paths
+
+POLICIES_PATH = paths.POLICIES_PATH
+
+# Discrete actions available to a driving policy, as action codes; policies output an index in this list
+ACTIONS: List[int] = [
+    action_codes.NONE,
+    action_codes.THROTTLE,
+    action_codes.THROTTLE | action_codes.LEFT,
+    action_codes.THROTTLE | action_codes.RIGHT,
+    action_codes.LEFT,
+    action_codes.RIGHT,
+    action_codes.BRAKE,
+]
+
+# (actions, 4) table of throttle, brake, left, right for the vectorized simulation
+ACTION_CONTROLS: NDArray[np.bool_] = action_codes.decode(np.array(ACTIONS))
+
+distance_scale = 1000.0  # Sensor distances are divided by this in the observation
+speed_scale = 500.0  # Speed is divided by this in the observation
+FEATURES = 6  # Five sensor distances and the signed speed
+
+Features = NDArray[np.float64]
+
+
+def observation(distances: NDArray[np.float64], speed: NDArray[np.float64] | float) -> Features:
+    """
+    Build the policy input from sensor distances and signed speed (negative when reversing).
+    Works for a single car or for a batch of cars.
+
+    :param distances: (..., 5) sensor distances, as in Car.distances
+    :param speed: (...) signed speed
+    :return: (..., 6) features
+    """
+    speed_array = np.asarray(speed, dtype=float)[..., None]
+    return np.concatenate([np.asarray(distances, dtype=float) / distance_scale, speed_array / speed_scale], axis=-1)
+
+
+class Policy(abc.ABC):
+    """
+    Maps observations to an index in ACTIONS.
+    """
+
+    kind = ""
+
+    def act(self, features: Features) -> int:
+        """
+        :param features: (6,) observation of one car
+        :return: index of the chosen action
+        """
+        return int(self.act_batch(features[None, :])[0])
+
+    @abc.abstractmethod
+    def act_batch(self, features: Features) -> NDArray[np.int64]:
+        """
+        :param features: (N, 6) observations
+        :return: (N,) indices of the chosen actions
+        """
+
+    @abc.abstractmethod
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """
+        :return: the arrays that describe the policy, as saved to disk
+        """
+
+    def save(self, filename: str) -> None:
+        """
+        Save the policy as a .npz file
+
+        :param filename: path of the file
+        :return: None
+        """
+        np.savez(filename, kind=self.kind, **self.arrays())  # type: ignore[arg-type]
+
+
+class QTablePolicy(Policy):
+    """
+    Greedy policy over a Q-table indexed by discretized features.
+    """
+
+    kind = "qtable"
+
+    def __init__(self, q: NDArray[np.float64], distance_bins: Sequence[float], speed_bins: Sequence[float]) -> None:
+        """
+        :param q: (states, actions) Q-values
+        :param distance_bins: bin edges for every (scaled) sensor distance
+        :param speed_bins: bin edges for the (scaled) speed
+        """
+        self.distance_bins: NDArray[np.float64] = np.asarray(distance_bins, dtype=float)
+        self.speed_bins: NDArray[np.float64] = np.asarray(speed_bins, dtype=float)
+        self.q: NDArray[np.float64] = np.asarray(q, dtype=float)
+        if self.q.shape[0] != self.state_count(self.distance_bins, self.speed_bins):
+            raise ValueError("Q-table size does not match the bins")
+        distance_levels = len(self.distance_bins) + 1
+        # place value of every feature in the flattened state index
+        self.radix: NDArray[np.int64] = np.array([distance_levels**i for i in range(FEATURES)], dtype=np.int64)
+
+    @staticmethod
+    def state_count(distance_bins: NDArray[np.float64], speed_bins: NDArray[np.float64]) -> int:
+        return int((len(distance_bins) + 1) ** (FEATURES - 1) * (len(speed_bins) + 1))
+
+    def states(self, features: Features) -> NDArray[np.int64]:
+        """
+        :param features: (N, 6) observations
+        :return: (N,) Q-table rows
+        """
+        levels = np.empty(features.shape, dtype=np.int64)
+        levels[:, :-1] = np.searchsorted(self.distance_bins, features[:, :-1])
+        levels[:, -1] = np.searchsorted(self.speed_bins, features[:, -1])
+        return np.asarray(levels @ self.radix)
+
+    def act_batch(self, features: Features) -> NDArray[np.int64]:
+        return np.asarray(np.argmax(self.q[self.states(features)], axis=1))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"q": self.q, "distance_bins": self.distance_bins, "speed_bins": self.speed_bins}
+
+
+class LinearPolicy(Policy):
+    """
+    Greedy policy over linear action values: weights @ features + bias.
+    """
+
+    kind = "linear"
+
+    def __init__(self, weights: NDArray[np.float64], bias: NDArray[np.float64]) -> None:
+        """
+        :param weights: (actions, 6) weights
+        :param bias: (actions,) bias
+        """
+        self.weights: NDArray[np.float64] = np.asarray(weights, dtype=float)
+        self.bias: NDArray[np.float64] = np.asarray(bias, dtype=float)
+
+    def act_batch(self, features: Features) -> NDArray[np.int64]:
+        return np.asarray(np.argmax(features @ self.weights.T + self.bias, axis=1))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"weights": self.weights, "bias": self.bias}
+
+
+class MLPPolicy(Policy):
+    """
+    Greedy policy over the outputs of a small fully connected network with tanh hidden layers.
+    """
+
+    kind = "mlp"
+
+    def __init__(self, layers: Sequence[Tuple[NDArray[np.float64], NDArray[np.float64]]]) -> None:
+        """
+        :param layers: (weights, bias) of every layer, weights shaped (outputs, inputs)
+        """
+        self.layers: List[Tuple[NDArray[np.float64], NDArray[np.float64]]] = [
+            (np.asarray(w, dtype=float), np.asarray(b, dtype=float)) for w, b in layers
+        ]
+
+    def act_batch(self, features: Features) -> NDArray[np.int64]:
+        values = features
+        for i, (w, b) in enumerate(self.layers):
+            values = values @ w.T + b
+            if i < len(self.layers) - 1:
+                values = np.tanh(values)
+        return np.asarray(np.argmax(values, axis=1))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        arrays: Dict[str, np.ndarray] = {}
+        for i, (w, b) in enumerate(self.layers):
+            arrays[f"w{i}"] = w
+            arrays[f"b{i}"] = b
+        return arrays
+
+
+def load_policy(filename: str) -> Policy:
+    """
+    Load a policy saved with Policy.save
+
+    :param filename: path of the .npz file
+    :return: the policy
+    """
+    with np.load(filename) as data:
+        kind = str(data["kind"])
+        if kind == QTablePolicy.kind:
+            return QTablePolicy(data["q"], data["distance_bins"], data["speed_bins"])
+        if kind == LinearPolicy.kind:
+            return LinearPolicy(data["weights"], data["bias"])
+        if kind == MLPPolicy.kind:
+            count = len([name for name in data.files if name.startswith("w")])
+            return MLPPolicy([(data[f"w{i}"], data[f"b{i}"]) for i in range(count)])
+    raise ValueError(f"Unknown policy kind {kind!r} in {filename}")
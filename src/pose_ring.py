@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+from multiprocessing import shared_memory
+
+import numpy as np
+from numpy.typing import NDArray
+
+POSE_FIELDS = 4  # x, y, heading, alive
+STATS_FIELDS = 4  # steps, episodes, laps, best lap time
+
+
+class PoseRing:
+    """
+    Ring of car pose snapshots in shared memory, written by one process (the trainer) and read
+    by another (the dashboard). Writing never waits for the reader: every slot carries a
+    sequence number that is odd while the slot is being written, so a reader can tell when
+    the slot it looked at was overwritten under it and just skip that frame.
+
+    Layout: int64 header [published, cars, slots], int64 sequence per slot,
+    float64 stats, float32 (slots, cars, 4) poses.
+    """
+
+    def __init__(self, cars: int, slots: int = 8) -> None:
+        """
+        Create a new ring in a new shared memory block.
+
+        :param cars: number of cars in every snapshot
+        :param slots: number of snapshots in the ring
+        :return: None
+        """
+        size = 8 * (3 + slots + STATS_FIELDS) + 4 * slots * cars * POSE_FIELDS
+        self.owner: bool = True
+        self.memory: shared_memory.SharedMemory = shared_memory.SharedMemory(create=True, size=size)
+        self._map(cars, slots)
+        self.header[:] = (0, cars, slots)
+        self.sequence[:] = 0
+        self.stats[:] = 0.0
+
+    @classmethod
+    def attach(cls, name: str) -> PoseRing:
+        """
+        Attach to a ring created by another process.
+
+        :param name: name of the shared memory block
+        :return: PoseRing
+        """
+        ring = cls.__new__(cls)
+        ring.owner = False
+        ring.memory = shared_memory.SharedMemory(name=name)
+        header = np.ndarray((3,), dtype=np.int64, buffer=ring.memory.buf)
+        cars, slots = int(header[1]), int(header[2])
+        del header
+        ring._map(cars, slots)
+        return ring
+
+    def _map(self, cars: int, slots: int) -> None:
+        buffer = self.memory.buf
+        self.header: NDArray[np.int64] = np.ndarray((3,), dtype=np.int64, buffer=buffer)
+        self.sequence: NDArray[np.int64] = np.ndarray((slots,), dtype=np.int64, buffer=buffer, offset=24)
+        self.stats: NDArray[np.float64] = np.ndarray(
+            (STATS_FIELDS,), dtype=np.float64, buffer=buffer, offset=24 + 8 * slots
+        )
+        self.poses: NDArray[np.float32] = np.ndarray(
+            (slots, cars, POSE_FIELDS), dtype=np.float32, buffer=buffer, offset=8 * (3 + slots + STATS_FIELDS)
+        )
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def cars(self) -> int:
+        return int(self.poses.shape[1])
+
+    @property
+    def published(self) -> int:
+        return int(self.header[0])
+
+    def publish(
+        self,
+        x: NDArray[np.float64],
+        y: NDArray[np.float64],
+        heading: NDArray[np.float64],
+        alive: NDArray[np.bool_],
+    ) -> None:
+        """
+        Write a snapshot into the next slot.
+
+        :param x: (cars,) positions x
+        :param y: (cars,) positions y
+        :param heading: (cars,) headings in degrees
+        :param alive: (cars,) alive flags
+        :return: None
+        """
+        slot = self.published % len(self.sequence)
+        self.sequence[slot] += 1
+        pose = self.poses[slot]
+        pose[:, 0] = x
+        pose[:, 1] = y
+        pose[:, 2] = heading
+        pose[:, 3] = alive
+        self.sequence[slot] += 1
+        self.header[0] += 1
+
+    def latest(self) -> tuple[int, int] | None:
+        """
+        Locate the most recent complete snapshot; its data is the view self.poses[slot].
+
+        :return: (slot, sequence) or None when nothing was published yet or the slot is being written
+        """
+        published = self.published
+        if published == 0:
+            return None
+        slot = (published - 1) % len(self.sequence)
+        sequence = int(self.sequence[slot])
+        if sequence % 2:
+            return None
+        return slot, sequence
+
+    def still_valid(self, slot: int, sequence: int) -> bool:
+        """
+        Check, after reading a snapshot located with latest(), that it was not overwritten meanwhile.
+
+        :param slot: slot returned by latest()
+        :param sequence: sequence returned by latest()
+        :return: True if the data read is consistent
+        """
+        return int(self.sequence[slot]) == sequence
+
+    def close(self) -> None:
+        """
+        Detach from the shared memory, and free it if this ring created it.
+
+        :return: None
+        """
+        del self.header, self.sequence, self.stats, self.poses
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
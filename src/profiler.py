@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import json
+import time
+from typing import TYPE_CHECKING, Dict, List
+
+import numpy as np
+from numpy.typing import NDArray
+
+import graphics_constants
+
+if TYPE_CHECKING:
+    import pyglet.text
+
+PROFILE_WINDOW = 600  # Samples kept per phase, 10 seconds of frames at 60 Hz
+PERCENTILES = (50, 95, 99)
+OVERLAY_INTERVAL = 0.5  # Seconds between two refreshes of the overlay text
+LOG_INTERVAL = 5.0  # Seconds between two lines of the log file
+
+
+class FrameProfiler:
+    """
+    Times the phases of a frame (physics, gate check, render...) and keeps the last PROFILE_WINDOW samples
+    of every phase, to report rolling percentiles on screen or in a log file.
+
+    Instrumented code holds an optional profiler and only calls it when it is set, so a disabled profiler
+    costs one None check per phase:
+
+        start = profiler.now() if profiler is not None else 0.0
+        ...
+        if profiler is not None:
+            start = profiler.lap("physics", start)
+    """
+
+    def __init__(self, window: int = PROFILE_WINDOW, log_path: str | None = None, show_overlay: bool = True) -> None:
+        """
+        :param window: samples kept per phase
+        :param log_path: file the summary is appended to every LOG_INTERVAL seconds, as JSON lines
+        :param show_overlay: whether create_overlay creates the on-screen overlay
+        """
+        self.window: int = window
+        self.log_path: str | None = log_path
+        self.show_overlay: bool = show_overlay
+        self.samples: Dict[str, NDArray[np.float64]] = {}
+        self.counts: Dict[str, int] = {}
+        self.frames: int = 0
+        self.last_overlay: float = 0.0
+        self.last_log: float = time.perf_counter()
+        self.overlay: pyglet.text.Label | None = None
+
+    @staticmethod
+    def now() -> float:
+        """
+        :return: current time of the profiler clock, in seconds
+        """
+        return time.perf_counter()
+
+    def lap(self, phase: str, start: float) -> float:
+        """
+        Record the time elapsed since start as one sample of a phase.
+
+        :param phase: phase name
+        :param start: time returned by now() or by the previous lap()
+        :return: current time, the start of the next phase
+        """
+        end = time.perf_counter()
+        self.record(phase, end - start)
+        return end
+
+    def record(self, phase: str, seconds: float) -> None:
+        """
+        :param phase: phase name
+        :param seconds: duration of the phase
+        :return: None
+        """
+        samples = self.samples.get(phase)
+        if samples is None:
+            samples = self.samples[phase] = np.empty(self.window)
+            self.counts[phase] = 0
+        samples[self.counts[phase] % self.window] = seconds
+        self.counts[phase] += 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        :return: per phase, the number of samples in the window and their mean, percentiles and max in
+                 milliseconds
+        """
+        result = {}
+        for phase, samples in self.samples.items():
+            values = samples[: min(self.counts[phase], self.window)] * 1000
+            stats = {"samples": float(len(values)), "mean": float(values.mean())}
+            for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES), strict=True):
+                stats[f"p{percentile}"] = float(value)
+            stats["max"] = float(values.max())
+            result[phase] = stats
+        return result
+
+    def report(self) -> str:
+        """
+        :return: one line per phase with its rolling mean and percentiles, slowest phase (by p99) first
+        """
+        summary = self.summary()
+        lines: List[str] = [f"{'phase':<14}{'mean':>8}" + "".join(f"{f'p{p}':>8}" for p in PERCENTILES) + f"{'max':>8}"]
+        for phase, stats in sorted(summary.items(), key=lambda item: -item[1][f"p{PERCENTILES[-1]}"]):
+            values = [stats["mean"], *(stats[f"p{p}"] for p in PERCENTILES), stats["max"]]
+            lines.append(f"{phase:<14}" + "".join(f"{v:8.3f}" for v in values))
+        return "\n".join(lines)
+
+    def create_overlay(self) -> None:
+        """
+        Create the on-screen overlay drawn by draw(), unless show_overlay is off. Needs a pyglet window.
+
+        :return: None
+        """
+        if not self.show_overlay:
+            return
+        import pyglet
+
+        self.overlay = pyglet.text.Label(
+            "",
+            font_name=graphics_constants.profiler_label_font_name,
+            font_size=graphics_constants.profiler_label_font_size,
+            color=graphics_constants.white_color,
+            x=graphics_constants.profiler_label_x,
+            y=graphics_constants.profiler_label_y,
+            width=graphics_constants.profiler_label_width,
+            anchor_y="top",
+            multiline=True,
+        )
+
+    def draw(self) -> None:
+        """
+        Draw the overlay, if there is one.
+
+        :return: None
+        """
+        if self.overlay is not None:
+            self.overlay.draw()
+
+    def end_frame(self) -> None:
+        """
+        Count a rendered frame, refresh the overlay text and append to the log file when they are due.
+
+        :return: None
+        """
+        self.frames += 1
+        now = time.perf_counter()
+        if self.overlay is not None and now - self.last_overlay >= OVERLAY_INTERVAL:
+            self.overlay.text = f"Profiler (ms, last {self.window} samples)\n{self.report()}"
+            self.last_overlay = now
+        if self.log_path is not None and now - self.last_log >= LOG_INTERVAL:
+            self.write_log()
+            self.last_log = now
+
+    def write_log(self) -> None:
+        """
+        Append the current summary to the log file as one JSON line.
+
+        :return: None
+        """
+        if self.log_path is None:
+            return
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"time": time.time(), "frames": self.frames, "phases": self.summary()}) + "\n")
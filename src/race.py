@@ -0,0 +1,375 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+import action_codes
+import car_stats
+import centerline
+import policy
+import setup_sweep
+import simulation
+import utilities
+from replay_analytics import GhostTable, ReplayArrays
+
+FloatArray = NDArray[np.float64]
+BoolArray = NDArray[np.bool_]
+IntArray = NDArray[np.int64]
+
+GRID_SPACING = 100.0  # Distance along the centerline between two rows of the starting grid
+LANE_WIDTH = 60.0  # Distance across the track between two lanes of the starting grid
+MAX_TIME = 120.0  # Seconds after which the race ends for the cars still running
+FOLLOW_TIME = 0.25  # The centerline driver lifts off when it would reach another car within this many seconds
+NO_CONTACT = -1  # collided_with value of cars that did not touch anything
+
+
+@dataclass
+class RaceConfig:
+    """
+    Settings of a race.
+    """
+
+    human: bool = True  # Car 0 is driven with the keyboard
+    opponents: int = 7  # AI cars
+    lanes: int = 1  # Cars side by side on the starting grid
+    grid_spacing: float = GRID_SPACING
+    lane_width: float = LANE_WIDTH
+    solid_ghosts: bool = False  # Cars crash into the replay ghosts instead of driving through them
+    cell: float = 0.0  # Side of the spatial hash cells, 0 for the car diagonal
+    max_speed: float = setup_sweep.MAX_SPEED  # Speed limit of the centerline driver
+    follow_time: float = FOLLOW_TIME
+    max_time: float = MAX_TIME
+    dt: float = car_stats.physics_dt
+
+
+@dataclass
+class RaceResult:
+    """
+    Outcome of one car of a race.
+    """
+
+    car: int
+    name: str
+    completed: bool
+    crashed: bool
+    time: float  # lap time, NaN when the lap was not completed
+    gates: float  # fraction of the gates passed
+    collided_with: str  # name of the car or ghost it crashed into, empty if it did not crash into one
+
+    def __str__(self) -> str:
+        if self.completed:
+            return f"{self.name:>12} {self.time:8.3f}s"
+        status = "crashed" if self.crashed else "running"
+        into = f" into {self.collided_with}" if self.collided_with else ""
+        return f"{self.name:>12} {status}{into} ({self.gates:.0%} of the gates)"
+
+
+class SpatialHash:
+    """
+    Broad phase of the car-to-car collisions. Every step each rectangle is put in the grid cells its
+    bounding box overlaps, and only rectangles sharing a cell become candidate pairs. With cells at least
+    as large as a car, a car covers at most 4 cells and is only paired with its neighbours, so the cost
+    grows with the number of cars rather than with the number of pairs. The grid is the one of
+    utilities.overlapping_boxes.
+    """
+
+    def __init__(self, cell: float) -> None:
+        """
+        :param cell: side of the grid cells
+        """
+        if cell <= 0:
+            raise ValueError(f"Spatial hash cells must have a positive size, got {cell}")
+        self.cell: float = cell
+
+    def pairs(self, corners: FloatArray) -> IntArray:
+        """
+        :param corners: (N, 4, 2) rectangle corners
+        :return: (P, 2) indices i < j of the rectangles whose bounding boxes overlap, each pair once
+        """
+        a, b = utilities.overlapping_boxes(corners.min(axis=1), corners.max(axis=1), self.cell)
+        return np.stack([a, b], axis=1)
+
+
+def rectangles_overlap(first: FloatArray, second: FloatArray) -> BoolArray:
+    """
+    Narrow phase: separating axis test of pairs of rectangles, touching counts as overlapping.
+
+    :param first: (P, 4, 2) corners, in the order of Car.car_vertices
+    :param second: (P, 4, 2) corners of the other rectangle of every pair
+    :return: (P,) whether the rectangles of every pair overlap
+    """
+    # The edge directions of both rectangles are the only axes that can separate them
+    axes = np.stack(
+        [
+            first[:, 0] - first[:, 1],
+            first[:, 0] - first[:, 2],
+            second[:, 0] - second[:, 1],
+            second[:, 0] - second[:, 2],
+        ],
+        axis=1,
+    )
+    projected_first = np.einsum("pcd,pad->pca", first, axes)
+    projected_second = np.einsum("pcd,pad->pca", second, axes)
+    separated = (projected_first.max(axis=1) < projected_second.min(axis=1)) | (
+        projected_second.max(axis=1) < projected_first.min(axis=1)
+    )
+    return np.asarray(~separated.any(axis=1))
+
+
+def contacts(corners: FloatArray, spatial_hash: SpatialHash) -> IntArray:
+    """
+    :param corners: (N, 4, 2) rectangle corners
+    :param spatial_hash: broad phase
+    :return: (P, 2) indices i < j of the overlapping rectangles
+    """
+    pairs = spatial_hash.pairs(corners)
+    return pairs[rectangles_overlap(corners[pairs[:, 0]], corners[pairs[:, 1]])]
+
+
+def lane_offsets(count: int, lanes: int, lane_width: float) -> FloatArray:
+    """
+    :param count: number of cars
+    :param lanes: cars per row of the starting grid, lane 0 on the right of the driving direction
+    :param lane_width: distance between two lanes across the track
+    :return: (count,) distance of the grid slot of every car to the left of the centerline
+    """
+    return np.asarray((np.arange(count) % lanes - (lanes - 1) / 2) * lane_width)
+
+
+def grid_poses(
+    index: centerline.CenterlineIndex, count: int, lanes: int, spacing: float, lane_width: float
+) -> FloatArray:
+    """
+    Starting grid behind the start, lanes cars per row, rows spacing apart along the centerline.
+
+    :param index: centerline of the track, progress 0 at the start
+    :param count: number of cars
+    :param lanes: cars per row, lane 0 on the right of the driving direction
+    :param spacing: distance between two rows along the centerline
+    :param lane_width: distance between two lanes across the track
+    :return: (count, 3) x, y, heading of every car, pole position first
+    """
+    if lanes < 1:
+        raise ValueError(f"The starting grid needs at least one lane, got {lanes}")
+    rows = np.arange(count) // lanes
+    progress = np.asarray(-rows * spacing, dtype=float)
+    if count and rows[-1] * spacing >= index.length / 2:
+        raise ValueError(f"The track is too short for a grid of {count} cars in {lanes} lanes")
+    points = centerline.sample_ring(index.starts, progress)
+    tangent = centerline.sample_ring(index.starts, progress + 1.0) - points
+    tangent /= np.linalg.norm(tangent, axis=1, keepdims=True)
+    left = np.stack([-tangent[:, 1], tangent[:, 0]], axis=1)
+    positions = points + left * lane_offsets(count, lanes, lane_width)[:, None]
+    heading = np.degrees(np.arctan2(tangent[:, 1], tangent[:, 0]))
+    return np.column_stack([positions, heading])
+
+
+class Race:
+    def __init__(
+        self,
+        track_path: str,
+        config: RaceConfig | None = None,
+        driver: policy.Policy | None = None,
+        ghosts: Sequence[ReplayArrays] = (),
+    ) -> None:
+        """
+        Many cars on one track: the human car (car 0), the AI cars and the replay ghosts. The driven cars
+        share a CarBatch and are placed on a starting grid; after every step the cars that touch each
+        other crash, like cars touching a border. Ghosts follow their replay and only take part in the
+        collisions with config.solid_ghosts.
+
+        :param track_path: Path to the track folder
+        :param config: race settings
+        :param driver: policy driving the AI cars from their sensors, None for the centerline driver
+        :param ghosts: replays raced against, as arrays
+        """
+        self.config: RaceConfig = config or RaceConfig()
+        self.track_path: str = track_path
+        self.driver: policy.Policy | None = driver
+        self.humans: int = int(self.config.human)
+        count = self.humans + self.config.opponents
+        if count == 0:
+            raise ValueError("A race needs at least one driven car")
+
+        self.cars: simulation.CarBatch = simulation.CarBatch.from_track(count, track_path)
+        self.cars.sensors = driver is not None
+        self.index: centerline.CenterlineIndex = centerline.track_index(track_path)
+        self.grid: FloatArray = grid_poses(
+            self.index, count, self.config.lanes, self.config.grid_spacing, self.config.lane_width
+        )
+        # The centerline driver keeps the lane of its grid slot
+        self.offsets: FloatArray = lane_offsets(count, self.config.lanes, self.config.lane_width)
+        if any(r.track_path is None or os.path.normpath(r.track_path) != os.path.normpath(track_path) for r in ghosts):
+            raise ValueError("Ghost replays must be recorded on the race track")
+        self.ghosts: GhostTable | None = GhostTable(ghosts) if ghosts else None
+        self.spatial_hash: SpatialHash = SpatialHash(
+            self.config.cell or float(np.hypot(self.cars.width, self.cars.height))
+        )
+        # Car or ghost (numbered after the cars) every car crashed into
+        self.collided_with: IntArray = np.full(count, NO_CONTACT, dtype=np.int64)
+        self.lap_time: FloatArray = np.full(count, np.nan)
+        self.reset()
+
+        on_border = self.cars.crosses_border(self.cars.edges(np.arange(count)))
+        if on_border.any():
+            raise ValueError(f"The track is too narrow for {self.config.lanes} lanes of {self.config.lane_width:g}")
+
+    def reset(self) -> None:
+        """
+        Put every car back on its grid slot and the ghosts at the start of their replays.
+
+        :return: None
+        """
+        cars = self.cars
+        cars.reset()
+        cars.x[:], cars.y[:], cars.heading[:] = self.grid.T
+        cars.sensor_points[:] = self.grid[:, None, :2]
+        if cars.sensors:
+            cars.calculate_distances(np.arange(cars.count))
+        self.collided_with[:] = NO_CONTACT
+        self.lap_time[:] = np.nan
+
+    @property
+    def time(self) -> float:
+        return float(self.cars.current_time[0])
+
+    @property
+    def running(self) -> BoolArray:
+        """
+        :return: cars that neither crashed nor finished
+        """
+        return np.asarray(self.cars.alive & ~self.cars.completed)
+
+    @property
+    def finished(self) -> bool:
+        return not self.running.any() or self.time >= self.config.max_time
+
+    def names(self) -> List[str]:
+        """
+        :return: name of every car, then of every ghost
+        """
+        names = ["human"] * self.humans + [f"ai {i + 1}" for i in range(self.config.opponents)]
+        if self.ghosts is not None:
+            names += [f"ghost {i + 1}" for i in range(len(self.ghosts))]
+        return names
+
+    def actions(self, human_action: int = action_codes.NONE) -> NDArray[np.uint8]:
+        """
+        :param human_action: action code held by the human car
+        :return: (N,) action code of every car, the AI cars' from their driver
+        """
+        cars = self.cars
+        if self.driver is not None:
+            chosen = self.driver.act_batch(policy.observation(cars.distances, cars.speed()))
+            actions = np.asarray(policy.ACTIONS, dtype=np.uint8)[chosen]
+        else:
+            controls = setup_sweep.centerline_controls(cars, self.index, self.config.max_speed, self.offsets)
+            controls[self.traffic_ahead(), 0] = False
+            actions = action_codes.encode(controls)
+        actions[: self.humans] = human_action
+        return actions
+
+    def bodies(self) -> Tuple[IntArray, FloatArray]:
+        """
+        :return: ids of the running cars and of the solid ghosts on the track (numbered after the cars),
+                 and their (M, 4, 2) corners
+        """
+        cars = self.cars
+        ids = np.flatnonzero(self.running)
+        x, y, heading = cars.x[ids], cars.y[ids], cars.heading[ids]
+        if self.config.solid_ghosts and self.ghosts is not None:
+            ghost_x, ghost_y, ghost_heading, alive, completed = self.ghosts.poses(self.time)
+            on_track = np.flatnonzero(alive & ~completed)
+            ids = np.concatenate([ids, cars.count + on_track])
+            x = np.concatenate([x, ghost_x[on_track]])
+            y = np.concatenate([y, ghost_y[on_track]])
+            heading = np.concatenate([heading, ghost_heading[on_track]])
+        return ids, utilities.rectangle_vertices(x, y, heading, cars.width, cars.height)
+
+    def traffic_ahead(self) -> BoolArray:
+        """
+        :return: (N,) whether another car (or solid ghost) is less than config.follow_time in front of each car
+        """
+        cars = self.cars
+        blocked = np.zeros(cars.count, dtype=bool)
+        ids, bodies = self.bodies()
+        drivers = ids[ids < cars.count]
+        if len(drivers) == 0:
+            return blocked
+        # A box in front of every car, as long as the distance it covers in follow_time and twice as wide so
+        # cars cutting in from the next lane are seen too, tested against the bodies in the same hash
+        reach = np.maximum(np.linalg.norm(cars.velocity[drivers], axis=1) * self.config.follow_time, 1.0)
+        heading = np.radians(cars.heading[drivers])
+        x = cars.x[drivers] + np.cos(heading) * ((cars.width + reach) / 2)
+        y = cars.y[drivers] + np.sin(heading) * ((cars.width + reach) / 2)
+        boxes = utilities.rectangle_vertices(x, y, cars.heading[drivers], reach, 2 * cars.height)
+        pairs = contacts(np.concatenate([boxes, bodies]), self.spatial_hash)
+        box, body = pairs[:, 0], pairs[:, 1] - len(boxes)
+        seen = (box < len(boxes)) & (body >= 0)
+        box, body = box[seen], body[seen]
+
+        # Only cars farther along the track are followed, so two cars never wait for each other
+        centers = bodies.mean(axis=1)
+        progress, _ = self.index.project(centers)
+        own = np.searchsorted(ids, drivers[box])
+        ahead = self.index.progress_delta(progress[own], progress[body]) > 0
+        blocked[drivers[box[ahead]]] = True
+        return blocked
+
+    def step(self, actions: NDArray[np.integer]) -> IntArray:
+        """
+        Advance every car by one physics step, then crash the cars that touch another car (or a solid ghost).
+
+        :param actions: (N,) action code of every car, see actions()
+        :return: (P, 2) pairs of cars that collided during the step, ghosts numbered after the cars
+        """
+        cars = self.cars
+        controls = action_codes.decode(np.asarray(actions))
+        cars.step(controls[:, 0], controls[:, 1], controls[:, 2], controls[:, 3], self.config.dt)
+        finished = cars.completed & np.isnan(self.lap_time)
+        self.lap_time[finished] = cars.current_time[finished]
+
+        # Crashed and finished cars leave the track, only running cars (and solid ghosts) can be hit
+        ids, bodies = self.bodies()
+        pairs = ids[contacts(bodies, self.spatial_hash)]
+
+        for this, other in ((pairs[:, 0], pairs[:, 1]), (pairs[:, 1], pairs[:, 0])):
+            hit = this < cars.count  # ghosts are not crashed, they follow their replay
+            self.collided_with[this[hit]] = other[hit]
+            cars.alive[this[hit]] = False
+        return pairs
+
+    def run(self) -> List[RaceResult]:
+        """
+        Race the AI cars to the end, the human car (if any) standing still.
+
+        :return: results, see results()
+        """
+        while not self.finished:
+            self.step(self.actions())
+        return self.results()
+
+    def results(self) -> List[RaceResult]:
+        """
+        :return: result of every driven car, in finishing order, then by distance covered
+        """
+        cars = self.cars
+        names = self.names()
+        gate_count = max(len(cars.gates), 1)
+        results = [
+            RaceResult(
+                i,
+                names[i],
+                bool(cars.completed[i]),
+                not bool(cars.alive[i]),
+                float(self.lap_time[i]),
+                float(cars.next_gate[i]) / gate_count,
+                names[self.collided_with[i]] if self.collided_with[i] != NO_CONTACT else "",
+            )
+            for i in range(cars.count)
+        ]
+        return sorted(results, key=lambda r: (not r.completed, r.time if r.completed else -r.gates))
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+import graphics_constants
+import replay_analytics
+import utilities
+
+Image = NDArray[np.uint8]
+
+car_color = graphics_constants.red_color[:3]
+trail_color = graphics_constants.grey_color[:3]
+
+
+def write_png(filename: str, image: Image) -> None:
+    """
+    Encode an (H, W, 3) uint8 RGB array as PNG, with the standard library only.
+
+    :param filename: path of the output file
+    :param image: RGB image
+    :return: None
+    """
+    height, width, _ = image.shape
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)  # every row starts with filter type 0
+    raw[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+class Rasterizer:
+    def __init__(
+        self,
+        track_path: str,
+        scale: float = 0.25,
+        width: int = graphics_constants.resolution_width,
+        height: int = graphics_constants.resolution_height,
+    ):
+        """
+        Software renderer for a track, drawing into numpy arrays instead of a pyglet window.
+
+        :param track_path: Path to the track folder
+        :param scale: image pixels per world unit
+        :param width: width of the world area (the game window width)
+        :param height: height of the world area (the game window height)
+        """
+        self.track_path: str = track_path
+        self.scale: float = scale
+        self.image_width: int = max(1, int(width * scale))
+        self.image_height: int = max(1, int(height * scale))
+        self.car_width, self.car_height = utilities.read_png_size(graphics_constants.car_image_path)
+
+        gates = utilities.segments_to_array(utilities.load_gates_segments(track_path))
+        self.background: Image = np.zeros((self.image_height, self.image_width, 3), dtype=np.uint8)
+        self.draw_segments(
+            self.background,
+            utilities.segments_to_array(utilities.load_track_segments(track_path)),
+            graphics_constants.white_color[:3],
+        )
+        self.draw_segments(self.background, gates, graphics_constants.green_color[:3])
+        self.draw_segments(self.background, gates[:1], graphics_constants.yellow_color[:3])
+
+    def to_pixels(self, x: NDArray[np.float64], y: NDArray[np.float64]) -> Tuple[NDArray[np.int64], NDArray[np.int64]]:
+        """
+        Convert world coordinates (y up) into image rows and columns (row 0 at the top).
+
+        :param x: world x
+        :param y: world y
+        :return: (rows, columns)
+        """
+        columns = np.floor(np.asarray(x) * self.scale).astype(np.int64)
+        rows = self.image_height - 1 - np.floor(np.asarray(y) * self.scale).astype(np.int64)
+        return rows, columns
+
+    def draw_segments(self, image: Image, segments: utilities.SegmentArray, color: Tuple[int, ...]) -> None:
+        """
+        Draw 1 pixel wide segments, sampling every segment at pixel spacing.
+
+        :param image: image to draw into
+        :param segments: (N, 4) segments in world coordinates
+        :param color: RGB color
+        :return: None
+        """
+        if len(segments) == 0:
+            return
+        lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1]) * self.scale
+        samples = np.ceil(lengths).astype(np.int64) + 1
+        owner = np.repeat(np.arange(len(segments)), samples)
+        starts = np.cumsum(samples) - samples
+        t = (np.arange(len(owner)) - starts[owner]) / np.maximum(samples[owner] - 1, 1)
+        s = segments[owner]
+        rows, columns = self.to_pixels(s[:, 0] + (s[:, 2] - s[:, 0]) * t, s[:, 1] + (s[:, 3] - s[:, 1]) * t)
+        inside = (rows >= 0) & (rows < self.image_height) & (columns >= 0) & (columns < self.image_width)
+        image[rows[inside], columns[inside]] = color
+
+    def draw_car(self, image: Image, x: float, y: float, heading: float, color: Tuple[int, ...] = car_color) -> None:
+        """
+        Fill the car rectangle (same geometry as Car.car_vertices).
+
+        :param image: image to draw into
+        :param x: car center x
+        :param y: car center y
+        :param heading: car heading in degrees
+        :param color: RGB color
+        :return: None
+        """
+        corners = utilities.rectangle_vertices(x, y, heading, self.car_width, self.car_height)
+        # walk the corners around the rectangle: front right, front left, back left, back right
+        polygon = corners[[0, 1, 3, 2]] * self.scale
+        polygon[:, 1] = self.image_height - polygon[:, 1]
+
+        c0 = max(int(np.floor(polygon[:, 0].min())), 0)
+        c1 = min(int(np.ceil(polygon[:, 0].max())), self.image_width - 1)
+        r0 = max(int(np.floor(polygon[:, 1].min())), 0)
+        r1 = min(int(np.ceil(polygon[:, 1].max())), self.image_height - 1)
+        if c0 > c1 or r0 > r1:
+            return
+
+        px, py = np.meshgrid(np.arange(c0, c1 + 1) + 0.5, np.arange(r0, r1 + 1) + 0.5)
+        edges = np.roll(polygon, -1, axis=0) - polygon
+        cross = edges[:, 0, None, None] * (py - polygon[:, 1, None, None]) - edges[:, 1, None, None] * (
+            px - polygon[:, 0, None, None]
+        )
+        inside = np.all(cross >= 0, axis=0) | np.all(cross <= 0, axis=0)
+        image[r0 : r1 + 1, c0 : c1 + 1][inside] = color
+
+    def render(self, x: float, y: float, heading: float) -> Image:
+        """
+        Render the track with the car at the given pose.
+
+        :param x: car center x
+        :param y: car center y
+        :param heading: car heading in degrees
+        :return: RGB image
+        """
+        image = self.background.copy()
+        self.draw_car(image, x, y, heading)
+        return image
+
+    def render_replay_frame(self, arrays: replay_analytics.ReplayArrays, frame: int, trail: bool = False) -> Image:
+        """
+        Render one frame of a replay, optionally with the path driven up to that frame.
+
+        :param arrays: replay columns
+        :param frame: frame index
+        :param trail: draw the path followed until this frame
+        :return: RGB image
+        """
+        image = self.background.copy()
+        if trail and frame > 0:
+            path = np.column_stack(
+                [arrays.x[:frame], arrays.y[:frame], arrays.x[1 : frame + 1], arrays.y[1 : frame + 1]]
+            )
+            self.draw_segments(image, path, trail_color)
+        if arrays.alive[frame]:
+            self.draw_car(image, float(arrays.x[frame]), float(arrays.y[frame]), float(arrays.heading[frame]))
+        return image
+
+
+class EmptyReplayError(ValueError):
+    """
+    Raised when a replay without frames is rendered.
+    """
+
+
+def _export_frame_range(job: Tuple[str, str, int, int, int, float]) -> List[str]:
+    """
+    Render the frames start, start + step, ... below stop of a replay, loading it and drawing its track once.
+    """
+    filename, output_dir, start, stop, step, scale = job
+    arrays = replay_analytics.load_replay_arrays(filename)
+    if arrays.track_path is None:
+        raise Exception("Replay does not have a track path")
+    rasterizer = Rasterizer(arrays.track_path, scale)
+    written = []
+    for frame in range(start, min(stop, len(arrays)), step):
+        path = os.path.join(output_dir, f"frame_{frame:05d}.png")
+        write_png(path, rasterizer.render_replay_frame(arrays, frame))
+        written.append(path)
+    return written
+
+
+def export_frames(
+    filename: str, output_dir: str, step: int = 1, scale: float = 0.25, workers: int | None = None
+) -> List[str]:
+    """
+    Export every step-th frame of a replay as PNG files, in a pool of worker processes. Every worker
+    renders one contiguous range of frames, so the track background is drawn once per worker.
+
+    :param filename: replay file inside the replay folder
+    :param output_dir: folder the frames are written to
+    :param step: frame stride
+    :param scale: image pixels per world unit
+    :param workers: number of worker processes (defaults to the CPU count)
+    :return: paths of the written files, in frame order
+    """
+    arrays = replay_analytics.load_replay_arrays(filename)
+    if arrays.track_path is None:
+        raise Exception("Replay does not have a track path")
+    os.makedirs(output_dir, exist_ok=True)
+    frames = range(0, len(arrays), step)
+    if len(frames) == 0:
+        return []
+    workers = workers or os.cpu_count() or 1
+    per_worker = -(-len(frames) // workers) * step  # frames of a range, rounded up, times the stride
+    jobs = [
+        (filename, output_dir, start, start + per_worker, step, scale) for start in range(0, len(arrays), per_worker)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [path for written in pool.map(_export_frame_range, jobs) for path in written]
+
+
+def contact_sheet(filename: str, output_path: str, columns: int = 4, rows: int = 3, scale: float = 0.1) -> str:
+    """
+    Write a single PNG with rows * columns thumbnails taken at evenly spaced frames of a replay.
+
+    :param filename: replay file inside the replay folder
+    :param output_path: path of the PNG file
+    :param columns: thumbnails per row
+    :param rows: rows of thumbnails
+    :param scale: thumbnail pixels per world unit
+    :return: output_path
+    """
+    arrays = replay_analytics.load_replay_arrays(filename)
+    if arrays.track_path is None:
+        raise Exception("Replay does not have a track path")
+    if len(arrays) == 0:
+        raise EmptyReplayError(f"Replay {filename} has no frames")
+    rasterizer = Rasterizer(arrays.track_path, scale)
+    h, w = rasterizer.image_height, rasterizer.image_width
+    sheet = np.zeros((rows * h, columns * w, 3), dtype=np.uint8)
+    frames = np.linspace(0, len(arrays) - 1, rows * columns).astype(np.int64)
+    for i, frame in enumerate(frames):
+        r, c = divmod(i, columns)
+        sheet[r * h : (r + 1) * h, c * w : (c + 1) * w] = rasterizer.render_replay_frame(arrays, int(frame), trail=True)
+    write_png(output_path, sheet)
+    return output_path
+
+
+def _contact_sheet_job(job: Tuple[str, str, int, int, float]) -> str | None:
+    try:
+        return contact_sheet(*job)
+    except EmptyReplayError:
+        return None
+
+
+def export_contact_sheets(
+    filenames: Sequence[str],
+    output_dir: str,
+    columns: int = 4,
+    rows: int = 3,
+    scale: float = 0.1,
+    workers: int | None = None,
+) -> List[str]:
+    """
+    Write one contact sheet per replay, in a pool of worker processes. Replays without frames are skipped.
+
+    :param filenames: replay files inside the replay folder
+    :param output_dir: folder the sheets are written to
+    :param columns: thumbnails per row
+    :param rows: rows of thumbnails
+    :param scale: thumbnail pixels per world unit
+    :param workers: number of worker processes (defaults to the CPU count)
+    :return: paths of the written files
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [
+        (filename, os.path.join(output_dir, f"{os.path.splitext(filename)[0]}.png"), columns, rows, scale)
+        for filename in filenames
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [path for path in pool.map(_contact_sheet_job, jobs) if path is not None]
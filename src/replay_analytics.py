@@ -0,0 +1,419 @@
+from __future__ import annotations
+
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+import centerline
+import make_replay
+import utilities
+
+FloatArray = NDArray[np.float64]
+BoolArray = NDArray[np.bool_]
+
+
+@dataclass
+class ReplayArrays:
+    """
+    Column view of a replay: one numpy array per Frame attribute.
+    """
+
+    filename: str
+    track_path: str | None
+    time: FloatArray  # the frames "dt" field, i.e. time elapsed since the start of the run
+    x: FloatArray
+    y: FloatArray
+    heading: FloatArray
+    alive: BoolArray
+    completed: BoolArray
+    action: NDArray[np.uint8]  # action code held at each frame, see action_codes
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+
+def arrays_from_data(filename: str, data: dict) -> ReplayArrays:
+    """
+    Build the columns directly from the decoded JSON, without creating Frame objects.
+
+    :param filename: name of the replay file
+    :param data: decoded replay file
+    :return: ReplayArrays of the replay
+    """
+    frames = data["frames"]
+    return ReplayArrays(
+        filename=filename,
+        track_path=data.get("track_path"),
+        time=np.fromiter((f["dt"] for f in frames), dtype=float, count=len(frames)),
+        x=np.fromiter((f["x"] for f in frames), dtype=float, count=len(frames)),
+        y=np.fromiter((f["y"] for f in frames), dtype=float, count=len(frames)),
+        heading=np.fromiter((f["heading"] for f in frames), dtype=float, count=len(frames)),
+        alive=np.fromiter((f["alive"] for f in frames), dtype=bool, count=len(frames)),
+        completed=np.fromiter((f["completed"] for f in frames), dtype=bool, count=len(frames)),
+        action=np.fromiter((make_replay.frame_action(f) for f in frames), dtype=np.uint8, count=len(frames)),
+    )
+
+
+def arrays_from_replay(replay: make_replay.Replay, filename: str = "") -> ReplayArrays:
+    """
+    Build the columns from an in-memory replay (e.g. one that was just recorded).
+
+    :param replay: replay to convert
+    :param filename: name to attach to the arrays
+    :return: ReplayArrays of the replay
+    """
+    return arrays_from_data(filename, {"track_path": replay.track_path, "frames": [f.to_dict() for f in replay.log]})
+
+
+def load_replay_arrays(filename: str) -> ReplayArrays:
+    """
+    Load a replay file from the replay folder as arrays. Files converted with save_replay_arrays
+    (.npz) are read directly, without decoding any JSON.
+
+    :param filename: name of the replay file
+    :return: ReplayArrays of the replay
+    """
+    if filename.endswith(".npz"):
+        with np.load(f"{make_replay.REPLAYS_PATH}{filename}") as data:
+            track_path = str(data["track_path"])
+            return ReplayArrays(
+                filename=filename,
+                track_path=track_path or None,
+                time=data["time"],
+                x=data["x"],
+                y=data["y"],
+                heading=data["heading"],
+                alive=data["alive"],
+                completed=data["completed"],
+                # files converted before action codes did not keep the inputs
+                action=data["action"] if "action" in data.files else np.zeros(len(data["time"]), dtype=np.uint8),
+            )
+    with open(f"{make_replay.REPLAYS_PATH}{filename}", "r", encoding="utf-8") as f:
+        return arrays_from_data(filename, json.load(f))
+
+
+def save_replay_arrays(arrays: ReplayArrays, filename: str) -> None:
+    """
+    Save the columns of a replay as a .npz file in the replay folder, inputs included as one action
+    code per frame.
+
+    :param arrays: replay columns
+    :param filename: name of the .npz file
+    :return: None
+    """
+    np.savez(
+        f"{make_replay.REPLAYS_PATH}{filename}",
+        track_path=np.array(arrays.track_path or ""),
+        time=arrays.time,
+        x=arrays.x,
+        y=arrays.y,
+        heading=arrays.heading,
+        alive=arrays.alive,
+        completed=arrays.completed,
+        action=arrays.action,
+    )
+
+
+class GhostTable:
+    def __init__(self, replays: Sequence[ReplayArrays]):
+        """
+        Poses of many replays of the same track as padded (replays, frames) tables, to look up where every
+        replay is at a given time with one search for all of them.
+
+        :param replays: replays to play back, as arrays
+        """
+        if not replays:
+            raise ValueError("No replays to play back")
+        self.replays: Sequence[ReplayArrays] = replays
+
+        # Padding repeats the last frame, which keeps every row sorted in time
+        self.lengths: NDArray[np.int64] = np.array([max(len(r), 1) for r in replays])
+        frames = int(self.lengths.max())
+        self.time: FloatArray = np.zeros((len(replays), frames), dtype=float)
+        self.x: FloatArray = np.zeros((len(replays), frames), dtype=float)
+        self.y: FloatArray = np.zeros((len(replays), frames), dtype=float)
+        self.heading: FloatArray = np.zeros((len(replays), frames), dtype=float)
+        self.alive: BoolArray = np.zeros((len(replays), frames), dtype=bool)
+        self.completed: BoolArray = np.zeros((len(replays), frames), dtype=bool)
+        for i, r in enumerate(replays):
+            if len(r) == 0:
+                continue
+            for table, column in (
+                (self.time, r.time),
+                (self.x, r.x),
+                (self.y, r.y),
+                (self.heading, r.heading),
+                (self.alive, r.alive),
+                (self.completed, r.completed),
+            ):
+                table[i, : len(r)] = column
+                table[i, len(r) :] = column[-1]
+
+        # Rows are shifted by multiples of span so one searchsorted on the flattened table finds
+        # the current frame of every replay at once
+        self.span: float = float(self.time.max()) + 1.0
+        self.row_offsets: FloatArray = np.arange(len(replays), dtype=float) * self.span
+        self.flat_time: FloatArray = (self.time + self.row_offsets[:, None]).ravel()
+        self.row_starts: NDArray[np.int64] = np.arange(len(replays)) * frames
+
+    def __len__(self) -> int:
+        return len(self.replays)
+
+    def frame_indices(self, current_time: float) -> NDArray[np.int64]:
+        """
+        Index of the last frame at or before current_time for every replay.
+
+        :param current_time: time since the start of the replays
+        :return: array of frame indices, one per replay
+        """
+        keys = np.minimum(current_time, self.span - 1.0) + self.row_offsets
+        flat = np.searchsorted(self.flat_time, keys, side="right") - 1 - self.row_starts
+        return np.asarray(np.clip(flat, 0, self.lengths - 1))
+
+    def poses(self, current_time: float) -> Tuple[FloatArray, FloatArray, FloatArray, BoolArray, BoolArray]:
+        """
+        :param current_time: time since the start of the replays
+        :return: x, y, heading, alive and completed of every replay at current_time
+        """
+        rows = np.arange(len(self.replays))
+        frames = self.frame_indices(current_time)
+        return (
+            self.x[rows, frames],
+            self.y[rows, frames],
+            self.heading[rows, frames],
+            self.alive[rows, frames],
+            self.completed[rows, frames],
+        )
+
+
+def speed_trace(arrays: ReplayArrays) -> FloatArray:
+    """
+    Speed at each frame, from the distance covered since the previous frame.
+
+    :param arrays: replay columns
+    :return: speed per frame (the first frame has speed 0)
+    """
+    speed = np.zeros(len(arrays), dtype=float)
+    if len(arrays) < 2:
+        return speed
+    step = np.hypot(np.diff(arrays.x), np.diff(arrays.y))
+    elapsed = np.diff(arrays.time)
+    speed[1:] = np.divide(step, elapsed, out=np.zeros_like(step), where=elapsed > 0)
+    return speed
+
+
+def acceleration_trace(arrays: ReplayArrays, speed: FloatArray | None = None) -> FloatArray:
+    """
+    Longitudinal acceleration at each frame, from consecutive speeds.
+
+    :param arrays: replay columns
+    :param speed: already computed speed trace, if available
+    :return: acceleration per frame (the first frame has acceleration 0)
+    """
+    if speed is None:
+        speed = speed_trace(arrays)
+    acceleration = np.zeros(len(arrays), dtype=float)
+    if len(arrays) < 2:
+        return acceleration
+    change = np.diff(speed)
+    elapsed = np.diff(arrays.time)
+    acceleration[1:] = np.divide(change, elapsed, out=np.zeros_like(change), where=elapsed > 0)
+    return acceleration
+
+
+def distance_travelled(arrays: ReplayArrays) -> float:
+    """
+    :param arrays: replay columns
+    :return: length of the path followed by the car
+    """
+    return float(np.hypot(np.diff(arrays.x), np.diff(arrays.y)).sum())
+
+
+def crash_location(arrays: ReplayArrays) -> Tuple[float, float] | None:
+    """
+    :param arrays: replay columns
+    :return: position of the first frame where the car is not alive, or None if it never crashed
+    """
+    dead = np.flatnonzero(~arrays.alive)
+    if len(dead) == 0:
+        return None
+    return float(arrays.x[dead[0]]), float(arrays.y[dead[0]])
+
+
+def gate_crossing_times(arrays: ReplayArrays, gates: utilities.SegmentArray) -> FloatArray:
+    """
+    Time at which the path of the car center crosses each gate, in order. As in Car, the first
+    gate is appended again at the end so the last entry is the lap completion time; since the
+    simulation ends the lap as soon as the car body touches the line, that entry is taken from
+    the first completed frame. Crossing times are interpolated inside the frame where the
+    crossing happens.
+
+    :param arrays: replay columns
+    :param gates: (G, 4) gates array, as returned by utilities.segments_to_array
+    :return: (G + 1) crossing times, NaN for gates that were never reached
+    """
+    times = np.full(len(gates) + 1, np.nan)
+    if len(arrays) < 2 or len(gates) == 0:
+        return times
+
+    ordered_gates = np.vstack([gates, gates[:1]])
+    path = np.column_stack([arrays.x[:-1], arrays.y[:-1], arrays.x[1:], arrays.y[1:]])
+    hits, points = utilities.segment_intersections(path, ordered_gates)
+
+    step = np.hypot(path[:, 2] - path[:, 0], path[:, 3] - path[:, 1])
+    covered = np.hypot(points[..., 0] - path[:, 0, None], points[..., 1] - path[:, 1, None])
+    fraction = np.clip(covered / np.where(step == 0, 1.0, step)[:, None], 0.0, 1.0)
+    crossing = arrays.time[:-1, None] + fraction * np.diff(arrays.time)[:, None]
+
+    first_frame = 0
+    for gate in range(len(ordered_gates)):
+        candidates = np.flatnonzero(hits[first_frame:, gate])
+        if len(candidates) == 0:
+            break
+        frame = first_frame + int(candidates[0])
+        times[gate] = crossing[frame, gate]
+        # the closing gate is the first gate again, so it can't be crossed in the same frame
+        first_frame = frame + 1 if gate == len(gates) - 1 else frame
+
+    completed = np.flatnonzero(arrays.completed)
+    if len(completed):
+        times[-1] = arrays.time[completed[0]]
+    return times
+
+
+def sector_splits(crossing_times: FloatArray) -> FloatArray:
+    """
+    :param crossing_times: output of gate_crossing_times
+    :return: time between consecutive gates (G values, NaN for sectors that were not completed)
+    """
+    return np.diff(crossing_times)
+
+
+def lap_fraction(arrays: ReplayArrays, index: centerline.CenterlineIndex) -> float:
+    """
+    Farthest point reached along the centerline, as a fraction of the lap. Progress is accumulated
+    frame by frame, so driving backwards over the finish line does not count as a lap.
+
+    :param arrays: replay columns
+    :param index: centerline of the replay track
+    :return: fraction in [0, 1]
+    """
+    if len(arrays) < 2:
+        return 0.0
+    progress, _ = index.project(np.stack([arrays.x, arrays.y], axis=1))
+    driven = np.cumsum(index.progress_delta(progress[:-1], progress[1:]))
+    return float(np.clip(driven.max() / index.length, 0.0, 1.0))
+
+
+_gates_cache: Dict[str, utilities.SegmentArray] = {}
+
+
+def _track_gates(track_path: str | None) -> utilities.SegmentArray:
+    if track_path is None:
+        return np.zeros((0, 4), dtype=float)
+    if track_path not in _gates_cache:
+        _gates_cache[track_path] = utilities.segments_to_array(utilities.load_gates_segments(track_path))
+    return _gates_cache[track_path]
+
+
+def _summary_row(filename: str) -> Tuple[tuple, FloatArray]:
+    arrays = load_replay_arrays(filename)
+    speed = speed_trace(arrays)
+    acceleration = acceleration_trace(arrays, speed)
+    crossings = gate_crossing_times(arrays, _track_gates(arrays.track_path))
+    crash = crash_location(arrays)
+    completed = bool(arrays.completed[-1]) if len(arrays) else False
+    duration = float(arrays.time[-1]) if len(arrays) else 0.0
+    if completed or arrays.track_path is None:
+        fraction = 1.0 if completed else np.nan
+    else:
+        fraction = lap_fraction(arrays, centerline.track_index(arrays.track_path))
+    row = (
+        filename,
+        arrays.track_path or "",
+        len(arrays),
+        duration,
+        completed,
+        crash is not None,
+        duration if completed else np.nan,
+        distance_travelled(arrays),
+        float(speed.mean()) if len(speed) else 0.0,
+        float(speed.max()) if len(speed) else 0.0,
+        float(np.abs(acceleration).max()) if len(acceleration) else 0.0,
+        int(np.count_nonzero(~np.isnan(crossings))),
+        fraction,
+        crash[0] if crash is not None else np.nan,
+        crash[1] if crash is not None else np.nan,
+    )
+    return row, sector_splits(crossings)
+
+
+# "U" columns are sized by summarize from their longest value
+_SUMMARY_FIELDS: List[Tuple[str, str]] = [
+    ("filename", "U"),
+    ("track_path", "U"),
+    ("frames", "i8"),
+    ("duration", "f8"),
+    ("completed", "?"),
+    ("crashed", "?"),
+    ("lap_time", "f8"),
+    ("distance", "f8"),
+    ("mean_speed", "f8"),
+    ("max_speed", "f8"),
+    ("max_acceleration", "f8"),
+    ("gates_reached", "i8"),
+    ("lap_fraction", "f8"),
+    ("crash_x", "f8"),
+    ("crash_y", "f8"),
+]
+
+
+def summarize(filenames: Sequence[str], workers: int | None = None) -> np.ndarray:
+    """
+    Compute the per-replay summary table. Sector splits are stored in the sector_<i> columns
+    (NaN for sectors that don't exist on a track or were not completed).
+
+    :param filenames: replay files inside the replay folder
+    :param workers: number of worker processes, None or 1 to run in this process
+    :return: numpy structured array with one row per replay
+    """
+    if workers is not None and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_summary_row, filenames, chunksize=16))
+    else:
+        results = [_summary_row(filename) for filename in filenames]
+
+    sectors = max((len(splits) for _, splits in results), default=0)
+    dtype = []
+    for column, (name, kind) in enumerate(_SUMMARY_FIELDS):
+        if kind == "U":
+            kind = f"U{max([len(row[column]) for row, _ in results] + [1])}"
+        dtype.append((name, kind))
+    dtype += [(f"sector_{i}", "f8") for i in range(sectors)]
+    table = np.empty(len(results), dtype=dtype)
+    for i, (row, splits) in enumerate(results):
+        padded = np.full(sectors, np.nan)
+        padded[: len(splits)] = splits
+        table[i] = row + tuple(padded)
+    return table
+
+
+def save_summary_csv(table: np.ndarray, filename: str) -> None:
+    """
+    Write the summary table as CSV.
+
+    :param table: output of summarize
+    :param filename: path of the CSV file
+    :return: None
+    """
+    names = list(table.dtype.names or ())
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for row in table.tolist():
+            writer.writerow(row)
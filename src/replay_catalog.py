@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+import make_replay
+import utilities
+
+CATALOG_FILENAME = "catalog.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS replays (
+    filename TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    track_path TEXT,
+    frame_count INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    completed INTEGER NOT NULL,
+    crashed INTEGER NOT NULL,
+    lap_time REAL,
+    crash_x REAL,
+    crash_y REAL,
+    crash_gate INTEGER,
+    crash_gate_distance REAL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS replays_track_lap ON replays (track_path, completed, lap_time);
+CREATE INDEX IF NOT EXISTS replays_track_crash ON replays (track_path, crashed, crash_gate);
+"""
+
+_COLUMNS = (
+    "filename, directory, track_path, frame_count, duration, completed, crashed, lap_time, "
+    "crash_x, crash_y, crash_gate, crash_gate_distance"
+)
+
+
+@dataclass
+class CatalogEntry:
+    """
+    Summary of a single replay file as stored in the catalog.
+    """
+
+    filename: str
+    directory: str
+    track_path: str | None
+    frame_count: int
+    duration: float
+    completed: bool
+    crashed: bool
+    lap_time: float | None
+    crash_x: float | None
+    crash_y: float | None
+    crash_gate: int | None
+    crash_gate_distance: float | None
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, self.filename)
+
+
+class ReplayCatalog:
+    """
+    SQLite index of the replay folder, so lap times and crash points can be queried
+    without opening every replay file.
+    """
+
+    def __init__(self, replays_path: str = make_replay.REPLAYS_PATH, db_path: str | None = None) -> None:
+        """
+        Open (or create) the catalog.
+
+        :param replays_path: folder containing the replay files, ending with a slash
+        :param db_path: path of the SQLite database, defaults to a file inside the replay folder
+        :return: None
+        """
+        self.replays_path: str = replays_path
+        self.db_path: str = db_path if db_path is not None else f"{replays_path}{CATALOG_FILENAME}"
+        self.connection: sqlite3.Connection = sqlite3.connect(self.db_path)
+        self.connection.executescript(_SCHEMA)
+        self._gates_cache: Dict[str, Optional[NDArray[np.float64]]] = {}
+
+    def __enter__(self) -> ReplayCatalog:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Close the database connection
+
+        :return: None
+        """
+        self.connection.close()
+
+    def add(self, filename: str, replay: make_replay.Replay) -> None:
+        """
+        Index (or re-index) an already saved replay.
+
+        :param filename: name of the replay file inside the replay folder
+        :param replay: replay contained in the file
+        :return: None
+        """
+        stat = os.stat(f"{self.replays_path}{filename}")
+        with self.connection:
+            self._insert(filename, replay, stat.st_mtime_ns, stat.st_size)
+
+    def sync(self) -> int:
+        """
+        Bring the catalog up to date with the replay folder. Only files that are new or
+        changed since they were last indexed are opened; rows of deleted files are dropped.
+
+        :return: number of replay files that were (re)indexed
+        """
+        known: Dict[str, Tuple[int, int]] = {
+            row[0]: (row[1], row[2]) for row in self.connection.execute("SELECT filename, mtime_ns, size FROM replays")
+        }
+        on_disk: Dict[str, Tuple[int, int]] = {}
+        with os.scandir(self.replays_path) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    on_disk[entry.name] = (stat.st_mtime_ns, stat.st_size)
+
+        indexed = 0
+        with self.connection:
+            for filename in known.keys() - on_disk.keys():
+                self.connection.execute("DELETE FROM replays WHERE filename = ?", (filename,))
+            for filename, (mtime_ns, size) in on_disk.items():
+                if known.get(filename) == (mtime_ns, size):
+                    continue
+                replay = make_replay.Replay()
+                try:
+                    replay.load_from_file(filename, self.replays_path)
+                except (OSError, ValueError, KeyError):
+                    continue
+                self._insert(filename, replay, mtime_ns, size)
+                indexed += 1
+        return indexed
+
+    def best_laps(self, track_path: str, limit: int = 10) -> List[CatalogEntry]:
+        """
+        Fastest completed laps on a track.
+
+        :param track_path: track folder as stored in the replays
+        :param limit: maximum number of laps returned
+        :return: entries ordered by lap time
+        """
+        return self._query(
+            "WHERE track_path = ? AND completed = 1 ORDER BY lap_time ASC LIMIT ?",
+            (track_path, limit),
+        )
+
+    def crashes_near_gate(self, track_path: str, gate: int, max_distance: float | None = None) -> List[CatalogEntry]:
+        """
+        Crashed replays whose crash point is closest to the given gate.
+
+        :param track_path: track folder as stored in the replays
+        :param gate: index of the gate (as in gates.txt)
+        :param max_distance: optional maximum distance between crash point and gate
+        :return: entries ordered by distance from the gate
+        """
+        query = "WHERE track_path = ? AND crashed = 1 AND crash_gate = ?"
+        params: Tuple[object, ...] = (track_path, gate)
+        if max_distance is not None:
+            query += " AND crash_gate_distance <= ?"
+            params += (max_distance,)
+        return self._query(query + " ORDER BY crash_gate_distance ASC", params)
+
+    def count(self, track_path: str | None = None) -> int:
+        """
+        Number of indexed replays, optionally restricted to a track.
+
+        :param track_path: track folder as stored in the replays
+        :return: number of rows
+        """
+        if track_path is None:
+            row = self.connection.execute("SELECT COUNT(*) FROM replays").fetchone()
+        else:
+            row = self.connection.execute("SELECT COUNT(*) FROM replays WHERE track_path = ?", (track_path,)).fetchone()
+        return int(row[0])
+
+    def _query(self, clause: str, params: Tuple[object, ...]) -> List[CatalogEntry]:
+        rows = self.connection.execute(f"SELECT {_COLUMNS} FROM replays {clause}", params).fetchall()
+        return [
+            CatalogEntry(
+                filename=row[0],
+                directory=row[1],
+                track_path=row[2],
+                frame_count=row[3],
+                duration=row[4],
+                completed=bool(row[5]),
+                crashed=bool(row[6]),
+                lap_time=row[7],
+                crash_x=row[8],
+                crash_y=row[9],
+                crash_gate=row[10],
+                crash_gate_distance=row[11],
+            )
+            for row in rows
+        ]
+
+    def _insert(self, filename: str, replay: make_replay.Replay, mtime_ns: int, size: int) -> None:
+        frame_count = len(replay.log)
+        last = replay.log[-1] if replay.log else None
+        duration = float(last.dt) if last is not None else 0.0
+        completed = last is not None and last.completed
+        crashed = last is not None and not last.alive
+        lap_time = duration if completed else None
+
+        crash_x: float | None = None
+        crash_y: float | None = None
+        crash_gate: int | None = None
+        crash_gate_distance: float | None = None
+        if crashed and last is not None:
+            crash_x, crash_y = float(last.x), float(last.y)
+            nearest = self._nearest_gate(replay.track_path, crash_x, crash_y)
+            if nearest is not None:
+                crash_gate, crash_gate_distance = nearest
+
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO replays ({_COLUMNS}, mtime_ns, size) VALUES ({', '.join('?' * 14)})",
+            (
+                filename,
+                self.replays_path,
+                replay.track_path,
+                frame_count,
+                duration,
+                int(completed),
+                int(crashed),
+                lap_time,
+                crash_x,
+                crash_y,
+                crash_gate,
+                crash_gate_distance,
+                mtime_ns,
+                size,
+            ),
+        )
+
+    def _nearest_gate(self, track_path: str | None, x: float, y: float) -> Tuple[int, float] | None:
+        """
+        Find the gate closest to a point.
+
+        :param track_path: track folder of the replay
+        :param x: point x
+        :param y: point y
+        :return: (gate index, distance) or None when the track gates are unavailable
+        """
+        if track_path is None:
+            return None
+        if track_path not in self._gates_cache:
+            try:
+                gates = utilities.load_gates_segments(track_path)
+            except OSError:
+                gates = []
+            self._gates_cache[track_path] = (
+                np.array([[g.x1, g.y1, g.x2, g.y2] for g in gates], dtype=float) if gates else None
+            )
+        gates_array = self._gates_cache[track_path]
+        if gates_array is None:
+            return None
+
+        p1 = gates_array[:, 0:2]
+        d = gates_array[:, 2:4] - p1
+        p = np.array([x, y], dtype=float)
+        length_sq = np.einsum("ij,ij->i", d, d)
+        t = np.clip(np.einsum("ij,ij->i", p - p1, d) / np.where(length_sq == 0, 1.0, length_sq), 0.0, 1.0)
+        distances = np.linalg.norm(p1 + d * t[:, None] - p, axis=1)
+        index = int(np.argmin(distances))
+        return index, float(distances[index])
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import csv
+import itertools
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+
+import car_stats
+import centerline
+import policy
+import simulation
+
+FloatArray = NDArray[np.float64]
+BoolArray = NDArray[np.bool_]
+
+MAX_TIME = 60.0  # Seconds after which a lap counts as not completed
+LOOKAHEAD = 200.0  # Distance along the centerline the driver steers towards
+MAX_SPEED = 500.0  # The driver lifts off above this speed
+BATCH = 256  # Setups simulated at once
+
+
+@dataclass
+class SweepResult:
+    """
+    Lap of one car setup.
+    """
+
+    parameters: Dict[str, float]
+    completed: bool
+    crashed: bool
+    lap_time: float  # NaN when the lap was not completed
+    gates: float  # fraction of the gates passed
+
+    def __str__(self) -> str:
+        setup = " ".join(f"{name}={value:g}" for name, value in self.parameters.items())
+        if self.completed:
+            return f"{self.lap_time:8.3f}s  {setup}"
+        status = "crashed" if self.crashed else "timeout"
+        return f"{status:>9} {setup} ({self.gates:.0%} of the gates)"
+
+
+def parse_grid(specs: Sequence[str]) -> Dict[str, List[float]]:
+    """
+    :param specs: "name=v1,v2,..." strings, name one of car_stats.PARAMETERS
+    :return: values to try for every parameter
+    """
+    grid: Dict[str, List[float]] = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        name = name.strip()
+        if name not in car_stats.PARAMETERS:
+            raise ValueError(f"Unknown car parameter {name!r}, expected one of {car_stats.PARAMETERS}")
+        if not values:
+            raise ValueError(f"No values given for {name}, expected {name}=v1,v2,...")
+        grid[name] = [float(v) for v in values.split(",")]
+    return grid
+
+
+def grid_setups(grid: Mapping[str, Sequence[float]]) -> List[Dict[str, float]]:
+    """
+    :param grid: values to try for every parameter
+    :return: every combination of the values, the other parameters keep their car_stats value
+    """
+    names = list(grid)
+    return [dict(zip(names, values, strict=True)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def centerline_controls(
+    cars: simulation.CarBatch,
+    index: centerline.CenterlineIndex,
+    max_speed: float,
+    offsets: FloatArray | None = None,
+) -> BoolArray:
+    """
+    Controls of a simple driver that steers towards the centerline LOOKAHEAD ahead and accelerates up to
+    max_speed, the batched version of the benchmarks lap driver.
+
+    :param cars: cars to drive
+    :param index: centerline of their track
+    :param max_speed: speed above which the driver lifts off
+    :param offsets: (N,) distance to the left of the centerline every car keeps, None to follow the centerline
+    :return: (N, 4) throttle, brake, left, right
+    """
+    progress, _ = index.project(np.stack([cars.x, cars.y], axis=1))
+    target = centerline.sample_ring(index.starts, progress + LOOKAHEAD)
+    if offsets is not None:
+        tangent = centerline.sample_ring(index.starts, progress + LOOKAHEAD + 1.0) - target
+        tangent /= np.linalg.norm(tangent, axis=1, keepdims=True)
+        target += np.stack([-tangent[:, 1], tangent[:, 0]], axis=1) * offsets[:, None]
+    target_x, target_y = target[:, 0], target[:, 1]
+    heading = np.radians(cars.heading)
+    side = np.cos(heading) * (target_y - cars.y) - np.sin(heading) * (target_x - cars.x)
+    controls = np.zeros((cars.count, 4), dtype=bool)
+    controls[:, 0] = np.linalg.norm(cars.velocity, axis=1) < max_speed
+    controls[:, 2] = side > 0
+    controls[:, 3] = side < 0
+    return controls
+
+
+def run_setups(
+    track_path: str,
+    setups: Sequence[Mapping[str, float]],
+    driver: policy.Policy | None = None,
+    max_speed: float = MAX_SPEED,
+    max_time: float = MAX_TIME,
+    dt: float = car_stats.physics_dt,
+) -> List[SweepResult]:
+    """
+    Drive one lap per setup, all setups at once in a CarBatch where every car has its own parameters.
+
+    :param track_path: Path to the track folder
+    :param setups: parameter values of every setup
+    :param driver: policy driving the cars from their sensors, None for the centerline driver
+    :param max_speed: speed limit of the centerline driver
+    :param max_time: seconds after which a lap counts as not completed
+    :param dt: simulation step
+    :return: one result per setup, in order
+    """
+    cars = simulation.CarBatch.from_track(len(setups), track_path)
+    for name in {name for setup in setups for name in setup}:
+        default = float(getattr(car_stats, name))
+        cars.set_parameters({name: np.array([setup.get(name, default) for setup in setups])})
+    index = centerline.track_index(track_path)
+    cars.sensors = driver is not None
+    if driver is not None:
+        cars.calculate_distances(np.arange(cars.count))
+
+    lap_time = np.full(cars.count, np.nan)
+    while (cars.alive & ~cars.completed).any() and cars.current_time[0] < max_time:
+        if driver is None:
+            controls = centerline_controls(cars, index, max_speed)
+        else:
+            controls = policy.ACTION_CONTROLS[driver.act_batch(policy.observation(cars.distances, cars.speed()))]
+        cars.step(controls[:, 0], controls[:, 1], controls[:, 2], controls[:, 3], dt)
+        finished = cars.completed & np.isnan(lap_time)
+        lap_time[finished] = cars.current_time[finished]
+
+    gate_count = max(len(cars.gates), 1)
+    return [
+        SweepResult(
+            dict(setup),
+            bool(cars.completed[i]),
+            not bool(cars.alive[i]),
+            float(lap_time[i]),
+            float(cars.next_gate[i]) / gate_count,
+        )
+        for i, setup in enumerate(setups)
+    ]
+
+
+def sweep(
+    track_path: str,
+    grid: Mapping[str, Sequence[float]],
+    driver: policy.Policy | None = None,
+    max_speed: float = MAX_SPEED,
+    batch: int = BATCH,
+) -> List[SweepResult]:
+    """
+    Lap time of every combination of parameter values, fastest first.
+
+    :param track_path: Path to the track folder
+    :param grid: values to try for every parameter
+    :param driver: policy driving the cars, None for the centerline driver
+    :param max_speed: speed limit of the centerline driver
+    :param batch: setups simulated at once
+    :return: results sorted by lap time, laps that were not completed last
+    """
+    setups = grid_setups(grid)
+    results: List[SweepResult] = []
+    for start in range(0, len(setups), batch):
+        results.extend(run_setups(track_path, setups[start : start + batch], driver, max_speed))
+    return sorted(results, key=lambda r: (not r.completed, r.lap_time if r.completed else -r.gates))
+
+
+def save_results(results: Sequence[SweepResult], filename: str) -> None:
+    """
+    Write the results as CSV, one row per setup.
+
+    :param results: sweep results
+    :param filename: path of the CSV file
+    :return: None
+    """
+    names = sorted({name for result in results for name in result.parameters})
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([*names, "completed", "crashed", "lap_time", "gates"])
+        for r in results:
+            values = [r.parameters.get(name, "") for name in names]
+            writer.writerow(
+                [*values, int(r.completed), int(r.crashed), "" if np.isnan(r.lap_time) else r.lap_time, r.gates]
+            )
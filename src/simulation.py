@@ -0,0 +1,405 @@
+from __future__ import annotations
+
+from typing import Dict, List, Mapping, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+import car_stats
+import graphics_constants
+import track_compiler
+import utilities
+from car_state import STATE_FIELDS, BatchState, CarState
+
+FloatArray = NDArray[np.float64]
+BoolArray = NDArray[np.bool_]
+IntArray = NDArray[np.int64]
+
+SENSOR_DIRECTIONS = np.array([0.0, 90.0, -90.0, 45.0, -45.0])  # Same order as Car.distances
+SENSOR_LENGTH = 10000.0
+CHUNK = 128  # Cars tested against the borders at once, bounds the size of the intersection tables
+# Parameters read by _physics_step, the others are applied once per step
+_STEP_PARAMETERS = (
+    "wheel_base",
+    "friction",
+    "drag",
+    "max_speed_reverse",
+    "slip_speed1",
+    "slip_speed2",
+    "traction_fast",
+    "traction_mid",
+    "traction_slow",
+)
+
+
+class CarBatch:
+    """
+    Headless, vectorized version of the driven Car: the state of many cars lives in numpy arrays
+    and every step advances all of them at once. The physics follow Car.update step by step.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        start: Tuple[float, float, float],
+        borders: List[utilities.Segment],
+        gates: List[utilities.Segment],
+    ) -> None:
+        """
+        Create count cars at the start position.
+
+        :param count: number of cars
+        :param start: (x, y, heading) start pose
+        :param borders: track borders
+        :param gates: track gates (the first gate is appended again as the finish line, as in Car)
+        """
+        self.count: int = count
+        self.start_x, self.start_y, self.start_heading = (float(v) for v in start)
+        self.width, self.height = (float(v) for v in utilities.read_png_size(graphics_constants.car_image_path))
+
+        self.borders: utilities.SegmentArray = utilities.segments_to_array(borders)
+        gates_array = utilities.segments_to_array(gates)
+        self.gates: utilities.SegmentArray = np.vstack([gates_array, gates_array[:1]]) if len(gates) else gates_array
+
+        self.x: FloatArray = np.zeros(count)
+        self.y: FloatArray = np.zeros(count)
+        self.heading: FloatArray = np.zeros(count)
+        self.velocity: FloatArray = np.zeros((count, 2))
+        self.steering_direction: FloatArray = np.zeros(count)
+        self.going_reverse: FloatArray = np.zeros(count)
+        self.alive: BoolArray = np.ones(count, dtype=bool)
+        self.completed: BoolArray = np.zeros(count, dtype=bool)
+        self.next_gate: IntArray = np.zeros(count, dtype=np.int64)
+        self.current_time: FloatArray = np.zeros(count)
+        self.last_timer: FloatArray = np.zeros(count)
+        self.distances: FloatArray = np.zeros((count, 5))
+        self.sensor_points: FloatArray = np.zeros((count, 5, 2))
+        # Cast the sensor rays after every step; rollouts that only need poses turn it off
+        self.sensors: bool = True
+        # Handling of every car, car_stats values unless set_parameters overrides them
+        self.parameters: Dict[str, FloatArray] = {
+            name: np.full(count, float(getattr(car_stats, name))) for name in car_stats.PARAMETERS
+        }
+        self.reset()
+
+    @classmethod
+    def from_track(cls, count: int, track_path: str, compiled: bool = False) -> CarBatch:
+        """
+        Create count cars on a track folder.
+
+        :param count: number of cars
+        :param track_path: Path to the track folder
+        :param compiled: drive on the simplified borders of the folder's compiled.npz (see track_compiler)
+        :return: CarBatch
+        """
+        if compiled:
+            return cls.from_compiled(count, track_compiler.load_compiled(track_path))
+        return cls(
+            count,
+            utilities.read_position(track_path),
+            utilities.load_track_segments(track_path),
+            utilities.load_gates_segments(track_path),
+        )
+
+    @classmethod
+    def from_compiled(cls, count: int, track: track_compiler.CompiledTrack) -> CarBatch:
+        """
+        Create count cars on a compiled track, whose simplified borders make collision checks cheaper.
+
+        :param count: number of cars
+        :param track: compiled track
+        :return: CarBatch
+        """
+        cars = cls(count, track.start, [], [])
+        cars.borders = track.borders()
+        cars.gates = np.vstack([track.gates, track.gates[:1]]) if len(track.gates) else track.gates
+        return cars
+
+    def set_parameters(
+        self, values: Mapping[str, float | FloatArray], indices: IntArray | BoolArray | None = None
+    ) -> None:
+        """
+        Change the handling of some cars, e.g. to compare many car setups in one batch.
+
+        :param values: new value of parameters named in car_stats.PARAMETERS, one for all selected cars
+                       or one per selected car
+        :param indices: cars to change (indices or mask), None for all
+        :return: None
+        """
+        index: slice | IntArray | BoolArray = slice(None) if indices is None else indices
+        for name, value in values.items():
+            if name not in self.parameters:
+                raise ValueError(f"Unknown car parameter {name!r}, expected one of {car_stats.PARAMETERS}")
+            self.parameters[name][index] = value
+
+    def reset(self, indices: IntArray | BoolArray | None = None) -> None:
+        """
+        Put cars back on the start pose, as Car.restart does.
+
+        :param indices: cars to reset (indices or mask), None for all
+        :return: None
+        """
+        index: slice | IntArray | BoolArray = slice(None) if indices is None else indices
+        self.x[index] = self.start_x
+        self.y[index] = self.start_y
+        self.heading[index] = self.start_heading
+        self.velocity[index] = 0.0
+        self.steering_direction[index] = 0.0
+        self.going_reverse[index] = 0.0
+        self.alive[index] = True
+        self.completed[index] = False
+        self.next_gate[index] = 0
+        self.current_time[index] = 0.0
+        self.last_timer[index] = 0.0
+        self.sensor_points[index] = np.stack([self.x[index], self.y[index]], axis=-1)[..., None, :]
+        self.distances[index] = 0.0
+
+    def snapshot(self, indices: IntArray | BoolArray | None = None) -> BatchState:
+        """
+        Copy the state of some cars.
+
+        :param indices: cars to copy (indices or mask), None for all
+        :return: BatchState with one row per selected car
+        """
+        index: slice | IntArray | BoolArray = slice(None) if indices is None else indices
+        return BatchState(*(getattr(self, name)[index].copy() for name in STATE_FIELDS))
+
+    def restore(self, state: BatchState | CarState, indices: IntArray | BoolArray | None = None) -> None:
+        """
+        Put cars in a saved state. A single-car state (a CarState or a BatchState of one row) is copied into
+        every selected car, which branches them all from the same point.
+
+        :param state: state taken by snapshot, Car.snapshot or BatchState.stack
+        :param indices: cars to overwrite (indices or mask), None for all
+        :return: None
+        """
+        index: slice | IntArray | BoolArray = slice(None) if indices is None else indices
+        for name in STATE_FIELDS:
+            getattr(self, name)[index] = getattr(state, name)
+
+    def clone(self, source: int | IntArray, targets: IntArray | BoolArray) -> None:
+        """
+        Copy the state of cars of the batch into other cars of the batch, e.g. to run rollouts from a car.
+
+        :param source: car to copy into every target, or one source car per target
+        :param targets: cars to overwrite
+        :return: None
+        """
+        for name in STATE_FIELDS:
+            array = getattr(self, name)
+            array[targets] = array[source]
+
+    def speed(self) -> FloatArray:
+        """
+        :return: signed speed of every car (negative when reversing), as returned by Car.update
+        """
+        speed = np.linalg.norm(self.velocity, axis=1)
+        return np.asarray(np.where(self.going_reverse < 0, -speed, speed))
+
+    def step(
+        self, throttle: BoolArray, brake: BoolArray, left: BoolArray, right: BoolArray, dt: float, repeat: int = 1
+    ) -> None:
+        """
+        Advance every running car by repeat physics steps of dt, holding the given controls (W, S, A, D)
+        through all of them. Gates and borders are checked after every substep, like Car.update, but the
+        sensors are only cast after the last one: they are the most expensive part of a step and only the
+        final observation is read. Crashed and finished cars only advance their clock, like Car.update.
+
+        :param throttle: (N,) W pressed
+        :param brake: (N,) S pressed
+        :param left: (N,) A pressed
+        :param right: (N,) D pressed
+        :param dt: delta time of one physics step
+        :param repeat: physics steps the controls are held for
+        :return: None
+        """
+        # get_input, once for all the substeps
+        parameters = self.parameters
+        steering = (left.astype(float) - right.astype(float)) * parameters["steering_angle"]
+        power = throttle * parameters["engine_power"] + brake * parameters["braking"]
+        still = np.empty(0, dtype=np.int64)
+        for _ in range(repeat):
+            still = self._physics_step(steering, power, dt)
+        if self.sensors:
+            self.calculate_distances(still)
+
+    def _physics_step(self, steering_all: FloatArray, power: FloatArray, dt: float) -> IntArray:
+        """
+        Advance the running cars by one physics step and check their gates and borders.
+
+        :param steering_all: (N,) steering angle of every car
+        :param power: (N,) acceleration along the heading of every car
+        :param dt: delta time
+        :return: cars still running after the step
+        """
+        self.current_time += dt
+        active = np.flatnonzero(self.alive & ~self.completed)
+        if len(active) == 0:
+            return active
+
+        heading = self.heading[active]
+        velocity = self.velocity[active]
+        direction = np.stack([np.cos(np.radians(heading)), np.sin(np.radians(heading))], axis=1)
+
+        steering = steering_all[active]
+        acceleration = direction * power[active, None]
+        parameters = {name: self.parameters[name][active] for name in _STEP_PARAMETERS}
+
+        # apply_friction
+        speed = np.linalg.norm(velocity, axis=1)
+        slow = speed < 5
+        velocity[slow] = 0.0
+        moving = ~slow
+        acceleration[moving] += (
+            -velocity[moving] * parameters["friction"][moving, None]
+            - velocity[moving] * speed[moving, None] * parameters["drag"][moving, None]
+        )
+        velocity = velocity + acceleration * dt
+
+        # calculate_steering
+        position = np.stack([self.x[active], self.y[active]], axis=1)
+        half_base = (parameters["wheel_base"] / 2.0)[:, None]
+        rear_wheel = position - half_base * direction + velocity * dt
+        c = np.cos(np.radians(steering))
+        s = np.sin(np.radians(steering))
+        rotated = np.stack([c * velocity[:, 0] - s * velocity[:, 1], s * velocity[:, 0] + c * velocity[:, 1]], axis=1)
+        front_wheel = position + half_base * direction + rotated * dt
+        position = (rear_wheel + front_wheel) / 2
+
+        new_heading = _normalized(front_wheel - rear_wheel)
+        speed = np.linalg.norm(velocity, axis=1)
+        traction = np.where(
+            speed > parameters["slip_speed2"],
+            parameters["traction_fast"],
+            np.where(speed > parameters["slip_speed1"], parameters["traction_mid"], parameters["traction_slow"]),
+        )
+        going_reverse = np.einsum("ij,ij->i", new_heading, _normalized(velocity))
+        angles = np.degrees(np.arctan2(new_heading[:, 1], new_heading[:, 0]))
+        heading = np.where(angles < 0, angles + 360, angles)
+
+        forward = (speed > 0) & (going_reverse > 0)
+        aligned = new_heading * speed[:, None]
+        close = np.all(np.isclose(aligned, velocity), axis=1)
+        blend = forward & ~close & ~np.isclose(aligned[:, 0], 0) & ~np.isclose(aligned[:, 1], 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_min = np.minimum(velocity[:, 0], aligned[:, 0])
+            x_max = np.maximum(velocity[:, 0], aligned[:, 0])
+            new_x = x_min + traction * (x_max - x_min)
+            new_y = velocity[:, 1] + ((aligned[:, 1] - velocity[:, 1]) / (aligned[:, 0] - velocity[:, 0])) * (
+                new_x - velocity[:, 0]
+            )
+        reverse = (speed > 0) & (going_reverse < 0)
+        new_velocity = velocity.copy()
+        new_velocity[forward] = aligned[forward]
+        new_velocity[blend] = np.stack([new_x[blend], new_y[blend]], axis=1)
+        max_reverse = parameters["max_speed_reverse"][reverse]
+        new_velocity[reverse] = -new_heading[reverse] * np.minimum(speed[reverse], max_reverse)[:, None]
+
+        self.x[active] = position[:, 0]
+        self.y[active] = position[:, 1]
+        self.heading[active] = heading
+        self.velocity[active] = new_velocity
+        self.steering_direction[active] = steering
+        self.going_reverse[active] = going_reverse
+
+        # gates, then borders, then sensors, in the same order as Car.update
+        edges = self.edges(active)
+        passed = self.crosses_next_gate(active, edges)
+        self.next_gate[active[passed]] += 1
+        finished = passed & (self.next_gate[active] == len(self.gates))
+        self.completed[active[finished]] = True
+
+        running = ~finished
+        crashed = np.zeros(len(active), dtype=bool)
+        crashed[running] = self.crosses_border(edges[running])
+        self.alive[active[crashed]] = False
+
+        still = active[running & ~crashed]
+        self.last_timer[still] = np.round(self.current_time[still], 2)
+        return np.asarray(still)
+
+    def edges(self, indices: IntArray) -> FloatArray:
+        """
+        :param indices: cars to consider
+        :return: (len(indices), 4, 4) edges of the cars, in the order of Car.get_edges
+        """
+        v = utilities.rectangle_vertices(
+            self.x[indices], self.y[indices], self.heading[indices], self.width, self.height
+        )
+        return np.stack(
+            [
+                np.concatenate([v[:, 0], v[:, 2]], axis=1),
+                np.concatenate([v[:, 1], v[:, 3]], axis=1),
+                np.concatenate([v[:, 0], v[:, 1]], axis=1),
+                np.concatenate([v[:, 2], v[:, 3]], axis=1),
+            ],
+            axis=1,
+        )
+
+    def crosses_next_gate(self, indices: IntArray, edges: FloatArray) -> BoolArray:
+        """
+        :param indices: cars to consider
+        :param edges: their edges
+        :return: whether each car touches its next gate
+        """
+        if len(self.gates) == 0:
+            return np.zeros(len(indices), dtype=bool)
+        pending = self.next_gate[indices] < len(self.gates)
+        gates = self.gates[np.minimum(self.next_gate[indices], len(self.gates) - 1)]
+        hits, _ = utilities.broadcast_segment_intersections(edges, gates[:, None, :])
+        return np.asarray(pending & hits.any(axis=1))
+
+    def crosses_border(self, edges: FloatArray) -> BoolArray:
+        """
+        :param edges: (N, 4, 4) car edges
+        :return: whether each car touches any border
+        """
+        result = np.zeros(len(edges), dtype=bool)
+        if len(self.borders) == 0:
+            return result
+        for start in range(0, len(edges), CHUNK):
+            chunk = edges[start : start + CHUNK]
+            hits, _ = utilities.broadcast_segment_intersections(chunk[:, :, None, :], self.borders[None, None, :, :])
+            result[start : start + CHUNK] = hits.any(axis=(1, 2))
+        return result
+
+    def calculate_distances(self, indices: IntArray) -> None:
+        """
+        Cast the five sensor rays of the given cars, as Car.calculate_distances does.
+
+        :param indices: cars to update
+        :return: None
+        """
+        if len(indices) == 0:
+            return
+        angles = np.radians(self.heading[indices, None] + SENSOR_DIRECTIONS[None, :])
+        origin = np.stack([self.x[indices], self.y[indices]], axis=1)
+        ends = origin[:, None, :] + SENSOR_LENGTH * np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+        rays = np.concatenate([np.broadcast_to(origin[:, None, :], ends.shape), ends], axis=-1)
+
+        no_hit = np.array([SENSOR_LENGTH, SENSOR_LENGTH])
+        closest = np.broadcast_to(no_hit, ends.shape).copy()
+        if len(self.borders):
+            for start in range(0, len(indices), CHUNK):
+                chunk = slice(start, start + CHUNK)
+                hits, points = utilities.broadcast_segment_intersections(
+                    rays[chunk, :, None, :], self.borders[None, None, :, :]
+                )
+                hit_distances = np.where(hits, np.linalg.norm(points - origin[chunk, None, None, :], axis=-1), np.inf)
+                nearest = np.argmin(hit_distances, axis=2)
+                best = np.take_along_axis(hit_distances, nearest[..., None], axis=2)[..., 0]
+                best_points = np.take_along_axis(points, nearest[..., None, None], axis=2)[:, :, 0, :]
+                no_hit_distance = np.linalg.norm(no_hit - origin[chunk], axis=1)[:, None]
+                use = best < no_hit_distance
+                closest[chunk][use] = best_points[use]
+
+        self.sensor_points[indices] = closest
+        self.distances[indices] = np.linalg.norm(closest - origin[:, None, :], axis=-1)
+
+
+def _normalized(v: FloatArray) -> FloatArray:
+    """
+    Row-wise utilities.normalized: zero rows stay zero.
+    """
+    n = np.linalg.norm(v, axis=1)
+    return np.asarray(v / np.where(n == 0, 1.0, n)[:, None])
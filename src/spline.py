@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+FloatArray = NDArray[np.float64]
+
+
+def _evaluate_segments(
+    controls: FloatArray,
+    first: int,
+    stop: int,
+    resolution: int,
+    width: int | None,
+    height: int | None,
+) -> FloatArray:
+    """
+    Evaluate the spline segments first..stop-1 at all parameters at once. Segment i goes from
+    control point i to i+1; the first and last control points are repeated as end tangents.
+
+    :param controls: (n, 2) control points, n >= 2
+    :param first: first segment to evaluate
+    :param stop: one past the last segment to evaluate
+    :param resolution: number of interpolated points generated between each pair of control points
+    :param width: optional max X value, points are truncated to integers and clamped to [0, width]
+    :param height: optional max Y value, points are truncated to integers and clamped to [0, height]
+    :return: ((stop - first) * (resolution + 1), 2) points
+    """
+    padded = np.vstack([controls[:1], controls, controls[-1:]])
+    p0 = padded[first:stop, None, :]
+    p1 = padded[first + 1 : stop + 1, None, :]
+    p2 = padded[first + 2 : stop + 2, None, :]
+    p3 = padded[first + 3 : stop + 3, None, :]
+    t = np.linspace(0, 1, resolution + 1, endpoint=False)[None, :, None]
+    t2 = t * t
+    t3 = t2 * t
+    f = 0.5 * ((2 * p1) + (-p0 + p2) * t + (2 * p0 - 5 * p1 + 4 * p2 - p3) * t2 + (-p0 + 3 * p1 - 3 * p2 + p3) * t3)
+    if width is not None:
+        f[..., 0] = np.clip(np.trunc(f[..., 0]), 0, width)
+    if height is not None:
+        f[..., 1] = np.clip(np.trunc(f[..., 1]), 0, height)
+    return np.asarray(f.reshape(-1, 2))
+
+
+def _last_point(controls: FloatArray, width: int | None, height: int | None) -> FloatArray:
+    """
+    The last control point closes the spline; it is clamped but, unlike the interpolated points, not truncated.
+    """
+    last: FloatArray = np.array(controls[-1], dtype=float)
+    if width is not None:
+        last[0] = max(0, min(width, last[0]))
+    if height is not None:
+        last[1] = max(0, min(height, last[1]))
+    return last
+
+
+def catmull_rom_spline(
+    points: list[list[float]],
+    resolution: int = 10,
+    width: int | None = None,
+    height: int | None = None,
+) -> list[list[float]]:
+    """
+    Generate a Catmull-Rom spline that interpolates between the given points,
+    optionally clamping points to the [0,width] x [0,height] rectangle.
+
+    :param points: List of (x, y) float list representing control points.
+    :param resolution: Number of interpolated points generated between each pair of input points.
+    :param width: Optional max X value.
+    :param height: Optional max Y value.
+    :return: List of [x, y] points representing the smoothed spline.
+    """
+    if len(points) < 2 or resolution == 0:
+        return points.copy()
+    controls = np.asarray(points, dtype=float)
+    samples = np.vstack(
+        [
+            _evaluate_segments(controls, 0, len(controls) - 1, resolution, width, height),
+            _last_point(controls, width, height),
+        ]
+    )
+    result: list[list[float]] = samples.tolist()
+    return result
+
+
+def closed_catmull_rom_spline(controls: FloatArray, resolution: int = 10) -> FloatArray:
+    """
+    Catmull-Rom spline through a closed loop of control points: the last control point joins the first
+    one and the tangents wrap around, so the loop is smooth everywhere.
+
+    :param controls: (n, 2) control points, n >= 3, without a repeated first point
+    :param resolution: number of interpolated points generated between each pair of control points
+    :return: (n * (resolution + 1), 2) ring points, the closing segment is implicit
+    """
+    controls = np.asarray(controls, dtype=float)
+    wrapped = np.vstack([controls[-1:], controls, controls[:2]])
+    return _evaluate_segments(wrapped, 1, len(controls) + 1, resolution, None, None)
+
+
+class IncrementalSpline:
+    """
+    Catmull-Rom spline that keeps its samples between edits. When the control points change,
+    only the segments whose four control points include an edited one are evaluated again.
+    """
+
+    def __init__(self, resolution: int = 10, width: int | None = None, height: int | None = None) -> None:
+        """
+        :param resolution: number of interpolated points generated between each pair of control points
+        :param width: optional max X value
+        :param height: optional max Y value
+        """
+        self.resolution: int = resolution
+        self.width: int | None = width
+        self.height: int | None = height
+        self.controls: FloatArray = np.zeros((0, 2))
+        self.samples: FloatArray = np.zeros((0, 2))
+
+    def update(self, points: list[list[float]]) -> Tuple[int, int]:
+        """
+        Bring the samples up to date with the given control points.
+
+        :param points: all control points
+        :return: range [start, stop) of samples that changed, including samples that were added
+        """
+        controls = np.asarray(points, dtype=float).reshape(-1, 2)
+        old = self.controls
+        common = min(len(old), len(controls))
+        differing = np.flatnonzero(np.any(old[:common] != controls[:common], axis=1))
+        if len(old) != len(controls):
+            first, last = (int(differing[0]) if len(differing) else common), len(controls) - 1
+        elif len(differing):
+            first, last = int(differing[0]), int(differing[-1])
+        else:
+            return 0, 0
+        self.controls = controls
+
+        if len(controls) < 2 or self.resolution == 0:
+            if len(old) >= 2 and self.resolution > 0:
+                first = 0  # the samples were interpolated points until now
+            self.samples = controls.copy()
+            return first, len(controls) if len(old) != len(controls) else last + 1
+
+        # Segment i uses control points i-1..i+2, so point j moves segments j-2..j+1
+        step = self.resolution + 1
+        segments = len(controls) - 1
+        first_segment = max(first - 2, 0)
+        stop_segment = min(last + 2, segments)
+        if len(self.samples) != segments * step + 1:
+            samples = np.empty((segments * step + 1, 2))
+            kept = min(len(self.samples) - 1, first_segment * step) if len(old) >= 2 else 0
+            samples[:kept] = self.samples[:kept]
+            first_segment = kept // step
+            stop_segment = segments
+            self.samples = samples
+        start = first_segment * step
+        self.samples[start : stop_segment * step] = _evaluate_segments(
+            controls, first_segment, stop_segment, self.resolution, self.width, self.height
+        )
+        self.samples[-1] = _last_point(controls, self.width, self.height)
+        return start, len(self.samples) if stop_segment == segments else stop_segment * step
+
+    def set_resolution(self, resolution: int) -> None:
+        """
+        Change the resolution, evaluating every segment again.
+
+        :param resolution: number of interpolated points generated between each pair of control points
+        :return: None
+        """
+        self.resolution = resolution
+        controls = self.controls
+        self.controls = np.zeros((0, 2))
+        self.samples = np.zeros((0, 2))
+        self.update(controls.tolist())
+
+    def tolist(self) -> list[list[float]]:
+        """
+        :return: samples as a list of [x, y], as returned by catmull_rom_spline
+        """
+        result: list[list[float]] = self.samples.tolist()
+        return result
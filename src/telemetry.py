@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import queue
+import threading
+import time
+from typing import IO, Any, Dict, List
+
+import numpy as np
+from numpy.typing import NDArray
+
+TELEMETRY_INTERVAL = 5.0  # Seconds between two rows
+FIELDS = (
+    "time",
+    "elapsed",
+    "steps",
+    "episodes",
+    "steps_per_second",
+    "env_steps_per_second",
+    "episodes_per_second",
+    "laps",
+    "mean_lap_time",
+    "crash_rate",
+    "mean_gates",
+    "td_error",
+    "q_mean",
+    "q_min",
+    "q_max",
+    "q_visited",
+    "epsilon",
+    "utilization",
+    "cpu_utilization",
+    "max_step_ms",
+)
+
+
+class TrainingTelemetry:
+    """
+    Throughput and learning metrics of a training run. The hot loop only adds to counters in memory; every
+    interval they are turned into one row, which a writer thread appends to a newline-delimited JSON file
+    (or CSV when the path ends with .csv), so that the loop never waits on the disk.
+
+    Rates and means cover the interval since the previous row, so throughput regressions and stalls show up
+    as they happen instead of being averaged over the whole run:
+
+        telemetry.start()
+        while training:
+            start = time.perf_counter()
+            ... one step, calling record_learning and record_episodes ...
+            telemetry.end_step(time.perf_counter() - start, q, epsilon)
+        telemetry.close()
+    """
+
+    def __init__(self, path: str, environments: int, interval: float = TELEMETRY_INTERVAL) -> None:
+        """
+        :param path: .jsonl or .csv file the rows are appended to
+        :param environments: car physics steps simulated per training step
+        :param interval: seconds between two rows
+        """
+        self.path: str = path
+        self.environments: int = environments
+        self.interval: float = interval
+        self.csv: bool = path.lower().endswith(".csv")
+        self.rows: queue.Queue[Dict[str, Any] | None] = queue.Queue()
+        self.writer: threading.Thread | None = None
+        self.file: IO[str] | None = None
+
+        self.steps: int = 0
+        self.episodes: int = 0
+        self.laps: int = 0
+        self.started: float = 0.0
+        self._reset_interval(time.perf_counter())
+
+    def _reset_interval(self, now: float) -> None:
+        self.interval_start: float = now
+        self.cpu_start: float = time.process_time()
+        self.next_row: float = now + self.interval
+        self.interval_steps: int = 0
+        self.busy: float = 0.0
+        self.max_step: float = 0.0
+        self.td_error: float = 0.0
+        self.interval_episodes: int = 0
+        self.crashes: int = 0
+        self.lap_times: float = 0.0
+        self.interval_laps: int = 0
+        self.gates: int = 0
+
+    def start(self) -> None:
+        """
+        Open the output file and start the writer thread.
+
+        :return: None
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, "a", encoding="utf-8", newline="")
+        self.writer = threading.Thread(target=self._write_rows, name="telemetry", daemon=True)
+        self.writer.start()
+        self.started = time.perf_counter()
+        self._reset_interval(self.started)
+
+    def record_learning(self, td_error: float) -> None:
+        """
+        :param td_error: mean absolute temporal difference error of the step's updates
+        :return: None
+        """
+        self.td_error += td_error
+
+    def record_episodes(self, crashed: int, lap_times: NDArray[np.float64], gates: NDArray[np.int64]) -> None:
+        """
+        Count finished episodes.
+
+        :param crashed: episodes ended by a crash
+        :param lap_times: times of the episodes ended by a completed lap
+        :param gates: gates reached by every finished episode
+        :return: None
+        """
+        self.interval_episodes += len(gates)
+        self.crashes += crashed
+        self.interval_laps += len(lap_times)
+        self.lap_times += float(lap_times.sum())
+        self.gates += int(gates.sum())
+
+    def end_step(self, seconds: float, q: NDArray[np.float64], epsilon: float) -> None:
+        """
+        Count a step and emit a row when the interval is over.
+
+        :param seconds: time spent in the step
+        :param q: Q-table, only read when a row is emitted
+        :param epsilon: current exploration rate
+        :return: None
+        """
+        self.steps += 1
+        self.interval_steps += 1
+        self.busy += seconds
+        if seconds > self.max_step:
+            self.max_step = seconds
+        now = time.perf_counter()
+        if now >= self.next_row:
+            self.emit(q, epsilon, now)
+
+    def emit(self, q: NDArray[np.float64], epsilon: float, now: float | None = None) -> Dict[str, Any]:
+        """
+        Turn the counters of the current interval into a row, queue it for writing and start a new interval.
+
+        :param q: Q-table
+        :param epsilon: current exploration rate
+        :param now: current time of time.perf_counter(), read if not given
+        :return: the row
+        """
+        now = time.perf_counter() if now is None else now
+        wall = max(now - self.interval_start, 1e-9)
+        self.episodes += self.interval_episodes
+        self.laps += self.interval_laps
+        visited = q[q != 0]
+        row: Dict[str, Any] = {
+            "time": time.time(),
+            "elapsed": now - self.started,
+            "steps": self.steps,
+            "episodes": self.episodes,
+            "steps_per_second": self.interval_steps / wall,
+            "env_steps_per_second": self.interval_steps * self.environments / wall,
+            "episodes_per_second": self.interval_episodes / wall,
+            "laps": self.laps,
+            "mean_lap_time": _mean(self.lap_times, self.interval_laps),
+            "crash_rate": _mean(self.crashes, self.interval_episodes),
+            "mean_gates": _mean(self.gates, self.interval_episodes),
+            "td_error": _mean(self.td_error, self.interval_steps),
+            "q_mean": float(visited.mean()) if len(visited) else None,
+            "q_min": float(visited.min()) if len(visited) else None,
+            "q_max": float(visited.max()) if len(visited) else None,
+            "q_visited": len(visited) / q.size,
+            "epsilon": epsilon,
+            "utilization": self.busy / wall,
+            "cpu_utilization": (time.process_time() - self.cpu_start) / wall,
+            "max_step_ms": self.max_step * 1000,
+        }
+        self.rows.put(row)
+        self._reset_interval(now)
+        return row
+
+    def _write_rows(self) -> None:
+        """
+        Writer thread: append queued rows until close() queues None.
+        """
+        assert self.file is not None
+        writer = csv.DictWriter(self.file, FIELDS) if self.csv else None
+        if writer is not None and self.file.tell() == 0:
+            writer.writeheader()
+        while True:
+            row = self.rows.get()
+            if row is None:
+                break
+            if writer is not None:
+                writer.writerow({k: "" if v is None else v for k, v in row.items()})
+            else:
+                self.file.write(json.dumps(row) + "\n")
+            self.file.flush()
+
+    def close(self, q: NDArray[np.float64] | None = None, epsilon: float = 0.0) -> None:
+        """
+        Emit the last partial interval when a Q-table is given, then write the queued rows and close the file.
+
+        :param q: Q-table
+        :param epsilon: current exploration rate
+        :return: None
+        """
+        if q is not None and self.interval_steps:
+            self.emit(q, epsilon)
+        if self.writer is not None:
+            self.rows.put(None)
+            self.writer.join()
+            self.writer = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def _mean(total: float, count: int) -> float | None:
+    return total / count if count else None
+
+
+def load_telemetry(path: str) -> List[Dict[str, Any]]:
+    """
+    Read the rows written by TrainingTelemetry.
+
+    :param path: .jsonl or .csv telemetry file
+    :return: rows, missing values as None
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if not path.lower().endswith(".csv"):
+            return [json.loads(line) for line in f if line.strip()]
+        return [{k: float(v) if v else None for k, v in row.items()} for row in csv.DictReader(f)]
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+import paths
+import track_validator
+import utilities
+
+FloatArray = NDArray[np.float64]
+BoolArray = NDArray[np.bool_]
+
+DEFAULT_TOLERANCE = 1.0  # Max distance, in pixels, between a removed border point and the simplified border
+COMPILED_FILENAME = "compiled.npz"
+
+
+@dataclass
+class SimplificationReport:
+    """
+    Effect of simplifying one border ring.
+    """
+
+    border: str
+    before: int  # segments, counting the closing one
+    after: int
+    max_error: float  # largest distance from an original point to the simplified border
+
+    def __str__(self) -> str:
+        return f"{self.border}: {self.before} -> {self.after} segments, max error {self.max_error:.3f}"
+
+
+@dataclass
+class CompiledTrack:
+    """
+    A track ready for simulation: simplified border rings, gates and start pose in numpy arrays.
+    """
+
+    outer: FloatArray  # (n, 2) ring points, the closing segment is implicit
+    inner: FloatArray
+    gates: utilities.SegmentArray
+    start: Tuple[float, float, float]
+
+    def borders(self) -> utilities.SegmentArray:
+        """
+        :return: (N, 4) border segments, outer ring then inner ring, as utilities.load_track_segments orders them
+        """
+        return np.vstack([_ring_segments(self.outer), _ring_segments(self.inner)])
+
+    def save(self, filename: str) -> None:
+        """
+        Save the compiled track as a .npz file.
+
+        :param filename: path of the file
+        :return: None
+        """
+        np.savez(filename, outer=self.outer, inner=self.inner, gates=self.gates, start=np.array(self.start))
+
+    @classmethod
+    def load(cls, filename: str) -> CompiledTrack:
+        """
+        Load a track saved with save().
+
+        :param filename: path of the file
+        :return: CompiledTrack
+        """
+        with np.load(filename) as data:
+            x, y, heading = (float(v) for v in data["start"])
+            return cls(data["outer"], data["inner"], data["gates"], (x, y, heading))
+
+    def write_folder(self, track_path: str) -> None:
+        """
+        Write the track in the text layout read by utilities (outer.txt, inner.txt, gates.txt, starting_position.txt).
+
+        :param track_path: Path to the track folder, ending with a slash
+        :return: None
+        """
+        folder = paths.resolve(track_path)
+        os.makedirs(folder, exist_ok=True)
+        for border, points in (("outer", self.outer), ("inner", self.inner)):
+            with open(f"{folder}{border}.txt", "w") as f:
+                for x, y in points.tolist():
+                    f.write(f"{x} {y}\n")
+        with open(f"{folder}gates.txt", "w") as f:
+            for x1, y1, x2, y2 in self.gates.tolist():
+                f.write(f"{x1} {y1} {x2} {y2}\n")
+        with open(f"{folder}starting_position.txt", "w") as f:
+            x, y, heading = self.start
+            f.write(f"{int(x)} {int(y)} {int(heading)}\n")
+
+
+def _ring_segments(points: FloatArray) -> utilities.SegmentArray:
+    return np.hstack([np.roll(points, 1, axis=0), points])
+
+
+def _douglas_peucker(points: FloatArray, tolerance: float) -> BoolArray:
+    """
+    Douglas-Peucker on an open chain, with an explicit stack instead of recursion.
+
+    :param points: (n, 2) chain
+    :param tolerance: max distance of a removed point from the simplified chain
+    :return: mask of the points to keep (both ends are kept)
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        _, distances = utilities.project_on_segments(points[first + 1 : last], points[first], points[last])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            stack.append((first, middle))
+            stack.append((middle, last))
+    return keep
+
+
+def ring_errors(points: FloatArray, kept: NDArray[np.int64]) -> FloatArray:
+    """
+    Distance of every point of a ring to the simplified ring made of the kept points.
+
+    :param points: (n, 2) original ring
+    :param kept: sorted indices of the kept points
+    :return: (n,) distances
+    """
+    span = np.searchsorted(kept, np.arange(len(points)), side="right") - 1
+    starts = points[kept[span]]
+    ends = points[kept[(span + 1) % len(kept)]]
+    _, distances = utilities.project_on_segments(points, starts, ends)
+    return distances
+
+
+def ring_segments(points: FloatArray) -> int:
+    """
+    :param points: (n, 2) ring points, optionally ending with a copy of the first one (as the drawer writes)
+    :return: number of segments of the ring, counting the closing one
+    """
+    if len(points) > 1 and np.array_equal(points[0], points[-1]):
+        return len(points) - 1
+    return len(points)
+
+
+def simplify_ring(points: FloatArray, tolerance: float = DEFAULT_TOLERANCE) -> Tuple[FloatArray, float]:
+    """
+    Remove ring points that the border does not need: every removed point stays within
+    tolerance of the simplified ring, so straights lose almost all their points while tight
+    corners keep theirs. A trailing copy of the first point (as the drawer writes) is dropped.
+
+    :param points: (n, 2) ring points
+    :param tolerance: max distance of a removed point from the simplified ring
+    :return: (simplified points, max error)
+    """
+    points = np.asarray(points, dtype=float)
+    if len(points) > 1 and np.array_equal(points[0], points[-1]):
+        points = points[:-1]
+    if len(points) <= 3:
+        return points.copy(), 0.0
+
+    # Split the ring at the point farthest from the first one, and simplify both halves
+    far = int(np.argmax(np.linalg.norm(points - points[0], axis=1)))
+    keep = np.zeros(len(points), dtype=bool)
+    keep[: far + 1] = _douglas_peucker(points[: far + 1], tolerance)
+    keep[far:] |= _douglas_peucker(np.vstack([points[far:], points[:1]]), tolerance)[:-1]
+    kept = np.flatnonzero(keep)
+    if len(kept) < 3:
+        # a ring needs an area: add the point farthest from the two anchors
+        errors = ring_errors(points, kept)
+        kept = np.sort(np.append(kept, np.argmax(errors)))
+    return points[kept], float(ring_errors(points, kept).max())
+
+
+def compile_track(
+    track_path: str, tolerance: float = DEFAULT_TOLERANCE
+) -> Tuple[CompiledTrack, List[SimplificationReport], List[track_validator.TrackProblem]]:
+    """
+    Simplify the borders of a track folder and validate the result. The compiled track is saved as
+    compiled.npz inside the folder only when no problem was found.
+
+    :param track_path: Path to the track folder, ending with a slash
+    :param tolerance: max distance of a removed point from the simplified border
+    :return: (compiled track, one report per border, problems of the compiled track)
+    """
+    folder = paths.resolve(track_path)
+    rings = {}
+    reports = []
+    for border in ("outer", "inner"):
+        original = utilities.load_border_points(track_path, border)
+        rings[border], error = simplify_ring(original, tolerance)
+        reports.append(SimplificationReport(border, ring_segments(original), len(rings[border]), error))
+    x, y, heading = utilities.read_position(track_path)
+    compiled = CompiledTrack(
+        rings["outer"],
+        rings["inner"],
+        utilities.segments_to_array(utilities.load_gates_segments(track_path)),
+        (float(x), float(y), float(heading)),
+    )
+    problems = track_validator.validate(compiled.outer, compiled.inner, compiled.gates, compiled.start)
+    if not problems:
+        compiled.save(f"{folder}{COMPILED_FILENAME}")
+    return compiled, reports, problems
+
+
+def load_compiled(track_path: str) -> CompiledTrack:
+    """
+    Load the compiled.npz of a track folder.
+
+    :param track_path: Path to the track folder, ending with a slash
+    :return: CompiledTrack
+    """
+    return CompiledTrack.load(f"{paths.resolve(track_path)}{COMPILED_FILENAME}")
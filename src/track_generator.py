@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+import centerline
+import graphics_constants
+import paths
+import spline
+import track_compiler
+import track_validator
+
+FloatArray = NDArray[np.float64]
+
+GENERATED_PATH = f"{paths.TRACKS_PATH}generated/"
+TRACK_WIDTH = 180.0  # Distance between the borders, in pixels
+CONTROL_POINTS = (8, 14)  # Range of the number of spline control points, upper bound excluded
+RADIUS_RANGE = (0.45, 1.0)  # Distance of the control points from the screen center, relative to the largest
+ANGLE_JITTER = 0.35  # Random shift of the control point angles, in fractions of the regular spacing
+MIN_RADIUS = 1.25  # Smallest turn radius of the centerline, relative to half the track width
+RELAX_WINDOW = 9  # Samples averaged by one relaxation pass
+RELAX_PASSES = 200  # Relaxation passes before a layout is dropped
+MARGIN = 40.0  # Minimal distance between the outer border and the screen edges
+GATE_COUNT = 32
+MAX_ATTEMPTS = 100  # Random layouts tried per seed before giving up
+
+
+def _control_points(rng: np.random.Generator, width: float, height: float, track_width: float) -> FloatArray:
+    """
+    Random control points around the screen center, in increasing angle so the loop does not fold on itself.
+    """
+    count = int(rng.integers(*CONTROL_POINTS))
+    angles = (np.arange(count) + rng.uniform(-ANGLE_JITTER, ANGLE_JITTER, count)) * (2 * np.pi / count)
+    radii = rng.uniform(*RADIUS_RANGE, count)
+    half_x = width / 2 - MARGIN - track_width / 2
+    half_y = height / 2 - MARGIN - track_width / 2
+    return np.stack([width / 2 + half_x * radii * np.cos(angles), height / 2 + half_y * radii * np.sin(angles)], axis=1)
+
+
+def _centerline_samples(controls: FloatArray) -> FloatArray:
+    """
+    Closed spline through the control points, sampled every CENTERLINE_SPACING. The spline resolution
+    follows the distance between control points so that the samples do not show the spline polyline kinks.
+    """
+    chords = np.linalg.norm(np.roll(controls, -1, axis=0) - controls, axis=1)
+    resolution = int(np.ceil(chords.max() / centerline.CENTERLINE_SPACING))
+    return _resample(spline.closed_catmull_rom_spline(controls, resolution))
+
+
+def _resample(ring: FloatArray) -> FloatArray:
+    return centerline.resample_ring(ring, int(centerline.ring_lengths(ring)[-1] / centerline.CENTERLINE_SPACING))
+
+
+def relax_corners(center: FloatArray, min_radius: float) -> FloatArray | None:
+    """
+    Smooth a closed centerline with a circular moving average until no turn is tighter than min_radius,
+    so that offsetting it by less than min_radius does not fold the inner border.
+
+    :param center: (k, 2) closed centerline, uniformly sampled
+    :param min_radius: smallest allowed turn radius
+    :return: relaxed centerline, None if it is still too tight after RELAX_PASSES passes
+    """
+    kernel = np.ones(RELAX_WINDOW) / RELAX_WINDOW
+    half = RELAX_WINDOW // 2
+    for _ in range(RELAX_PASSES):
+        if centerline.turn_radii(center).min() >= min_radius:
+            return center
+        padded = np.vstack([center[-half:], center, center[:half]])
+        center = _resample(np.stack([np.convolve(padded[:, i], kernel, mode="valid") for i in range(2)], axis=1))
+    return None
+
+
+def offset_borders(center: FloatArray, track_width: float) -> Tuple[FloatArray, FloatArray]:
+    """
+    Offset a closed centerline on both sides.
+
+    :param center: (k, 2) counterclockwise closed centerline
+    :param track_width: distance between the borders
+    :return: (outer ring, inner ring)
+    """
+    tangents = np.roll(center, -1, axis=0) - np.roll(center, 1, axis=0)
+    tangents /= np.linalg.norm(tangents, axis=1, keepdims=True)
+    # left of a counterclockwise loop is inside
+    left = np.stack([-tangents[:, 1], tangents[:, 0]], axis=1)
+    return center - left * (track_width / 2), center + left * (track_width / 2)
+
+
+def _signed_area(ring: FloatArray) -> float:
+    x, y = ring[:, 0], ring[:, 1]
+    return float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+
+
+def generate_track(
+    seed: int,
+    track_width: float = TRACK_WIDTH,
+    gate_count: int = GATE_COUNT,
+    width: int = graphics_constants.resolution_width,
+    height: int = graphics_constants.resolution_height,
+) -> track_compiler.CompiledTrack:
+    """
+    Generate a random closed track: a closed Catmull-Rom spline through random control points is the
+    centerline, its tight corners are relaxed, it is offset into the two borders, and the gates are placed
+    along it. Layouts that still fail track_validator or leave the screen are drawn again. The same seed
+    always gives the same track.
+
+    :param seed: random seed
+    :param track_width: distance between the borders
+    :param gate_count: number of gates
+    :param width: screen width, the track stays MARGIN inside it
+    :param height: screen height
+    :return: CompiledTrack with simplified borders
+    """
+    rng = np.random.default_rng(seed)
+    for _ in range(MAX_ATTEMPTS):
+        center = relax_corners(
+            _centerline_samples(_control_points(rng, width, height, track_width)), MIN_RADIUS * track_width / 2
+        )
+        if center is None:
+            continue
+        if _signed_area(center) < 0:
+            center = center[::-1]
+        outer, inner = offset_borders(center, track_width)
+        if outer.min() < MARGIN or np.any(outer.max(axis=0) > np.array([width, height]) - MARGIN):
+            continue
+        outer, _ = track_compiler.simplify_ring(outer)
+        inner, _ = track_compiler.simplify_ring(inner)
+
+        tangent = center[1] - center[-1]
+        heading = np.degrees(np.arctan2(tangent[1], tangent[0]))
+        # starting_position.txt stores integers
+        start = (float(round(center[0, 0])), float(round(center[0, 1])), float(round(heading)))
+        gates = centerline.place_gates(center, outer, inner, start, gate_count)
+        track = track_compiler.CompiledTrack(outer, inner, np.round(gates, 1), start)
+        if not track_validator.validate(track.outer, track.inner, track.gates, track.start):
+            return track
+    raise ValueError(f"No valid track found for seed {seed} in {MAX_ATTEMPTS} attempts")
+
+
+def _generate_job(job: Tuple[int, str]) -> str:
+    """
+    Worker process entry point: generate one track and write it.
+    """
+    seed, output_path = job
+    track = generate_track(seed)
+    folder = f"{output_path}{seed:06d}/"
+    track.write_folder(folder)
+    track.save(f"{folder}{track_compiler.COMPILED_FILENAME}")
+    return folder
+
+
+def generate_tracks(
+    seeds: Sequence[int],
+    output_path: str = GENERATED_PATH,
+    workers: int | None = None,
+) -> List[str]:
+    """
+    Generate one track per seed and write them, named after their seed. Every track is a folder in the
+    layout read by utilities, with its compiled.npz (used by the simulator commands' --compiled).
+
+    :param seeds: random seeds
+    :param output_path: folder the tracks are written to, ending with a slash
+    :param workers: number of worker processes, None or 1 to run in this process
+    :return: paths of the written tracks
+    """
+    output_path = paths.resolve(output_path)
+    os.makedirs(output_path, exist_ok=True)
+    jobs = [(seed, output_path) for seed in seeds]
+    if workers is not None and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_generate_job, jobs, chunksize=16))
+    return [_generate_job(job) for job in jobs]
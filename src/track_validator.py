@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+import graphics_constants
+import utilities
+
+FloatArray = NDArray[np.float64]
+IntArray = NDArray[np.int64]
+BoolArray = NDArray[np.bool_]
+
+OUTER, INNER, GATES = 0, 1, 2
+GROUP_NAMES = ("outer", "inner", "gates")
+GATE_TOLERANCE = 2.0  # A gate end closer than this to a border counts as touching it
+PAIRS_PER_CHUNK = 1 << 20  # Candidate pairs tested at once, bounds memory on large tracks
+
+
+@dataclass
+class TrackProblem:
+    """
+    Something wrong with a track, located at (x, y).
+    """
+
+    kind: str
+    x: float
+    y: float
+    detail: str
+
+    def __str__(self) -> str:
+        return f"{self.kind} at ({self.x:.1f}, {self.y:.1f}): {self.detail}"
+
+
+def ring_to_segments(points: FloatArray) -> utilities.SegmentArray:
+    """
+    Segments of a closed ring, without zero-length segments (repeated points).
+
+    :param points: (n, 2) ring points
+    :return: (m, 4) segments, segment i going from point i to the next distinct point
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    distinct = np.any(points != np.roll(points, -1, axis=0), axis=1)
+    points = points[distinct]
+    return np.hstack([points, np.roll(points, -1, axis=0)])
+
+
+def _orientation(p: FloatArray, q: FloatArray, r: FloatArray) -> FloatArray:
+    return np.sign(
+        (q[..., 0] - p[..., 0]) * (r[..., 1] - p[..., 1]) - (q[..., 1] - p[..., 1]) * (r[..., 0] - p[..., 0])
+    )
+
+
+def _on_segment(p: FloatArray, q: FloatArray, r: FloatArray) -> BoolArray:
+    """
+    :return: whether r, known to be collinear with p-q, lies within the bounding box of p-q
+    """
+    return np.asarray(
+        (np.minimum(p[..., 0], q[..., 0]) <= r[..., 0])
+        & (r[..., 0] <= np.maximum(p[..., 0], q[..., 0]))
+        & (np.minimum(p[..., 1], q[..., 1]) <= r[..., 1])
+        & (r[..., 1] <= np.maximum(p[..., 1], q[..., 1]))
+    )
+
+
+def segments_touch(a: utilities.SegmentArray, b: utilities.SegmentArray) -> BoolArray:
+    """
+    Exact segment intersection test from orientations, counting touching ends and collinear overlaps.
+
+    :param a: (k, 4) segments
+    :param b: (k, 4) segments
+    :return: (k,) whether a[i] and b[i] share at least one point
+    """
+    a1, a2, b1, b2 = a[:, 0:2], a[:, 2:4], b[:, 0:2], b[:, 2:4]
+    o1 = _orientation(a1, a2, b1)
+    o2 = _orientation(a1, a2, b2)
+    o3 = _orientation(b1, b2, a1)
+    o4 = _orientation(b1, b2, a2)
+    touch = (o1 != o2) & (o3 != o4) & ~((o1 == 0) & (o2 == 0))
+    touch |= (o1 == 0) & _on_segment(a1, a2, b1)
+    touch |= (o2 == 0) & _on_segment(a1, a2, b2)
+    touch |= (o3 == 0) & _on_segment(b1, b2, a1)
+    touch |= (o4 == 0) & _on_segment(b1, b2, a2)
+    return np.asarray(touch)
+
+
+def _meeting_points(a: utilities.SegmentArray, b: utilities.SegmentArray) -> FloatArray:
+    """
+    Where touching segments meet: the crossing point, or for parallel segments an end lying on the other one.
+    """
+    hits, points = utilities.broadcast_segment_intersections(a, b, eps=1e-6)
+    _, distances = utilities.project_on_segments(b[:, 0:2], a[:, 0:2], a[:, 2:4])
+    fallback = np.where((distances < 1e-6)[:, None], b[:, 0:2], b[:, 2:4])
+    return np.where(hits[:, None], points, fallback)
+
+
+def candidate_pairs(segments: utilities.SegmentArray, margin: float = 0.0) -> Iterator[Tuple[IntArray, IntArray]]:
+    """
+    Pairs of segments whose bounding boxes overlap, bucketed in x and y with utilities.overlapping_boxes.
+    The cells are as large as a typical segment, so a border segment only meets its neighbours whatever the
+    shape of the track (a sweep over x alone pairs every segment of a vertical straight with every other).
+    The cost is O(n log n) plus the number of close pairs; the few long segments, such as gates, cover
+    more cells.
+
+    :param segments: (n, 4) segments
+    :param margin: bounding boxes are grown by this much
+    :return: chunks of (i, j) index arrays into segments, with i != j and every pair produced once
+    """
+    low = np.minimum(segments[:, 0:2], segments[:, 2:4]) - margin
+    high = np.maximum(segments[:, 0:2], segments[:, 2:4]) + margin
+    if len(segments) < 2:
+        return
+    cell = max(float(np.median((high - low).max(axis=1))), 1e-6)
+    i, j = utilities.overlapping_boxes(low, high, cell)
+    for first in range(0, len(i), PAIRS_PER_CHUNK):
+        yield i[first : first + PAIRS_PER_CHUNK], j[first : first + PAIRS_PER_CHUNK]
+
+
+def point_in_ring(points: FloatArray, ring: utilities.SegmentArray) -> BoolArray:
+    """
+    Even-odd rule for points against a closed ring.
+
+    :param points: (k, 2) points
+    :param ring: (m, 4) ring segments
+    :return: (k,) whether each point is inside
+    """
+    px, py = points[:, None, 0], points[:, None, 1]
+    x1, y1, x2, y2 = (ring[None, :, i] for i in range(4))
+    straddles = (y1 > py) != (y2 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    crossings = straddles & (px < crossing_x)
+    return np.asarray(np.count_nonzero(crossings, axis=1) % 2 == 1)
+
+
+def validate(
+    outer: FloatArray,
+    inner: FloatArray,
+    gates: utilities.SegmentArray | None = None,
+    start: Tuple[float, float, float] | None = None,
+) -> List[TrackProblem]:
+    """
+    Check the geometry of a track: borders that cross themselves or each other, gates that do not reach both
+    borders and a start pose that is off the track or puts the car on a border.
+
+    :param outer: (n, 2) outer ring
+    :param inner: (m, 2) inner ring
+    :param gates: (g, 4) gates, None to skip the gate checks
+    :param start: (x, y, heading) start pose, None to skip the start checks
+    :return: problems found, empty for a valid track
+    """
+    rings = [ring_to_segments(outer), ring_to_segments(inner)]
+    gate_segments = np.zeros((0, 4)) if gates is None else np.asarray(gates, dtype=float).reshape(-1, 4)
+    segments = np.vstack([rings[OUTER], rings[INNER], gate_segments])
+    group = np.repeat([OUTER, INNER, GATES], [len(rings[OUTER]), len(rings[INNER]), len(gate_segments)])
+    index = np.concatenate([np.arange(len(rings[OUTER])), np.arange(len(rings[INNER])), np.arange(len(gate_segments))])
+    ring_sizes = np.array([len(rings[OUTER]), len(rings[INNER]), 0])
+
+    problems: List[TrackProblem] = []
+    reached = np.zeros((len(gate_segments), 2), dtype=bool)
+    for i, j in candidate_pairs(segments, GATE_TOLERANCE if len(gate_segments) else 0.0):
+        # consecutive segments of a ring always share an end
+        same_ring = (group[i] == group[j]) & (group[i] != GATES)
+        gap = np.abs(index[i] - index[j])
+        adjacent = same_ring & ((gap == 1) | (gap == ring_sizes[group[i]] - 1))
+        keep = ~adjacent & ~((group[i] == GATES) & (group[j] == GATES))
+        i, j = i[keep], j[keep]
+
+        touching = segments_touch(segments[i], segments[j])
+        # gates also reach a border when an end stops just short of it
+        gate_pair = (group[i] == GATES) != (group[j] == GATES)
+        if gate_pair.any():
+            gate = np.where(group[i] == GATES, i, j)[gate_pair]
+            border = np.where(group[i] == GATES, j, i)[gate_pair]
+            starts, ends = segments[border, 0:2], segments[border, 2:4]
+            _, d1 = utilities.project_on_segments(segments[gate, 0:2], starts, ends)
+            _, d2 = utilities.project_on_segments(segments[gate, 2:4], starts, ends)
+            near = touching[gate_pair] | (np.minimum(d1, d2) <= GATE_TOLERANCE)
+            reached[index[gate[near]], group[border[near]]] = True
+
+        crossing = touching & ~gate_pair
+        if crossing.any():
+            i, j = i[crossing], j[crossing]
+            points = _meeting_points(segments[i], segments[j])
+            for a, b, (x, y) in zip(i.tolist(), j.tolist(), points.tolist(), strict=True):
+                if group[a] == group[b]:
+                    name = GROUP_NAMES[group[a]]
+                    problems.append(
+                        TrackProblem("self_intersection", x, y, f"{name} segments {index[a]} and {index[b]} intersect")
+                    )
+                else:
+                    o, n = (a, b) if group[a] == OUTER else (b, a)
+                    problems.append(
+                        TrackProblem(
+                            "borders_cross", x, y, f"outer segment {index[o]} crosses inner segment {index[n]}"
+                        )
+                    )
+
+    for g in range(len(gate_segments)):
+        for border in (OUTER, INNER):
+            if not reached[g, border]:
+                x, y = (gate_segments[g, 0:2] + gate_segments[g, 2:4]) / 2
+                problems.append(
+                    TrackProblem(
+                        "gate_misses_border", x, y, f"gate {g} does not reach the {GROUP_NAMES[border]} border"
+                    )
+                )
+
+    if len(rings[INNER]) and not point_in_ring(rings[INNER][:1, 0:2], rings[OUTER])[0]:
+        x, y = rings[INNER][0, 0:2]
+        problems.append(TrackProblem("inner_outside_outer", x, y, "the inner border is not inside the outer border"))
+
+    if start is not None:
+        problems.extend(_start_problems(start, rings[OUTER], rings[INNER]))
+    return problems
+
+
+def _start_problems(
+    start: Tuple[float, float, float], outer: utilities.SegmentArray, inner: utilities.SegmentArray
+) -> List[TrackProblem]:
+    x, y, heading = start
+    position = np.array([[x, y]], dtype=float)
+    if not point_in_ring(position, outer)[0] or point_in_ring(position, inner)[0]:
+        return [TrackProblem("start_off_track", x, y, "the start position is not between the borders")]
+    width, height = utilities.read_png_size(graphics_constants.car_image_path)
+    v = utilities.rectangle_vertices(x, y, heading, width, height)
+    edges = np.array(
+        [[*v[0], *v[2]], [*v[1], *v[3]], [*v[0], *v[1]], [*v[2], *v[3]]],
+        dtype=float,
+    )
+    borders = np.vstack([outer, inner])
+    hits, _ = utilities.segment_intersections(edges, borders)
+    if hits.any():
+        return [TrackProblem("start_on_border", x, y, "the car touches a border at the start pose")]
+    return []
+
+
+def validate_track(track_path: str) -> List[TrackProblem]:
+    """
+    Validate a track folder: borders, gates and start pose.
+
+    :param track_path: Path to the track folder
+    :return: problems found, empty for a valid track
+    """
+    x, y, heading = utilities.read_position(track_path)
+    return validate(
+        utilities.load_border_points(track_path, "outer"),
+        utilities.load_border_points(track_path, "inner"),
+        utilities.segments_to_array(utilities.load_gates_segments(track_path)),
+        (float(x), float(y), float(heading)),
+    )
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import os
+import time
+from dataclasses import dataclass
+from multiprocessing.synchronize import Event
+from typing import Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+import car_stats
+import centerline
+import heatmap
+import paths
+import policy
+import simulation
+import telemetry
+from pose_ring import PoseRing
+
+
+@dataclass
+class TrainerConfig:
+    """
+    Settings of a Q-learning run.
+    """
+
+    track_path: str = paths.DEFAULT_TRACK_PATH
+    compiled: bool = False  # Simulate on the simplified borders of the track's compiled.npz
+    environments: int = 64  # Cars simulated in parallel, one episode each
+    steps: int = 200_000  # Batched decision steps to train for
+    dt: float = car_stats.physics_dt
+    action_repeat: int = 1  # Physics steps every chosen action is held for; sensors are only cast on the last
+    learning_rate: float = 0.1
+    discount: float = 0.99
+    epsilon_start: float = 1.0
+    epsilon_end: float = 0.05
+    epsilon_decay_steps: int = 50_000
+    max_episode_time: float = 60.0  # Episodes are cut after this many seconds
+    distance_bins: Tuple[float, ...] = (0.03, 0.06, 0.1, 0.2, 0.4)  # Edges on scaled sensor distances
+    speed_bins: Tuple[float, ...] = (0.0, 0.2, 0.5, 0.8)  # Edges on scaled signed speed
+    gate_reward: float = 1.0
+    lap_reward: float = 10.0
+    crash_penalty: float = -10.0
+    step_penalty: float = -0.01
+    progress_reward: float = 0.0  # Reward per pixel driven along the centerline, 0 to reward gates only
+    publish_cars: int = 32  # Cars whose poses are sent to the dashboard
+    save_every: int = 10_000  # Steps between policy checkpoints
+    policy_path: str = f"{policy.POLICIES_PATH}policy.npz"
+    telemetry_path: str | None = None  # .jsonl or .csv file of training metrics, None to disable them
+    telemetry_interval: float = telemetry.TELEMETRY_INTERVAL
+    heatmap_path: str | None = None  # .npz heatmap of the positions driven during training, None to disable it
+    seed: int = 0
+
+
+class QLearningTrainer:
+    def __init__(self, config: TrainerConfig):
+        """
+        Tabular Q-learning over a batch of simulated cars.
+
+        :param config: training settings
+        """
+        self.config: TrainerConfig = config
+        self.rng: np.random.Generator = np.random.default_rng(config.seed)
+        self.cars: simulation.CarBatch = simulation.CarBatch.from_track(
+            config.environments, config.track_path, config.compiled
+        )
+        self.cars.calculate_distances(np.arange(config.environments))
+        self.centerline: centerline.CenterlineIndex | None = (
+            centerline.track_index(config.track_path) if config.progress_reward else None
+        )
+
+        states = policy.QTablePolicy.state_count(np.array(config.distance_bins), np.array(config.speed_bins))
+        q = np.zeros((states, len(policy.ACTIONS)))
+        self.policy: policy.QTablePolicy = policy.QTablePolicy(q, config.distance_bins, config.speed_bins)
+
+        self.steps: int = 0
+        self.episodes: int = 0
+        self.laps: int = 0
+        self.best_lap: float = float("inf")
+        self.telemetry: telemetry.TrainingTelemetry | None = (
+            # every decision step simulates action_repeat physics steps of every environment
+            telemetry.TrainingTelemetry(
+                config.telemetry_path, config.environments * config.action_repeat, config.telemetry_interval
+            )
+            if config.telemetry_path
+            else None
+        )
+        self.heatmap: heatmap.PositionHeatmap | None = (
+            heatmap.PositionHeatmap.from_track(config.track_path) if config.heatmap_path else None
+        )
+
+    def epsilon(self) -> float:
+        """
+        :return: exploration rate at the current step (linear decay)
+        """
+        fraction = min(self.steps / max(self.config.epsilon_decay_steps, 1), 1.0)
+        return self.config.epsilon_start + fraction * (self.config.epsilon_end - self.config.epsilon_start)
+
+    def choose_actions(self, states: NDArray[np.int64]) -> NDArray[np.int64]:
+        """
+        Epsilon-greedy actions for every car.
+
+        :param states: Q-table rows of the cars
+        :return: action indices
+        """
+        actions = np.argmax(self.policy.q[states], axis=1)
+        explore = self.rng.random(len(states)) < self.epsilon()
+        actions[explore] = self.rng.integers(0, len(policy.ACTIONS), int(explore.sum()))
+        return np.asarray(actions)
+
+    def step(self) -> None:
+        """
+        Advance every car by one step and apply the Q-learning update.
+
+        :return: None
+        """
+        cfg = self.config
+        cars = self.cars
+        q = self.policy.q
+
+        states = self.policy.states(policy.observation(cars.distances, cars.speed()))
+        actions = self.choose_actions(states)
+        controls = policy.ACTION_CONTROLS[actions]
+        previous_gate = cars.next_gate.copy()
+        previous_position = np.stack([cars.x, cars.y], axis=1)
+
+        cars.step(controls[:, 0], controls[:, 1], controls[:, 2], controls[:, 3], cfg.dt, cfg.action_repeat)
+        if self.heatmap is not None:
+            self.heatmap.add_points(cars.x[cars.alive], cars.y[cars.alive])
+
+        crashed = ~cars.alive
+        completed = cars.completed
+        timeout = cars.current_time >= cfg.max_episode_time
+        done = crashed | completed | timeout
+        reward = (
+            cfg.step_penalty * cfg.action_repeat
+            + cfg.gate_reward * (cars.next_gate - previous_gate)
+            + cfg.crash_penalty * crashed
+            + cfg.lap_reward * completed
+        )
+        if self.centerline is not None:
+            before, _ = self.centerline.project(previous_position)
+            after, _ = self.centerline.project(np.stack([cars.x, cars.y], axis=1))
+            reward = reward + cfg.progress_reward * self.centerline.progress_delta(before, after)
+
+        next_states = self.policy.states(policy.observation(cars.distances, cars.speed()))
+        target = reward + cfg.discount * q[next_states].max(axis=1) * ~done
+        # Cars sharing a (state, action) pair get the average of their updates
+        cells, inverse, counts = np.unique(states * q.shape[1] + actions, return_inverse=True, return_counts=True)
+        td_errors = target - q[states, actions]
+        errors = np.bincount(inverse, weights=td_errors, minlength=len(cells))
+        q.flat[cells] += cfg.learning_rate * errors / counts
+        if self.telemetry is not None:
+            self.telemetry.record_learning(float(np.abs(td_errors).mean()))
+
+        self.steps += 1
+        if done.any():
+            finished = np.flatnonzero(done)
+            self.episodes += len(finished)
+            lap_times = cars.current_time[completed]
+            self.laps += len(lap_times)
+            if len(lap_times):
+                self.best_lap = min(self.best_lap, float(lap_times.min()))
+            if self.telemetry is not None:
+                self.telemetry.record_episodes(int(crashed.sum()), lap_times, cars.next_gate[finished])
+            cars.reset(finished)
+            cars.calculate_distances(finished)
+
+    def save(self) -> None:
+        """
+        Save the current greedy policy, and the heatmap when the config has a heatmap path.
+
+        :return: None
+        """
+        directory = os.path.dirname(self.config.policy_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.policy.save(self.config.policy_path)
+        if self.heatmap is not None and self.config.heatmap_path:
+            self.heatmap.save(self.config.heatmap_path)
+
+    def train(self, ring: PoseRing | None = None, stop: Event | None = None) -> policy.QTablePolicy:
+        """
+        Run the configured number of steps, publishing poses after every step when a ring is given and
+        streaming metrics when the config has a telemetry path.
+
+        :param ring: shared memory ring read by the dashboard
+        :param stop: event that ends training early
+        :return: the trained policy
+        """
+        sample = slice(0, ring.cars) if ring is not None else slice(0)
+        if self.telemetry is not None:
+            self.telemetry.start()
+        try:
+            while self.steps < self.config.steps and not (stop is not None and stop.is_set()):
+                start = time.perf_counter()
+                self.step()
+                if self.telemetry is not None:
+                    self.telemetry.end_step(time.perf_counter() - start, self.policy.q, self.epsilon())
+                if ring is not None:
+                    cars = self.cars
+                    ring.publish(cars.x[sample], cars.y[sample], cars.heading[sample], cars.alive[sample])
+                    ring.stats[:] = (self.steps, self.episodes, self.laps, self.best_lap)
+                if self.steps % self.config.save_every == 0:
+                    self.save()
+        finally:
+            if self.telemetry is not None:
+                self.telemetry.close(self.policy.q, self.epsilon())
+        self.save()
+        return self.policy
+
+
+def run_trainer(config: TrainerConfig, ring_name: str | None = None, stop: Event | None = None) -> None:
+    """
+    Entry point of the training process.
+
+    :param config: training settings
+    :param ring_name: name of the shared memory pose ring to publish to
+    :param stop: event that ends training early
+    :return: None
+    """
+    ring = PoseRing.attach(ring_name) if ring_name is not None else None
+    try:
+        QLearningTrainer(config).train(ring, stop)
+    finally:
+        if ring is not None:
+            ring.close()
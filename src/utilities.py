@@ -3,17 +3,23 @@ from __future__ import annotations
 
 import math
 from dataclasses import dataclass
-from typing import Dict, List, Mapping, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 import numpy as np
-import pyglet.graphics
 from numpy.typing import NDArray
-from pyglet import shapes
-from pyglet.window import key
 
 import graphics_constants
+import paths
+
+if TYPE_CHECKING:
+    import pyglet.graphics
+    from pyglet import shapes
+
+# pyglet is only imported by the functions that create shapes, so that headless tools
+# (analytics, catalog, rasterizer) can load tracks without a display.
 
 Vector2 = NDArray[np.float64]
+SegmentArray = NDArray[np.float64]
 
 
 def dist(p1: Vector2, p2: Vector2) -> float:
@@ -120,6 +126,51 @@ def vec_from_angle(angle_deg: float) -> Vector2:
     return np.array([cos_deg(angle_deg), sin_deg(angle_deg)], dtype=float)
 
 
+def rectangle_vertices(
+    x: float | NDArray[np.float64],
+    y: float | NDArray[np.float64],
+    heading: float | NDArray[np.float64],
+    width: float | NDArray[np.float64],
+    height: float | NDArray[np.float64],
+) -> NDArray[np.float64]:
+    """
+    Corners of rectangles centered in (x, y) and rotated by heading (degrees), in the same
+    order as Car.car_vertices: front right, front left, back right, back left.
+    Works on scalars or on arrays of any shape, the sizes too.
+
+    :param x: Center x.
+    :param y: Center y.
+    :param heading: Heading in degrees.
+    :param width: Length of the rectangle along the heading.
+    :param height: Length of the rectangle across the heading.
+    :return: Array of shape (..., 4, 2).
+    """
+    h = np.radians(np.asarray(heading, dtype=float))
+    front = np.stack([np.cos(h), np.sin(h)], axis=-1) * (np.asarray(width, dtype=float)[..., None] / 2)
+    left = np.stack([np.cos(h + math.pi / 2), np.sin(h + math.pi / 2)], axis=-1) * (
+        np.asarray(height, dtype=float)[..., None] / 2
+    )
+    center = np.stack(np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float)), axis=-1)
+    return np.stack(
+        [center + front - left, center + front + left, center - front - left, center - front + left],
+        axis=-2,
+    )
+
+
+def read_png_size(path: str) -> Tuple[int, int]:
+    """
+    Read width and height from a PNG header, without decoding the image.
+
+    :param path: Path of the PNG file.
+    :return: (width, height) in pixels.
+    """
+    with open(path, "rb") as fh:
+        header = fh.read(24)
+    if header[:8] != b"\x89PNG\r\n\x1a\n":
+        raise ValueError(f"{path} is not a PNG file")
+    return int.from_bytes(header[16:20], "big"), int.from_bytes(header[20:24], "big")
+
+
 @dataclass
 class Segment:
     """
@@ -217,6 +268,138 @@ def segment_intersection(s1: Segment, s2: Segment) -> Tuple[bool, Optional[Vecto
     return False, None
 
 
+def segments_to_array(segments: List[Segment]) -> SegmentArray:
+    """
+    Pack segments into an (N, 4) array of x1, y1, x2, y2 rows.
+
+    :param segments: List of segments.
+    :return: numpy array of shape (N, 4).
+    """
+    if not segments:
+        return np.zeros((0, 4), dtype=float)
+    return np.array([[s.x1, s.y1, s.x2, s.y2] for s in segments], dtype=float)
+
+
+def broadcast_segment_intersections(
+    a: SegmentArray, b: SegmentArray, eps: float = 1e-9
+) -> Tuple[NDArray[np.bool_], Vector2]:
+    """
+    Vectorized version of segment_intersection between segments of a and b, where a and b
+    are (..., 4) arrays of x1, y1, x2, y2 rows broadcast against each other.
+    Follows the same rules: parallel lines never intersect and the intersection point of the
+    two lines has to lie in the bounding box of both segments.
+
+    :param a: (..., 4) array of segments.
+    :param b: (..., 4) array of segments.
+    :param eps: bounding box tolerance.
+    :return: (hits, points) where hits is a bool array of the broadcast shape and points has an
+             extra trailing axis of size 2 (points are meaningless where hits is False).
+    """
+    ax1, ay1, ax2, ay2 = (a[..., i] for i in range(4))
+    bx1, by1, bx2, by2 = (b[..., i] for i in range(4))
+
+    a_a = ay2 - ay1
+    a_b = ax1 - ax2
+    a_c = a_a * ax1 + a_b * ay1
+    b_a = by2 - by1
+    b_b = bx1 - bx2
+    b_c = b_a * bx1 + b_b * by1
+
+    det = a_a * b_b - a_b * b_a
+    parallel = det == 0
+    safe_det = np.where(parallel, 1.0, det)
+    x = (b_b * a_c - a_b * b_c) / safe_det
+    y = (a_a * b_c - b_a * a_c) / safe_det
+
+    hits = ~parallel
+    hits &= (np.minimum(ax1, ax2) - eps <= x) & (x <= np.maximum(ax1, ax2) + eps)
+    hits &= (np.minimum(ay1, ay2) - eps <= y) & (y <= np.maximum(ay1, ay2) + eps)
+    hits &= (np.minimum(bx1, bx2) - eps <= x) & (x <= np.maximum(bx1, bx2) + eps)
+    hits &= (np.minimum(by1, by2) - eps <= y) & (y <= np.maximum(by1, by2) + eps)
+    return hits, np.stack([x, y], axis=-1)
+
+
+def segment_intersections(a: SegmentArray, b: SegmentArray, eps: float = 1e-9) -> Tuple[NDArray[np.bool_], Vector2]:
+    """
+    Vectorized version of segment_intersection between every segment of a and every segment of b.
+
+    :param a: (N, 4) array of x1, y1, x2, y2 rows.
+    :param b: (M, 4) array of x1, y1, x2, y2 rows.
+    :param eps: bounding box tolerance.
+    :return: (hits, points) where hits is an (N, M) bool array and points an (N, M, 2) array
+             (points are meaningless where hits is False).
+    """
+    return broadcast_segment_intersections(a[:, None, :], b[None, :, :], eps)
+
+
+def project_on_segments(
+    points: Vector2, starts: Vector2, ends: Vector2
+) -> Tuple[NDArray[np.float64], NDArray[np.float64]]:
+    """
+    Project points on segments, where points, starts and ends are (..., 2) arrays broadcast against each other.
+
+    :param points: (..., 2) points.
+    :param starts: (..., 2) first end of the segments.
+    :param ends: (..., 2) second end of the segments.
+    :return: (t, distances): position of the closest point along each segment in [0, 1]
+             (0 for zero-length segments) and distance from the point to it.
+    """
+    d = ends - starts
+    length_sq = np.einsum("...i,...i->...", d, d)
+    t = np.clip(np.einsum("...i,...i->...", points - starts, d) / np.where(length_sq == 0, 1.0, length_sq), 0.0, 1.0)
+    return t, np.linalg.norm(starts + d * t[..., None] - points, axis=-1)
+
+
+def overlapping_boxes(
+    low: NDArray[np.float64], high: NDArray[np.float64], cell: float
+) -> Tuple[NDArray[np.int64], NDArray[np.int64]]:
+    """
+    Pairs of overlapping axis-aligned boxes, found with a uniform grid instead of testing every pair.
+    Every box is put in the grid cells it covers, one sort groups the boxes of every cell, and only boxes
+    sharing a cell are compared. With cells about as large as the boxes, every box covers a few cells and
+    meets only its neighbours: O(n log n) for the sort plus the number of close pairs. The grid is not
+    stored, cells are identified by a 64-bit key of their coordinates, so the covered area does not matter.
+
+    :param low: (n, 2) lower-left corners
+    :param high: (n, 2) upper-right corners
+    :param cell: side of the grid cells
+    :return: (i, j) index arrays, i < j, of the boxes that overlap or touch, every pair once
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if len(low) < 2:
+        return empty, empty
+    if cell <= 0:
+        raise ValueError(f"Grid cells must have a positive size, got {cell}")
+    first = np.floor(low / cell).astype(np.int64)
+    last = np.floor(high / cell).astype(np.int64)
+
+    # One entry per (cell, box), cells of a box enumerated row by row
+    columns = last[:, 0] - first[:, 0] + 1
+    counts = columns * (last[:, 1] - first[:, 1] + 1)
+    owner = np.repeat(np.arange(len(low)), counts)
+    offset = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_x = first[owner, 0] + offset % columns[owner]
+    cell_y = first[owner, 1] + offset // columns[owner]
+    keys = (cell_x << 32) + (cell_y & 0xFFFFFFFF)
+
+    order = np.argsort(keys, kind="stable")
+    keys, owner = keys[order], owner[order]
+    # Every entry is paired with the entries after it in the same cell
+    partners = np.searchsorted(keys, keys, side="right") - np.arange(len(keys)) - 1
+    if not partners.any():
+        return empty, empty
+    left = np.repeat(np.arange(len(keys)), partners)
+    right = left + 1 + np.arange(len(left)) - np.repeat(np.cumsum(partners) - partners, partners)
+    a, b = owner[left], owner[right]
+
+    # Boxes sharing several cells are paired once per cell; sharing a cell does not mean overlapping
+    count = len(low)
+    pairs = np.unique(np.minimum(a, b) * count + np.maximum(a, b))
+    a, b = pairs // count, pairs % count
+    overlap = np.all((low[a] <= high[b]) & (low[b] <= high[a]), axis=1)
+    return a[overlap], b[overlap]
+
+
 def load_track_segments(path: str) -> List[Segment]:
     """
     Read outer.txt and inner.txt from the given path and return a list of Segment objects
@@ -228,14 +411,14 @@ def load_track_segments(path: str) -> List[Segment]:
     outer_points: List[Tuple[int, int]] = []
     inner_points: List[Tuple[int, int]] = []
 
-    with open(path + "outer.txt", "r") as fh:
+    with open(paths.resolve(path) + "outer.txt", "r") as fh:
         for row in fh:
             p = row.split()
             if not p:
                 continue
             outer_points.append((int(float(p[0])), int(float(p[1]))))
 
-    with open(path + "inner.txt", "r") as fh:
+    with open(paths.resolve(path) + "inner.txt", "r") as fh:
         for row in fh:
             p = row.split()
             if not p:
@@ -259,6 +442,19 @@ def load_track_segments(path: str) -> List[Segment]:
     return outer_segments + inner_segments
 
 
+def load_border_points(path: str, border: str) -> Vector2:
+    """
+    Read the points of one border ring, without building segments.
+
+    :param path: Path to the track folder.
+    :param border: "outer" or "inner".
+    :return: (n, 2) float array of the points, in file order.
+    """
+    with open(paths.resolve(path) + f"{border}.txt", "r") as fh:
+        rows = [row.split() for row in fh]
+    return np.array([[float(p[0]), float(p[1])] for p in rows if p], dtype=float).reshape(-1, 2)
+
+
 def load_track_lines(path: str, batch: pyglet.graphics.Batch) -> List[shapes.Line]:
     """
     Create pyglet Line shapes for all track segments and return them.
@@ -267,6 +463,8 @@ def load_track_lines(path: str, batch: pyglet.graphics.Batch) -> List[shapes.Lin
     :param batch: pyglet.graphics.Batch to put shapes into.
     :return: List of pyglet shapes.Line objects.
     """
+    from pyglet import shapes
+
     segments = load_track_segments(path)
     lines = []
     for s in segments:
@@ -285,7 +483,7 @@ def read_position(path: str) -> Tuple[int, int, int]:
     :param path: Path to track folder.
     :return: (x, y, heading) as integers.
     """
-    with open(path + "starting_position.txt", "r") as fh:
+    with open(paths.resolve(path) + "starting_position.txt", "r") as fh:
         first = fh.readline().strip()
     parts = first.split()
     return int(parts[0]), int(parts[1]), int(parts[2])
@@ -299,7 +497,7 @@ def load_gates_segments(path: str) -> List[Segment]:
     :return: List of Segment objects for gates.
     """
     gates: List[Segment] = []
-    with open(path + "gates.txt", "r") as fh:
+    with open(paths.resolve(path) + "gates.txt", "r") as fh:
         for row in fh:
             p = row.split()
             if not p:
@@ -318,6 +516,8 @@ def load_gates_lines(path: str, gates_batch: pyglet.graphics.Batch) -> List[shap
     :param gates_batch: pyglet Batch for gates.
     :return: List of pyglet shapes.Line for gates.
     """
+    from pyglet import shapes
+
     gates = load_gates_segments(path)
     lines = []
     for g in gates:
@@ -334,7 +534,7 @@ def load_gates_lines(path: str, gates_batch: pyglet.graphics.Batch) -> List[shap
     return lines
 
 
-def load_finish_line_line(path: str, finish_line_batch: pyglet.graphics.Batch) -> pyglet.shapes.Line:
+def load_finish_line_line(path: str, finish_line_batch: pyglet.graphics.Batch) -> shapes.Line:
     """
     Return the first gate as the finish-line shape (yellow).
 
@@ -342,6 +542,8 @@ def load_finish_line_line(path: str, finish_line_batch: pyglet.graphics.Batch) -
     :param finish_line_batch: pyglet Batch to attach the shape to.
     :return: pyglet shapes.Line representing finish line.
     """
+    from pyglet import shapes
+
     gates = load_gates_segments(path)
     if not gates:
         raise FileNotFoundError("gates.txt is empty or missing")
@@ -367,22 +569,13 @@ def fill_keys(keys: Dict[int, bool]) -> None:
         keys.setdefault(code, False)
 
 
-KEYS_TO_TRACK: List[int] = [
-    key.W,
-    key.A,
-    key.S,
-    key.D,
-    key.UP,
-    key.DOWN,
-    key.LEFT,
-    key.RIGHT,
-    key.SPACE,
-]
-
-
-def get_dict_keys(keys: Mapping[int, bool]) -> Dict[int, bool]:
-    """
-    Extract only the keys we track (WASD + arrows + space) from any mapping-like
-    object supporting __getitem__, such as KeyStateHandler.
-    """
-    return {k: bool(keys[k]) for k in KEYS_TO_TRACK}
+# pyglet.window.key codes, spelled out so that importing this module does not open a display
+KEY_W = 119
+KEY_A = 97
+KEY_S = 115
+KEY_D = 100
+KEY_UP = 65362
+KEY_DOWN = 65364
+KEY_LEFT = 65361
+KEY_RIGHT = 65363
+KEY_SPACE = 32
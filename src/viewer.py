@@ -1,25 +1,39 @@
-from typing import List, Optional
+from typing import List, Optional, Sequence
 
 import pyglet
 
 import car_class
 import graphics_constants
 import utilities
+from heatmap import PositionHeatmap
 from make_replay import Replay
+from profiler import FrameProfiler
+from replay_analytics import GhostTable, ReplayArrays
 
 
 class Viewer:
-    def __init__(self, window_width: int, window_height: int, replay: Replay):
+    def __init__(
+        self,
+        window_width: int,
+        window_height: int,
+        replay: Replay,
+        heatmap: PositionHeatmap | None = None,
+        profiler: FrameProfiler | None = None,
+    ):
         """
         Creating a new replay viewer
 
         :param window_width: width of the viewer window
         :param window_height: height of the viewer window
         :param replay: replay to visualize
+        :param heatmap: optional position heatmap drawn under the track lines
+        :param profiler: optional profiler timing the phases of every frame
         """
         self.window_width: int = window_width
         self.window_height: int = window_height
         self.replay: Replay = replay
+        self.heatmap: PositionHeatmap | None = heatmap
+        self.profiler: FrameProfiler | None = profiler
         if replay.track_path is None:
             raise Exception("Replay does not have a track path")
         self.track_path: str = replay.track_path
@@ -40,8 +54,23 @@ class Viewer:
         self.gates_lines: List[pyglet.shapes.Line] | None = None
         self.finish_line_line: pyglet.shapes.Line | None = None
 
+        self.heatmap_sprite: pyglet.sprite.Sprite | None = None
+
         self.timer_label: Optional[pyglet.text.Label] = None
 
+    def load_heatmap_sprite(self) -> None:
+        """
+        Upload the heatmap as a texture and place it over the area it covers.
+
+        :return: None
+        """
+        if self.heatmap is None:
+            return
+        rgba = self.heatmap.to_rgba()
+        image = pyglet.image.ImageData(self.heatmap.columns, self.heatmap.rows, "RGBA", rgba.tobytes())
+        self.heatmap_sprite = pyglet.sprite.Sprite(image, x=self.heatmap.x_min, y=self.heatmap.y_min)
+        self.heatmap_sprite.scale = self.heatmap.cell_size
+
     def view(self) -> None:
         """
         Show the replay in a pyglet window.
@@ -50,6 +79,7 @@ class Viewer:
         """
         replay_window = pyglet.window.Window(self.window_width, self.window_height)  # type: ignore
 
+        self.load_heatmap_sprite()
         self.track_batch = pyglet.graphics.Batch()
         self.gates_batch = pyglet.graphics.Batch()
         self.finish_line_batch = pyglet.graphics.Batch()
@@ -76,6 +106,7 @@ class Viewer:
             driven=False,
             replay=self.replay,
         )
+        profiler = self.profiler
 
         @replay_window.event
         def on_draw() -> None:
@@ -83,7 +114,10 @@ class Viewer:
             Renders the viewer
             :return: None
             """
+            start = profiler.now() if profiler is not None else 0.0
             replay_window.clear()
+            if self.heatmap_sprite:
+                self.heatmap_sprite.draw()
             if self.track_batch:
                 self.track_batch.draw()
             if self.gates_batch:
@@ -93,6 +127,10 @@ class Viewer:
             car.show()
             if self.timer_label:
                 self.timer_label.draw()
+            if profiler is not None:
+                profiler.lap("render", start)
+                profiler.draw()
+                profiler.end_frame()
 
         def update(dt: float) -> None:
             """
@@ -100,9 +138,129 @@ class Viewer:
             :param dt: delta time
             :return: None
             """
+            start = profiler.now() if profiler is not None else 0.0
             upd = car.update(None, dt)
+            if profiler is not None:
+                start = profiler.lap("playback", start)
             if self.timer_label and upd[1] is not None:
                 self.timer_label.text = f"Time: {upd[1]:.3f}s"
+            if profiler is not None:
+                profiler.lap("labels", start)
+
+        if profiler is not None:
+            profiler.create_overlay()
+        pyglet.clock.schedule_interval(update, 1 / 120)
+        pyglet.app.run()
+        if profiler is not None:
+            profiler.write_log()
+
+
+class GhostViewer:
+    def __init__(self, window_width: int, window_height: int, replays: Sequence[ReplayArrays]):
+        """
+        Creating a viewer that plays many replays of the same track at once
+
+        :param window_width: width of the viewer window
+        :param window_height: height of the viewer window
+        :param replays: replays to visualize, as arrays
+        """
+        if not replays:
+            raise Exception("No replays to show")
+        track_paths = {r.track_path for r in replays}
+        if len(track_paths) != 1 or None in track_paths:
+            raise Exception("Ghost replays must all have the same track path")
+
+        self.window_width: int = window_width
+        self.window_height: int = window_height
+        self.track_path: str = str(replays[0].track_path)
+        self.replays: Sequence[ReplayArrays] = replays
+
+        self.ghosts: GhostTable = GhostTable(replays)
+
+        self.track_batch: Optional[pyglet.graphics.Batch] = None
+        self.gates_batch: Optional[pyglet.graphics.Batch] = None
+        self.finish_line_batch: Optional[pyglet.graphics.Batch] = None
+        self.cars_batch: Optional[pyglet.graphics.Batch] = None
+        self.track_lines: List[pyglet.shapes.Line] | None = None
+        self.gates_lines: List[pyglet.shapes.Line] | None = None
+        self.finish_line_line: pyglet.shapes.Line | None = None
+        self.sprites: List[pyglet.sprite.Sprite] = []
+
+        self.timer_label: Optional[pyglet.text.Label] = None
+        self.current_time: float = 0.0
+
+    def view(self) -> None:
+        """
+        Show the replays in a pyglet window.
+
+        :return: None
+        """
+        replay_window = pyglet.window.Window(self.window_width, self.window_height)  # type: ignore
+
+        self.track_batch = pyglet.graphics.Batch()
+        self.gates_batch = pyglet.graphics.Batch()
+        self.finish_line_batch = pyglet.graphics.Batch()
+        self.cars_batch = pyglet.graphics.Batch()
+
+        self.track_lines = utilities.load_track_lines(self.track_path, self.track_batch)
+        self.gates_lines = utilities.load_gates_lines(self.track_path, self.gates_batch)
+        self.finish_line_line = utilities.load_finish_line_line(self.track_path, self.finish_line_batch)
+
+        self.timer_label = pyglet.text.Label(
+            "Time: 0.0s",
+            font_name=graphics_constants.replay_viewer_font_name,
+            color=graphics_constants.white_color,
+            font_size=graphics_constants.replay_viewer_font_size,
+            x=graphics_constants.replay_viewer_label_x,
+            y=graphics_constants.replay_viewer_label_y,
+        )
+
+        # One texture shared by every ghost, all sprites in the same batch
+        car_image = pyglet.image.load(graphics_constants.car_image_path)
+        car_image.anchor_x = int(car_image.width / 2)
+        car_image.anchor_y = int(car_image.height / 2)
+        self.sprites = [
+            pyglet.sprite.Sprite(car_image, x=float(x), y=float(y), batch=self.cars_batch)
+            for x, y in zip(self.ghosts.x[:, 0], self.ghosts.y[:, 0], strict=True)
+        ]
+        for sprite in self.sprites:
+            sprite.opacity = graphics_constants.ghost_opacity
+
+        @replay_window.event
+        def on_draw() -> None:
+            """
+            Renders the viewer
+            :return: None
+            """
+            replay_window.clear()
+            if self.track_batch:
+                self.track_batch.draw()
+            if self.gates_batch:
+                self.gates_batch.draw()
+            if self.finish_line_batch:
+                self.finish_line_batch.draw()
+            if self.cars_batch:
+                self.cars_batch.draw()
+            if self.timer_label:
+                self.timer_label.draw()
+
+        def update(dt: float) -> None:
+            """
+            Moves every ghost to its current frame and updates the label
+            :param dt: delta time
+            :return: None
+            """
+            self.current_time += dt
+            x, y, heading, alive_array, _ = self.ghosts.poses(self.current_time)
+            xs, ys, rotations, alive = x.tolist(), y.tolist(), (-heading).tolist(), alive_array.tolist()
+            for sprite, x, y, rotation, visible in zip(self.sprites, xs, ys, rotations, alive, strict=True):
+                if sprite.visible != visible:
+                    sprite.visible = visible
+                if visible:
+                    sprite.update(x=x, y=y, rotation=rotation)
+            if self.timer_label:
+                shown = min(self.current_time, self.ghosts.span - 1.0)
+                self.timer_label.text = f"Time: {shown:.3f}s  Cars: {sum(alive)}"
 
         pyglet.clock.schedule_interval(update, 1 / 120)
         pyglet.app.run()